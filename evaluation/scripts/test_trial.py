@@ -0,0 +1,92 @@
+import json
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import trial
+from trial import Trial
+
+
+def add_run(run_dir, finished=True):
+    itr_dir = run_dir.joinpath('itrs', '0')
+    itr_dir.joinpath('feature_space_results').mkdir(parents=True)
+    itr_dir.joinpath('feature_space_results', 'feature_space_results_0.json').write_text(
+        json.dumps({ 'successful' : [ True ], 'l1' : [ 10 ], 'linf' : [ 2 ] }))
+    itr_dir.joinpath('applied_transformers.json').write_text(json.dumps({ 'SynonymTransformer' : 3 }))
+    run_dir.joinpath('config.json').write_text(json.dumps({ 'submission' : 'submissions/2202.09470',
+                                                            'target' : { 'request' : [ 'alice' ], 'reject' : [] } }))
+    run_dir.joinpath('log.txt').write_text('[  0]\n')
+    if finished:
+        finish_run(run_dir)
+
+
+def finish_run(run_dir):
+    run_dir.joinpath('results.json').write_text(json.dumps({ 'successful' : [ True ], 'running_time' : 60, 'l1' : 12,
+                                                             'linf' : 2, 'feature_problem_switch' : 1, 'ranks' : [] }))
+
+
+def age(trial_dir):
+    # mtimes of dirs that are modified later on must differ from the ones in the cache
+    for root, _, _ in os.walk(trial_dir):
+        os.utime(root, ns=(0, 0))
+
+
+class TestTrialCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.trial_dir = Path(self.tmpdir.name) / 'trial'
+        add_run(self.trial_dir / 'a')
+        add_run(self.trial_dir / 'b', finished=False)
+        self.trial_dir.joinpath('pending').mkdir()
+        age(self.trial_dir)
+        self.parsed = []
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def load(self):
+        load_run = trial.load_run
+        def counting_load_run(log_file, only_featurespace):
+            self.parsed.append(log_file.parent.name)
+            return load_run(log_file, only_featurespace)
+        with mock.patch('trial.load_run', counting_load_run):
+            return Trial(self.trial_dir, 'trial')
+
+    def test_cache_hit(self):
+        first = self.load()
+        self.assertEqual(sorted(self.parsed), [ 'a', 'b' ])
+        self.assertEqual(list(first.data.name), [ 'a' ])
+
+        # neither parsed nor walked again
+        self.parsed.clear()
+        with mock.patch('trial.walk_trial', side_effect=AssertionError):
+            second = self.load()
+        self.assertEqual(self.parsed, [])
+        self.assertTrue(first.data.equals(second.data))
+        self.assertEqual(second.config, first.config)
+        self.assertEqual(second.transformers['a'], { 'SynonymTransformer' : 3 })
+
+    def test_cache_invalidation(self):
+        self.load()
+        self.parsed.clear()
+
+        # only the modified run is parsed again
+        finish_run(self.trial_dir / 'b')
+        self.assertEqual(sorted(self.load().data.name), [ 'a', 'b' ])
+        self.assertEqual(self.parsed, [ 'b' ])
+
+    def test_new_run(self):
+        self.load()
+        self.parsed.clear()
+
+        # run in a dir that did not contain any run before
+        add_run(self.trial_dir / 'pending' / 'c')
+        self.assertEqual(sorted(self.load().data.name), [ 'a', 'c' ])
+        self.assertEqual(self.parsed, [ 'c' ])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,10 @@
 import json
+import os
 import re
 import shutil
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import suppress
+from itertools import repeat
 from pathlib import Path
 
 import pandas as pd
@@ -69,9 +73,107 @@ PAPER_LENGTH = {
 
 }
 
+# cache of a trial is stored next to its dir, s.t. writing it does not change the mtime of the trial dir
+CACHE_SUFFIX = '.trial_cache.pkl'
+CACHE_VERSION = 2
+
+# columns of the parsed runs besides the records of Trial.data
+RUN_COLUMNS = [ 'log_file', 'config', 'applied_transformers' ]
+
+
+def _mtime(path):
+    try:
+        return path.stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def walk_trial(trial_dir):
+    # every dir of the trial w/ its mtime, and the log files of the runs
+    dirs, log_files = {}, []
+    for root, _, files in os.walk(trial_dir):
+        dirs[root] = _mtime(Path(root))
+        if 'log.txt' in files:
+            log_files.append(Path(root, 'log.txt'))
+    return dirs, log_files
+
+
+def load_run(log_file, only_featurespace):
+    # parse a single run
+    # => returns None for unfinished or trivial runs
+    
+    # files
+    results_file = log_file.with_name('results.json')
+    config_file = log_file.with_name('config.json')
+    feature_space_results = list(log_file.parent.joinpath('itrs').rglob('feature_space_results*.json'))
+
+    # finished?
+    if (not results_file.is_file() and not only_featurespace) or \
+       (len(feature_space_results) == 0 and only_featurespace):
+        return None
+    
+    try:
+        feature_space_results = sorted(feature_space_results, key=lambda x: int(x.stem.split('_')[-1]))[-1]
+        # load
+        config = json.loads(config_file.read_text())
+        applied_transformers =  None if only_featurespace else json.loads(feature_space_results.parent.with_name('applied_transformers.json').read_text())
+        results = None if only_featurespace else json.loads(results_file.read_text())
+        feature_space_results = json.loads(feature_space_results.read_text())            
+        log = log_file.read_text()
+    except Exception as e:
+        print("[!] Exception occured")
+        import traceback
+        print(traceback.format_exc())
+        return None
+
+    # exclude trivial attacks in stats
+    if len([ r for r in feature_space_results['successful'] if r is not None]) == 0:
+        return None
+
+    try:
+        ranks = list(results['ranks'][0]['request'].values())[0]
+    except:
+        ranks = None
+    
+    r = {
+        'name' : log_file.parent.name,
+        'no_request' : len(config['target']['request']),
+        'no_reject' : len(config['target']['reject']),
+        'running_time' : 0 if only_featurespace else results['running_time'],
+        'p_successful' : 0 if only_featurespace else len([ r for r in results['successful'] if r == True]),
+        'p_failed' : 0 if only_featurespace else len([ r for r in results['successful'] if r == False]), 
+        'p_invalid' : 0 if only_featurespace else len([ r for r in results['successful'] if r is None]),
+        'p_l1' : 0 if only_featurespace else results['l1'],
+        'p_l1_frac' : 0 if only_featurespace else results['l1'] / PAPER_LENGTH[Path(config['submission']).name],
+        'p_linf' : 0 if only_featurespace else results['linf'],
+        'f_no_itr' : len(re.findall(r'\[\s*(\d+)\]', log)),
+        'f_l1' : min(feature_space_results['l1']),
+        'f_linf' : min(feature_space_results['linf']),
+        'f_successful' : len([ r for r in feature_space_results['successful'] if r == True]),
+        'f_failed' : len([ r for r in feature_space_results['successful'] if r == False]), 
+        'f_invalid' : len([ r for r in feature_space_results['successful'] if r is None]),
+        'switches' : 0 if only_featurespace else results['feature_problem_switch'],
+        'ranks' : ranks
+    }
+
+    if not only_featurespace:
+        for victim_idx in range(len(results['successful'])):
+            r[f'p_successful_{victim_idx}'] = results['successful'][victim_idx]
+
+    return r, config, applied_transformers
+
+
+def load_runs(log_files, only_featurespace, workers=None):
+    # runs are independent => parse them in parallel
+    if len(log_files) < 64 or workers == 1:
+        return [ load_run(log_file, only_featurespace) for log_file in log_files ]
+    with ProcessPoolExecutor(workers) as executor:
+        return list(executor.map(load_run, log_files, repeat(only_featurespace), chunksize=16))
+
+
 class Trial:
 
-    def __init__(self, trial_dir=None, label=None, only_featurespace=False):
+    def __init__(self, trial_dir=None, label=None, only_featurespace=False, workers=None, cache=True):
 
         if trial_dir is None:
             return
@@ -86,77 +188,86 @@ class Trial:
         self.export_list = []
         self.failed = []
 
-        for log_file in self.trial_dir.rglob('log.txt'):
-            
-            # files
-            results_file = log_file.with_name('results.json')
-            config_file = log_file.with_name('config.json')
-            feature_space_results = list(log_file.parent.joinpath('itrs').rglob('feature_space_results*.json'))
+        runs = self._load_runs(only_featurespace, workers, cache)
+        for log_file, p_failed, config, applied_transformers in zip(runs.log_file, runs.get('p_failed', []),
+                                                                    runs.config, runs.applied_transformers):
+            log_file = Path(log_file)
+            if p_failed > 0:
+                self.failed += [ log_file.parent ]
 
-            # finished?
-            if (not results_file.is_file() and not only_featurespace) or \
-               (len(feature_space_results) == 0 and only_featurespace):
-                continue
-            
-            try:
-                feature_space_results = sorted(feature_space_results, key=lambda x: int(x.stem.split('_')[-1]))[-1]
-                # load
-                config = json.loads(config_file.read_text())
-                applied_transformers =  None if only_featurespace else json.loads(feature_space_results.parent.with_name('applied_transformers.json').read_text())
-                results = None if only_featurespace else json.loads(results_file.read_text())
-                feature_space_results = json.loads(feature_space_results.read_text())            
-                log = log_file.read_text()
-            except Exception as e:
-                print("[!] Exception occured")
-                import traceback
-                print(traceback.format_exc())
-                continue
+            # keep config
+            self.config[log_file.parent.name] = config
+            self.log[log_file.parent.name] = log_file
+            self.transformers[log_file.parent.name] = applied_transformers
 
-            # exclude trivial attacks in stats
-            if len([ r for r in feature_space_results['successful'] if r is not None]) == 0:
-                continue
+        self.data = runs.drop(columns=RUN_COLUMNS).reset_index(drop=True)
 
-            try:
-                ranks = list(results['ranks'][0]['request'].values())[0]
-            except:
-                ranks = None
-            
-            r = {
-                'name' : log_file.parent.name,
-                'no_request' : len(config['target']['request']),
-                'no_reject' : len(config['target']['reject']),
-                'running_time' : 0 if only_featurespace else results['running_time'],
-                'p_successful' : 0 if only_featurespace else len([ r for r in results['successful'] if r == True]),
-                'p_failed' : 0 if only_featurespace else len([ r for r in results['successful'] if r == False]), 
-                'p_invalid' : 0 if only_featurespace else len([ r for r in results['successful'] if r is None]),
-                'p_l1' : 0 if only_featurespace else results['l1'],
-                'p_l1_frac' : 0 if only_featurespace else results['l1'] / PAPER_LENGTH[Path(config['submission']).name],
-                'p_linf' : 0 if only_featurespace else results['linf'],
-                'f_no_itr' : len(re.findall(r'\[\s*(\d+)\]', log)),
-                'f_l1' : min(feature_space_results['l1']),
-                'f_linf' : min(feature_space_results['linf']),
-                'f_successful' : len([ r for r in feature_space_results['successful'] if r == True]),
-                'f_failed' : len([ r for r in feature_space_results['successful'] if r == False]), 
-                'f_invalid' : len([ r for r in feature_space_results['successful'] if r is None]),
-                'switches' : 0 if only_featurespace else results['feature_problem_switch'],
-                'ranks' : ranks
-            }
+    def _load_runs(self, only_featurespace, workers, cache):
+        # Parsed runs are cached as a DataFrame (one row per run) in .<trial_name>.trial_cache.pkl.
+        # The mtimes of all dirs of the trial are kept along w/ it, s.t. loading an unchanged trial
+        # is a single read plus a stat per dir. Otherwise, the trial is walked again and only runs
+        # w/ a changed (or new) dir are parsed again. Files are only added to the dirs of a run
+        # (the attack does not rewrite them), i.e., the mtimes of the dirs cover all changes.
+        cache_file = self.trial_dir.with_name(f'.{self.trial_dir.name}{CACHE_SUFFIX}')
+        cached = None
+        if cache and cache_file.is_file():
+            with suppress(Exception):
+                cached = pd.read_pickle(cache_file)
+            if cached is not None and (cached.attrs.get('version') != CACHE_VERSION or
+                                       cached.attrs.get('only_featurespace') != only_featurespace):
+                cached = None
 
-            if not only_featurespace:
-                for victim_idx in range(len(results['successful'])):
-                    r[f'p_successful_{victim_idx}'] = results['successful'][victim_idx]
+        # unchanged trial
+        if cached is not None and all([ _mtime(Path(d)) == mtime for d, mtime in cached.attrs['dirs'].items() ]):
+            return cached
 
-            self.data += [r] 
+        dirs, log_files = walk_trial(self.trial_dir)
+        cached_dirs = {} if cached is None else cached.attrs['dirs']
+        cached_runs = set() if cached is None else set(cached.log_file) | set(cached.attrs['unfinished'])
 
-            if r['p_failed'] > 0:
-                self.failed += [ log_file.parent ]
+        # runs w/ a changed dir (i.e., the dir of the run or one below it) or new runs
+        run_dirs = { log_file.parent for log_file in log_files }
+        outdated_dirs = set()
+        for d, mtime in dirs.items():
+            if cached_dirs.get(d) == mtime:
+                continue
+            for run_dir in [ Path(d) ] + list(Path(d).parents):
+                if run_dir in run_dirs:
+                    outdated_dirs.add(run_dir)
+                    break
+                if run_dir == self.trial_dir:
+                    break
+        outdated = [ log_file for log_file in log_files
+                     if log_file.parent in outdated_dirs or log_file.as_posix() not in cached_runs ]
 
-            # keep config
-            self.config[log_file.parent.name] = config
-            self.log[log_file.parent.name] = log_file
-            self.transformers[log_file.parent.name] = applied_transformers
+        # parse new or modified runs
+        rows, unfinished = [], []
+        for log_file, run in zip(outdated, load_runs(outdated, only_featurespace, workers)):
+            if run is None:
+                unfinished.append(log_file.as_posix())
+                continue
+            r, config, applied_transformers = run
+            rows.append(dict(log_file=log_file.as_posix(), **r, config=config, applied_transformers=applied_transformers))
+        outdated = { log_file.as_posix() for log_file in outdated }
+        unfinished += [ log_file for log_file in ([] if cached is None else cached.attrs['unfinished'])
+                        if log_file not in outdated and Path(log_file).parent in run_dirs ]
+
+        # keep the order of the walk
+        frames = [ frame for frame in [ pd.DataFrame(rows) ] if len(frame) > 0 ]
+        if cached is not None:
+            kept = cached[~cached.log_file.isin(outdated) & cached.log_file.isin([ f.as_posix() for f in log_files ])]
+            frames = ([ kept ] if len(kept) > 0 else []) + frames
+        runs = pd.concat(frames, ignore_index=True) if len(frames) > 0 else pd.DataFrame(columns=RUN_COLUMNS)
+        order = { log_file.as_posix() : idx for idx, log_file in enumerate(log_files) }
+        runs = runs.iloc[runs.log_file.map(order).argsort(kind='stable')].reset_index(drop=True)
+        runs.attrs = { 'version' : CACHE_VERSION, 'only_featurespace' : only_featurespace, 'dirs' : dirs, 'unfinished' : unfinished }
+
+        if cache:
+            tmp_file = cache_file.with_name(f'{cache_file.name}.{os.getpid()}')
+            runs.to_pickle(tmp_file)
+            tmp_file.replace(cache_file)
 
-        self.data = pd.DataFrame(self.data)
+        return runs
 
     @property
     def is_empty(self):
@@ -11,19 +11,23 @@ import json
 import logging
 import random
 import shutil
+import tempfile
 import time
 import typing
 from copy import deepcopy
 from collections import Counter
-from concurrent.futures import ProcessPoolExecutor, as_completed
-from contextlib import suppress
+from concurrent.futures import (FIRST_COMPLETED, ProcessPoolExecutor,
+                                ThreadPoolExecutor, wait)
+from contextlib import contextmanager, nullcontext, suppress
+from logging.handlers import QueueHandler, QueueListener
+from multiprocessing import Manager
 from pathlib import Path
+from queue import Queue
 
 import numpy as np
 import pydng
 from tqdm import tqdm
 
-from autobid import AutoBid
 from featurespace.attack import featurespace_attack
 from problemspace.attackstrategy.Budgeting.ProblemSpaceCostBudgetManager import (
     CostBudget, ProblemSpaceCostBudgetManager)
@@ -31,14 +35,30 @@ from problemspace.attackstrategy.Budgeting.ProblemSpaceEqualBudgetManager import
     ProblemSpaceEqualBudgetManager
 from problemspace.attackstrategy.problemspace_attack import problemspace_attack
 from problemspace.attackstrategy.RequestedChanges import RequestedChanges
+from problemspace.CompileCache import CompileCache
+from problemspace.CompileService import (PRIORITY_FINAL, CompileClient,
+                                         CompileService)
+from problemspace.PdfLatexSettings import PdfLatexSettings
 from problemspace.PdfLatexSource import PdfLatexSource
 from problemspace.transformers.TransformationState import TransformationState
+from utils.model_manager import set_memory_budget
+from utils.model_registry import get_model, init_worker
 from utils.pdf_utils import analyze_words
+from utils.results_store import (RESULTS_DB, RecordBuffer, ResultsWriter,
+                                 config_hash, emit, set_sink, success_counts)
+from utils.scheduling import CostModel, observed_running_time, target_features
+from utils.workqueue import WorkQueue
 from utils.utils import (check_if_attack_is_successful,
                          compute_missing_changes, target_as_str)
 
 
-def log_ranking(logger, ranking, target):
+def log_ranking(logger, title, model, thingy, target):
+    # diagnostics only
+    # => skip the extra inference if not logged
+    if not logger.isEnabledFor(logging.DEBUG):
+        return
+    logger.debug(title)
+    ranking: typing.List[str, float] = model.get_ranking(thingy)
     for idx, (reviewer_name, score) in enumerate(ranking[:10]):
         if reviewer_name in target['request']:
             status = "^"
@@ -47,21 +67,31 @@ def log_ranking(logger, ranking, target):
         else:
             status = ""
         if idx == 5:
-            logger.info(f'      ---')
-        logger.info(f'    {idx + 1:>2} {reviewer_name.upper().replace("_", " "):<20}: {score:.2f} {status}')
+            logger.debug(f'      ---')
+        logger.debug(f'    {idx + 1:>2} {reviewer_name.upper().replace("_", " "):<20}: {score:.2f} {status}')
 
 
-def single_feature_problem_space_iteration(iterationindex, adv_transfstate, logger, working_dir, victim_models, surrogate_models, 
-                                           target, features_input, featurespace_config, problemspace_config,
-                                           problemspacebudgetmanager, features_to_be_blocked, features_clean, clean_pdf_path) \
-        -> typing.Tuple[int, typing.Optional[TransformationState], typing.List[str]]:
+def rebase_requested_changes(requested_changes, features_from, features_to) -> typing.Dict[str, int]:
+    # requested changes are relative to features_from
+    # => express them relative to features_to (e.g., the features actually realized in the problem space)
+    features_requested = Counter(features_from)
+    for word, cnt in requested_changes.items():
+        features_requested[word] = max(features_requested[word] + cnt, 0)
+    features_requested.subtract(Counter(features_to))
+    return { word : cnt for word, cnt in features_requested.items() if cnt != 0 }
+
+
+def feature_space_iteration(iterationindex, logger, working_dir, victim_models, surrogate_models, target, features_input, 
+                            featurespace_config, features_to_be_blocked, features_clean, clean_pdf_path) \
+        -> typing.Tuple[typing.Dict[str, list], typing.Dict[str, int], typing.List[str]]:
+    iteration_start: float = time.time()
     iterationcomment: str = "" if iterationindex == 0 else f" (Iteration: {iterationindex})"
     feature_space_results_dir: Path = working_dir / "feature_space_results"
     feature_space_results_dir.mkdir(exist_ok=True, parents=True)
 
     # D. Feature-space attack
     logger.info(f"\n[+] Start attack in feature-space{iterationcomment}")
-    logger.info(f"\n[+] Blocked features: {features_to_be_blocked}")
+    logger.debug("\n[+] Blocked features: %s", features_to_be_blocked)
 
     feature_space_results: typing.Dict[str, list] = featurespace_attack(working_dir, logger, victim_models, surrogate_models, target, 
                                                                         features_input, features_clean, features_to_be_blocked, 
@@ -81,9 +111,7 @@ def single_feature_problem_space_iteration(iterationindex, adv_transfstate, logg
             features_adv[word] = 0
     features_adv = [ word for word, cnt in features_adv.items() for _ in range(cnt) ]
 
-    logger.info(f"\n[+] Ranking")
-    ranking: typing.List[str, float] = victim_models[0].get_ranking(features_adv)
-    log_ranking(logger, ranking, target)
+    log_ranking(logger, "\n[+] Ranking", victim_models[0], features_adv, target)
 
     # check 
     results = check_if_attack_is_successful(clean=clean_pdf_path,
@@ -100,8 +128,21 @@ def single_feature_problem_space_iteration(iterationindex, adv_transfstate, logg
     logger.info(f"\n[+] Finished attack in feature-space{iterationcomment}")
     logger.info(f'    -> Success {success}\n    -> Failed {failed}\n    -> Invalid {invalid}')
 
-    if featurespace_config['only_feature_space']:
-        return -1, None, []
+    emit('iterations', dict(success_counts(results), itr=iterationindex, stage='feature_space', ranks=results['ranks'],
+                            loss=float(feature_space_results['loss'][idx]), l1=int(feature_space_results['l1'][idx]),
+                            linf=int(feature_space_results['linf'][idx]),
+                            words_modified=sum([ abs(cnt) for cnt in requested_changes_best.values() ]),
+                            running_time=time.time() - iteration_start))
+
+    return feature_space_results, requested_changes_best, features_adv
+
+
+def problem_space_iteration(iterationindex, adv_transfstate, logger, working_dir, victim_models, surrogate_models, target,
+                            features_input, feature_space_results, requested_changes_best, problemspace_config,
+                            problemspacebudgetmanager, clean_pdf_path) \
+        -> typing.Tuple[int, TransformationState, typing.List[str], typing.List[str]]:
+    iteration_start: float = time.time()
+    iterationcomment: str = "" if iterationindex == 0 else f" (Iteration: {iterationindex})"
 
     # E. Problem-space attack
     logger.info(f"\n[+] Start attack in problem-space{iterationcomment}")
@@ -128,7 +169,7 @@ def single_feature_problem_space_iteration(iterationindex, adv_transfstate, logg
     #     targetdir=working_dir / "adversarial_latex" / ("iteration_" + str(iterationindex)))
 
     # F. Test adversarial pdf
-    features_adv: list = analyze_words(adv_pdf_path)
+    features_adv: list = adv_transfstate.get_words()
     logger.info("\n[+] Modifed words")
     added_words: Counter = Counter(features_adv) - Counter(features_input)
     added_words = sorted(added_words.items(), key=lambda x: x[1])
@@ -136,7 +177,7 @@ def single_feature_problem_space_iteration(iterationindex, adv_transfstate, logg
     deleted_words = sorted(deleted_words.items(), key=lambda x: x[1])
 
     logger.info("\n[+] Problem Space Restrictions: Feature Blocking")
-    logger.info(f"\n[+] Blocked: {adv_transfstate.probspacerestrictions}")
+    logger.debug("\n[+] Blocked: %s", adv_transfstate.probspacerestrictions)
 
     # check if we could realize all requested changes
     logger.info("\n[+] Missing changes")
@@ -147,32 +188,156 @@ def single_feature_problem_space_iteration(iterationindex, adv_transfstate, logg
     missing_changes = missing_changes_addition + missing_changes_deletion
 
     # get ranking, check if attack is successful for surrogates
-    logger.info("\n[+] Ranking")
     results = check_if_attack_is_successful(clean=clean_pdf_path,
                                             adv=adv_pdf_path,
                                             target=target,
                                             models=surrogate_models)
     successful = len([ res for res in results['successful'] if res is not None]) == 0 or \
                  all([ res for res in results['successful'] if res is not None])
-    ranking: typing.List[str, float] = victim_models[0].get_ranking(adv_pdf_path)
-    log_ranking(logger, ranking, target)
+    log_ranking(logger, "\n[+] Ranking", victim_models[0], adv_pdf_path, target)
     logger.info(f"\n[+] Evaluation on surrogates: {'Success' if successful else 'Failed'}")
 
-    return int(successful), adv_transfstate, sorted(list(adv_transfstate.probspacerestrictions))
+    modified_words = Counter(dict(added_words)) + Counter(dict(deleted_words))
+    emit('iterations', dict(success_counts(results), itr=iterationindex, stage='problem_space', ranks=results['ranks'],
+                            l1=sum(modified_words.values()), linf=max(list(modified_words.values()) + [0]),
+                            words_modified=len(modified_words), missing_changes=len(missing_changes),
+                            running_time=time.time() - iteration_start,
+                            transformers=Counter(adv_transfstate.applied_transformers)))
+
+    return int(successful), adv_transfstate, missing_changes, features_adv
+
+
+def single_feature_problem_space_iteration(iterationindex, adv_transfstate, logger, working_dir, victim_models, surrogate_models, 
+                                           target, features_input, featurespace_config, problemspace_config,
+                                           problemspacebudgetmanager, features_to_be_blocked, features_clean, clean_pdf_path) \
+        -> typing.Tuple[int, typing.Optional[TransformationState], typing.List[str]]:
+
+    feature_space_results, requested_changes_best, _ = feature_space_iteration(
+        iterationindex=iterationindex, logger=logger, working_dir=working_dir, victim_models=victim_models,
+        surrogate_models=surrogate_models, target=target, features_input=features_input,
+        featurespace_config=featurespace_config, features_to_be_blocked=features_to_be_blocked,
+        features_clean=features_clean, clean_pdf_path=clean_pdf_path)
+
+    if featurespace_config['only_feature_space']:
+        return -1, None, []
+
+    is_successful, adv_transfstate, missing_changes, _ = problem_space_iteration(
+        iterationindex=iterationindex, adv_transfstate=adv_transfstate, logger=logger, working_dir=working_dir,
+        victim_models=victim_models, surrogate_models=surrogate_models, target=target, features_input=features_input,
+        feature_space_results=feature_space_results, requested_changes_best=requested_changes_best,
+        problemspace_config=problemspace_config, problemspacebudgetmanager=problemspacebudgetmanager,
+        clean_pdf_path=clean_pdf_path)
+
+    return is_successful, adv_transfstate, sorted(list(adv_transfstate.probspacerestrictions))
+
+
+def pipelined_feature_problem_space_iterations(adv_transfstate, logger, working_dir, victim_models, surrogate_models,
+                                               target, features_input, featurespace_config, problemspace_config,
+                                               problemspacebudgetmanager, features_to_be_blocked, features_clean, clean_pdf_path) \
+        -> typing.Tuple[int, int, TransformationState]:
+    # The problem-space attack of iteration i runs in a separate worker while the 
+    # feature-space attack of iteration i+1 already continues from the requested 
+    # (i.e., not yet realized) features. Once the problem-space attack finishes,
+    # the requested changes of the next iteration are rebased on the realized features.
+    # The worker is a thread: the problem-space attack mostly waits for pdflatex and
+    # shares the (large) models with the feature-space attack.
+    # Problem-space restrictions are blocked one iteration later than in the sequential mode:
+    # the restrictions of iteration i are only collected once the feature-space attack of
+    # iteration i+1 has finished, i.e., they are blocked from iteration i+2 on.
+    features_realized: typing.List[str] = features_input
+    features_requested: typing.List[str] = features_input
+    problem_space_job = None
+    is_successful: int = 0
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        for ix in range(problemspace_config['feature_problem_switch'] + 1):
+            # feature space: runs in parallel to the problem space of the previous iteration
+            if ix < problemspace_config['feature_problem_switch']:
+                logger.info(f"\n\n{'#' * 3} ITERATION {ix:>3} {'#' * 70}\n")
+                working_dir_itr = working_dir.joinpath('itrs', f'{ix}')
+                working_dir_itr.mkdir(parents=True)
+                feature_space_results, requested_changes_best, features_adv = feature_space_iteration(
+                    iterationindex=ix, logger=logger, working_dir=working_dir_itr, victim_models=victim_models,
+                    surrogate_models=surrogate_models, target=target, features_input=features_requested,
+                    featurespace_config=featurespace_config, features_to_be_blocked=features_to_be_blocked,
+                    features_clean=features_clean, clean_pdf_path=clean_pdf_path)
+
+            # problem space of the previous iteration
+            if problem_space_job is not None:
+                is_successful, adv_transfstate, _, features_realized = problem_space_job.result()
+                if is_successful == 1:
+                    # problem-space is successful, speculative feature-space results are obsolete
+                    if ix < problemspace_config['feature_problem_switch']:
+                        logger.info(f"\n[+] Discard feature-space results of iteration {ix}")
+                        shutil.rmtree(working_dir_itr)
+                    return is_successful, ix - 1, adv_transfstate
+                # feed problem-space restrictions back (on this thread, the feature-space attack reads the list)
+                # => the feature-space attack of the next iteration blocks them
+                if problemspace_config['problem_space_block_features'] is True:
+                    for word in sorted(adv_transfstate.probspacerestrictions):
+                        if word not in features_to_be_blocked:
+                            features_to_be_blocked.append(word)
+                logger.debug("\n[+] Blocked features: %s", features_to_be_blocked)
+
+            if ix == problemspace_config['feature_problem_switch']:
+                break
 
-def attack(working_dir, victim_model_dirs, surrogate_model_dirs, submission, target_config, featurespace_config, problemspace_config):
+            # problem space: rebase requested changes on the realized features
+            # => the feature-space attack started from the requested features of the previous iteration
+            feature_space_results = deepcopy(feature_space_results)
+            feature_space_results['words_cnt'] = [ rebase_requested_changes(words_cnt, features_requested, features_realized)
+                                                   for words_cnt in feature_space_results['words_cnt'] ]
+            requested_changes_best = rebase_requested_changes(requested_changes_best, features_requested, features_realized)
+
+            # Just update current iteration in transformation state to save debugging information
+            adv_transfstate.history_group = str(ix)
+            logger.info(f"\n[+] Schedule attack in problem-space (Iteration: {ix})")
+            problem_space_job = executor.submit(problem_space_iteration,
+                iterationindex=ix, adv_transfstate=adv_transfstate, logger=logger, working_dir=working_dir_itr,
+                victim_models=victim_models, surrogate_models=surrogate_models, target=target, 
+                features_input=features_realized, feature_space_results=feature_space_results, 
+                requested_changes_best=requested_changes_best, problemspace_config=problemspace_config,
+                problemspacebudgetmanager=problemspacebudgetmanager, clean_pdf_path=clean_pdf_path)
+            features_requested = features_adv
+
+    return is_successful, problemspace_config['feature_problem_switch'], adv_transfstate
+
+
+def reset_attack(logger, working_dir, problemspace_config) -> bool:
+    # reached maximal number of iterations, but attack was not successful
+    # => try again
+    logger.info(f"\n[+] Reset to initial state (not successful)")
+    # reset working dir
+    reset_dir = working_dir.joinpath('reset', 'not_successful')
+    reset_dir.mkdir(exist_ok=True, parents=True)
+    reset_ctr = len(list(reset_dir.glob('*')))
+    logger.info(f"    -> reset no {reset_ctr}")
+    if reset_ctr >= problemspace_config['repeat']:
+        return False
+    backup_dir = working_dir.joinpath('itrs').rename(reset_dir.joinpath(f'{reset_ctr}'))
+    logger.info(f"    -> save state @ {backup_dir}")
+    return True
+
+def attack(working_dir, victim_model_dirs, surrogate_model_dirs, submission, target_config, featurespace_config, problemspace_config,
+           results_queue=None, log_level='INFO', compile_service=None, attempt=0):
+    log_listener = None
     try:
         attack_start: float = time.time()
 
         # A. Setup logging
+        # => records are written to the log file by a listener thread, s.t. the attack does not block on I/O
+        # => records below the log level are neither formatted nor written
         working_dir.mkdir(exist_ok=True, parents=True)
         log_file: Path = working_dir / f'log.txt'
         if log_file.is_file(): log_file.unlink()
         logger: logging.Logger = logging.getLogger(working_dir.name)
         file_handler = logging.FileHandler(log_file.as_posix())
         file_handler.setFormatter(None)
-        logger.setLevel(logging.DEBUG)
-        logger.addHandler(file_handler)
+        log_queue = Queue()
+        log_listener = QueueListener(log_queue, file_handler)
+        log_listener.start()
+        logger.setLevel(log_level)
+        logger.addHandler(QueueHandler(log_queue))
         logger.info(f"\n[+] Working dir @ {working_dir}")
 
         # B. Init AutoBid
@@ -188,26 +353,41 @@ def attack(working_dir, victim_model_dirs, surrogate_model_dirs, submission, tar
         
         target = target_config['target_reviewer']
 
-        victim_models = [ AutoBid(model_dir, lazy=True if idx != 0 else False) for idx, model_dir in enumerate(victim_model_dirs) ]
+        # records for the results store of the trial
+        set_sink(results_queue, working_dir.name, attempt)
+
+        # models are cached per process and reused across targets
+        victim_models = [ get_model(model_dir, lazy=True if idx != 0 else False) for idx, model_dir in enumerate(victim_model_dirs) ]
         logger.info('\n[+] Victim models')
         for victim_model in victim_models:
             logger.info(f'    {victim_model.model_dir}')
 
-        surrogate_models = [ AutoBid(model_dir) for model_dir in surrogate_model_dirs ]
+        surrogate_models = [ get_model(model_dir) for model_dir in surrogate_model_dirs ]
         logger.info('\n[+] Surrogate models')
         for surrogate_model in surrogate_models:
             logger.info(f'    {surrogate_model.model_dir}')
 
         # C. Prepare target submission
+        # settings are passed on to all copies of the submission
+        compile_cache = None
+        if problemspace_config['compile_cache'] is not None:
+            compile_cache = CompileCache(Path(problemspace_config['compile_cache']), problemspace_config['compile_cache_size'])
+        scratch_dir = Path(problemspace_config['scratch_dir']) if problemspace_config['scratch_dir'] is not None else None
+        pdflatexsettings = PdfLatexSettings(preamble_format=problemspace_config['preamble_format'],
+                                            compile_cache=compile_cache,
+                                            scratch_dir=scratch_dir,
+                                            scratch_min_free_mb=problemspace_config['scratch_min_free'],
+                                            compile_service=compile_service)
         original_pdflatexsource: PdfLatexSource = PdfLatexSource(latexsourcedir=submission,
-                                                                 latexmainfilename="main.tex")
+                                                                 latexmainfilename="main.tex",
+                                                                 pdflatexsettings=pdflatexsettings)
 
         # copy original project, as we will change the latex source
         pdflatexsource: PdfLatexSource = original_pdflatexsource.copyto()
         del original_pdflatexsource  # just to ensure we do not mess up with original files somehow
 
         # compile and save pdf
-        pdflatexsource.runpdflatex()
+        pdflatexsource.runpdflatex(priority=PRIORITY_FINAL)
         pdf_clean: Path = working_dir.joinpath('clean.pdf')
         shutil.copyfile(pdflatexsource.get_maindocument_pdf_path(), pdf_clean)
 
@@ -217,11 +397,9 @@ def attack(working_dir, victim_model_dirs, surrogate_model_dirs, submission, tar
         logger.info(f"    {'Features':<15}: {len(features_clean)}")
 
         # log targets
-        ranking: typing.List[str, float] = victim_models[0].get_ranking(pdf_clean)
         logger.info(f"    {'Requested':<15}: {' '.join(target['request'])}")
         logger.info(f"    {'Rejected':<15}: {' '.join(target['reject'])}")
-        logger.info(f"\n[+] Initial Ranking")
-        log_ranking(logger, ranking, target)
+        log_ranking(logger, "\n[+] Initial Ranking", victim_models[0], pdf_clean, target)
 
         # log config
         working_dir.joinpath('config.json').write_text(json.dumps({'submission': submission.as_posix(),
@@ -261,12 +439,36 @@ def attack(working_dir, victim_model_dirs, surrogate_model_dirs, submission, tar
             feature_problem_switch=problemspace_config['feature_problem_switch'],
         )
 
+        # record of the target for the results store
+        target_record = dict(config_hash=config_hash(featurespace_config, problemspace_config),
+                             submission=submission.name, request=target['request'], reject=target['reject'],
+                             victim_models=[ m.name for m in victim_model_dirs ],
+                             surrogate_models=[ m.name for m in surrogate_model_dirs ])
+
         # Now perform attack
         # Feature Blocking
         features_to_be_blocked: typing.List[str] = []
 
         ix: int = 0
-        while ix < problemspace_config['feature_problem_switch']:
+        while ix < problemspace_config['feature_problem_switch'] and problemspace_config['pipeline'] \
+                and not featurespace_config['only_feature_space']:
+            # overlap feature-space and problem-space attack
+            is_successful, ix, adv_transfstate = pipelined_feature_problem_space_iterations(
+                adv_transfstate=adv_transfstate, logger=logger, working_dir=working_dir, victim_models=victim_models, 
+                surrogate_models=surrogate_models, target=target, features_input=adv_features, 
+                featurespace_config=featurespace_config, problemspace_config=problemspace_config, 
+                problemspacebudgetmanager=problemspacebudgetmanager, features_to_be_blocked=features_to_be_blocked, 
+                features_clean=features_clean, clean_pdf_path=pdf_clean
+            )
+            if is_successful == 1 or not reset_attack(logger, working_dir, problemspace_config):
+                break
+            # reset transformation state
+            adv_transfstate = base_transfstate.copyto() 
+            adv_features = copy.deepcopy(features_clean)
+            ix = 0
+
+        while ix < problemspace_config['feature_problem_switch'] and \
+                (not problemspace_config['pipeline'] or featurespace_config['only_feature_space']):
             logger.info(f"\n\n{'#' * 3} ITERATION {ix:>3} {'#' * 70}\n")
 
             working_dir_itr = working_dir.joinpath('itrs', f'{ix}')
@@ -280,8 +482,19 @@ def attack(working_dir, victim_model_dirs, surrogate_model_dirs, submission, tar
                 features_clean=features_clean, features_to_be_blocked=features_to_be_blocked, clean_pdf_path=pdf_clean
             )
             if is_successful == -1:  # only-feature-space
+                # results of the picked feature vector (cf. feature_space_iteration)
+                feature_space_results = json.loads(working_dir_itr.joinpath(
+                    'feature_space_results', f'feature_space_results_{ix}.json').read_text())
+                idx = int(np.argmin(feature_space_results['loss']))
+                requested_changes_best = feature_space_results['words_cnt'][idx]
+                emit('targets', dict(success_counts(feature_space_results), **target_record,
+                                     ranks=feature_space_results['ranks'], l1=int(feature_space_results['l1'][idx]),
+                                     linf=int(feature_space_results['linf'][idx]),
+                                     words_added=sum([ cnt for cnt in requested_changes_best.values() if cnt > 0 ]),
+                                     words_deleted=-sum([ cnt for cnt in requested_changes_best.values() if cnt < 0 ]),
+                                     iterations=ix+1, running_time=round(time.time() - attack_start)))
                 return
-            adv_features: list = analyze_words(adv_transfstate.pdflatexsource.get_maindocument_pdf_path())
+            adv_features: list = adv_transfstate.get_words()
             if is_successful == 1:  # problem-space is successful, no further iterations necessary
                 break
 
@@ -300,18 +513,8 @@ def attack(working_dir, victim_model_dirs, surrogate_model_dirs, submission, tar
 
             # Reset: not successful
             if ix == problemspace_config['feature_problem_switch'] and not is_successful:
-                # reached muxed number of iterations, but attack was not successful
-                # => try again
-                logger.info(f"\n[+] Reset to initial state (not successful)")
-                # reset working dir
-                reset_dir = working_dir.joinpath('reset', 'not_successful')
-                reset_dir.mkdir(exist_ok=True, parents=True)
-                reset_ctr = len(list(reset_dir.glob('*')))
-                logger.info(f"    -> reset no {reset_ctr}")
-                if reset_ctr >= problemspace_config['repeat']:
+                if not reset_attack(logger, working_dir, problemspace_config):
                     break
-                backup_dir = working_dir.joinpath('itrs').rename(reset_dir.joinpath(f'{reset_ctr}'))
-                logger.info(f"    -> save state @ {backup_dir}")
                 # reset transformation state
                 adv_transfstate = base_transfstate.copyto() 
                 adv_features = copy.deepcopy(features_clean)
@@ -337,13 +540,11 @@ def attack(working_dir, victim_model_dirs, surrogate_model_dirs, submission, tar
         logger.info(f"    L_inf: {linf}")
 
         # get ranking, check if successful
-        logger.info("\n[+] Final Ranking")
         results = check_if_attack_is_successful(clean=working_dir.joinpath('clean.pdf'),
                                                 adv=working_dir.joinpath('adversarial.pdf'),
                                                 target=target,
                                                 models=victim_models)
-        ranking: typing.List[str, float] = victim_models[0].get_ranking(adv_pdf_path)
-        log_ranking(logger, ranking, target)
+        log_ranking(logger, "\n[+] Final Ranking", victim_models[0], adv_pdf_path, target)
         logger.info(f"\n[+] Final Evaluation")
         success = len([ r for r in results['successful'] if r == True ])
         failed = len([ r for r in results['successful'] if r == False ])
@@ -353,6 +554,8 @@ def attack(working_dir, victim_model_dirs, surrogate_model_dirs, submission, tar
         # running time
         running_time: int = round(time.time() - attack_start)
         logger.info(f"\n[+] Running time {running_time // 3600}h {(running_time % 3600) // 60}m {(running_time % 60)}s")
+        if compile_cache is not None:
+            logger.info(f"    Compile cache: {compile_cache.stats['hits']} hits, {compile_cache.stats['misses']} misses")
 
         # dump results
         results['feature_problem_switch'] = ix+1
@@ -361,14 +564,35 @@ def attack(working_dir, victim_model_dirs, surrogate_model_dirs, submission, tar
         results['running_time'] = running_time
         working_dir.joinpath('results.json').write_text(json.dumps(results, indent=4))
 
+        emit('targets', dict(success_counts(results), **target_record, ranks=results['ranks'], l1=l1, linf=linf,
+                             words_added=sum(added_words.values()), words_deleted=sum(deleted_words.values()), iterations=ix+1, running_time=running_time,
+                             transformers=Counter(adv_transfstate.applied_transformers)))
+
     except Exception as e:
         print(f"[!] Exception occured")
         print(f"    {working_dir}")
         import traceback
         print(traceback.format_exc())
 
+    finally:
+        # workers are long-lived
+        # => flush and release the log file of the target
+        logger = logging.getLogger(working_dir.name)
+        for handler in list(logger.handlers):
+            logger.removeHandler(handler)
+            handler.close()
+        if log_listener is not None:
+            log_listener.stop()
+            for handler in log_listener.handlers:
+                handler.close()
+
+
+SCHEDULER_OBSERVATIONS = 'scheduler_observations.jsonl'
+
+
 def main(trial_name, trials_dir, models_dir, submissions_dir, workers, targets_file,
-         featurespace_config, problemspace_config):
+         featurespace_config, problemspace_config, schedule='shuffle', queue=None, model_memory=None,
+         log_level='INFO', compile_workers=None):
 
     # parse arguments
     print("[+] Parsed arguments")
@@ -379,6 +603,11 @@ def main(trial_name, trials_dir, models_dir, submissions_dir, workers, targets_f
     print(f'    - {"workers":<25}: {workers}')    
     print(f'    - {"targets_file":<25}: {targets_file}')
     print(f'    - {"workers":<25}: {workers}')
+    print(f'    - {"schedule":<25}: {schedule}')
+    print(f'    - {"queue":<25}: {queue}')
+    print(f'    - {"model_memory":<25}: {model_memory}')
+    print(f'    - {"log_level":<25}: {log_level}')
+    print(f'    - {"compile_workers":<25}: {compile_workers}')
     print(f'    - {"featurespace_config":<25}')
     for name, value in featurespace_config.items():
         print(f'      - {name:<25}: {value}')
@@ -391,6 +620,14 @@ def main(trial_name, trials_dir, models_dir, submissions_dir, workers, targets_f
     with suppress(OSError):
         os.setsid()
 
+    # work-queue mode
+    # => trial dir is shared by all runners of the campaign
+    if queue is not None:
+        with compile_service(compile_workers) as compile_client:
+            run_queue(queue, trial_name, trials_dir, models_dir, submissions_dir, workers, targets_file, schedule,
+                      featurespace_config, problemspace_config, model_memory, log_level, compile_client)
+        return
+
     # overwrite trial dir, if neccessary
     trial_dir = trials_dir / trial_name
     if trial_dir.is_dir():
@@ -406,47 +643,246 @@ def main(trial_name, trials_dir, models_dir, submissions_dir, workers, targets_f
     random.seed(2023)
     random.shuffle(targets)
 
+    jobs = []
+    for target_config in targets:
+        job = create_job(target_config, trial_dir, models_dir, submissions_dir)
+        # working dir
+        job[0].mkdir(exist_ok=False, parents=True)
+        jobs += [ job ]
+
+    # memory budget for models of this process (workers are configured by their initializer)
+    set_memory_budget(model_memory)
+
+    # cost-aware scheduling
+    # => longest targets first, s.t. no long target is started last while all other workers idle
+    # => observations of completed targets are shared across trials
+    cost_model, costs = None, None
+    if schedule == 'cost':
+        cost_model = CostModel(trials_dir.joinpath(SCHEDULER_OBSERVATIONS))
+        costs = estimate_costs(jobs, cost_model, featurespace_config, problemspace_config)
+        jobs = sorted(jobs, key=lambda job: costs[job[0]][1], reverse=True)
+        print(f"[+] Estimated costs ({len(cost_model.observations)} observations)")
+        for job in jobs:
+            print(f"    {job[0].name:<60}: {costs[job[0]][1]:>10.1f}s")
+
     if workers == 1:
         logging.basicConfig(format='%(message)s', level=logging.INFO)
         logging.getLogger("utils.lda").setLevel(logging.WARNING)
         logging.getLogger("gensim").setLevel(logging.WARNING)
 
         # sequentially run attack for all targets
-        for target_config in targets:
-            # working dir
-            working_dir = trial_dir / target_as_str(target_config)
-            working_dir.mkdir(exist_ok=False, parents=True)
-            # run the attack
-            victim_model_dirs = [ models_dir.joinpath(m) for m in target_config['victim_models'] ]
-            surrogate_model_dirs = [ models_dir.joinpath(m) for m in target_config['surrogate_models'] ]
-            submission = submissions_dir.joinpath(target_config['submission'])
-            attack(working_dir, victim_model_dirs, surrogate_model_dirs, submission,
-                   target_config, featurespace_config, problemspace_config)
-
+        with results_store(trial_dir, shared=False) as results_queue, compile_service(compile_workers) as compile_client:
+            pending = list(jobs)
+            while len(pending) > 0:
+                job = pending.pop(0)
+                tic = time.time()
+                attack(*job[:4], job[4], featurespace_config, problemspace_config, results_queue, log_level, compile_client)
+                if cost_model is not None:
+                    cost_model.observe(costs[job[0]][0], observed_running_time(job[0], time.time() - tic))
+                    reprioritize(pending, cost_model, costs)
 
     else:
         logging.getLogger().addHandler(logging.NullHandler())
-        futures = []
-        with ProcessPoolExecutor(workers) as executor:
-            print(f"[+] Schedule workers")
-
-            # schedule attacks
-            futures = []
-            for target_config in targets:
-                # working dir
-                working_dir = trial_dir / target_as_str(target_config)
-                working_dir.mkdir(exist_ok=False, parents=True)
-                # submit
-                victim_model_dirs = [ models_dir.joinpath(m) for m in target_config['victim_models'] ]
-                surrogate_model_dirs = [ models_dir.joinpath(m) for m in target_config['surrogate_models'] ]
-                submission = submissions_dir.joinpath(target_config['submission'])
-                futures += [executor.submit(attack, working_dir, victim_model_dirs, surrogate_model_dirs, submission,
-                                                    target_config, featurespace_config, problemspace_config)]
-
-            print(f"[+] Attacks")
-            for future in tqdm(as_completed(futures), bar_format='{l_bar}{bar:30}{r_bar}', total=len(futures)):
-                future.result()  # check for exceptions
-                pass
+        with results_store(trial_dir, shared=True) as results_queue, compile_service(compile_workers) as compile_client:
+            run_attacks(jobs, workers, featurespace_config, problemspace_config, cost_model=cost_model, costs=costs,
+                        results_queue=results_queue, model_memory=model_memory, log_level=log_level,
+                        compile_service=compile_client)
+
+
+@contextmanager
+def results_store(trial_dir, shared):
+    # Records of all attacks are sent to a single writer in this process (cf. utils.results_store)
+    # => shared: queue is accessible from worker processes
+    trial_dir.mkdir(exist_ok=True, parents=True)
+    with (Manager() if shared else nullcontext()) as manager:
+        results_queue = manager.Queue() if shared else Queue()
+        writer = ResultsWriter(trial_dir / RESULTS_DB, results_queue)
+        writer.start()
+        try:
+            yield results_queue
+        finally:
+            writer.close()
+
+
+@contextmanager
+def compile_service(compile_workers):
+    # LaTeX compilations of all workers on this host run via a single service w/ bounded concurrency
+    # => yields the client for the workers, None if disabled
+    if compile_workers is None:
+        yield None
+        return
+    socket_dir = Path(tempfile.mkdtemp(prefix='compile-service-'))
+    try:
+        with CompileService(compile_workers, socket_dir / 'compile.sock') as service:
+            try:
+                yield CompileClient(service.socket_path)
+            finally:
+                print(f"[+] Compile service")
+                for lane, metrics in service.metrics().items():
+                    print(f"    - {lane:<25}: {metrics.get('submitted', 0)} submitted, {metrics.get('timeouts', 0)} timeouts, "
+                          f"{metrics['avg_wait']:.1f}s avg. wait, {metrics['avg_run']:.1f}s avg. run")
+    finally:
+        shutil.rmtree(socket_dir, ignore_errors=True)
+
+
+def create_job(target_config, trial_dir, models_dir, submissions_dir):
+    working_dir = trial_dir / target_as_str(target_config)
+    victim_model_dirs = [ models_dir.joinpath(m) for m in target_config['victim_models'] ]
+    surrogate_model_dirs = [ models_dir.joinpath(m) for m in target_config['surrogate_models'] ]
+    submission = submissions_dir.joinpath(target_config['submission'])
+    return working_dir, victim_model_dirs, surrogate_model_dirs, submission, target_config
+
+
+def estimate_costs(jobs, cost_model, featurespace_config, problemspace_config):
+    # working dir -> (features, estimated running time)
+    # => ranks are computed w/ the first victim model on the LaTeX source of the submission
+    costs = {}
+    for working_dir, victim_model_dirs, _, submission, target_config in jobs:
+        features = target_features(target_config, submission, get_model(victim_model_dirs[0]),
+                                   featurespace_config, problemspace_config)
+        costs[working_dir] = (features, cost_model.estimate(features))
+    return costs
+
+
+def reprioritize(pending, cost_model, costs):
+    # each observation refits the cost model
+    # => update the estimates of the pending jobs and keep them sorted longest-first
+    for job in pending:
+        features, _ = costs[job[0]]
+        costs[job[0]] = (features, cost_model.estimate(features))
+    pending.sort(key=lambda job: costs[job[0]][1], reverse=True)
+
+
+def job_models(job):
+    # models of a job and whether they can be loaded lazily (cf. attack)
+    _, victim_model_dirs, surrogate_model_dirs, _, _ = job
+    models = { model_dir.as_posix() : idx != 0 for idx, model_dir in enumerate(victim_model_dirs) }
+    for model_dir in surrogate_model_dirs:
+        models[model_dir.as_posix()] = False
+    return models
+
+
+def run_attacks(jobs, workers, featurespace_config, problemspace_config, cost_model=None, costs=None, results_queue=None,
+                model_memory=None, log_level='INFO', compile_service=None):
+    # Each worker is a single-process pool that keeps its models across targets (cf. utils.model_registry).
+    # Targets are routed to the worker that has already loaded most of their models.
+    # Models used by all targets are preloaded by the initializer.
+    # With costs, jobs are sorted longest-first and a worker only picks among the longest pending jobs.
+    models_shared = set.intersection(*[ set(job_models(job).items()) for job in jobs ]) if len(jobs) > 0 else set()
+    lanes = [ ProcessPoolExecutor(1, initializer=init_worker, initargs=(sorted(models_shared), model_memory)) for _ in range(workers) ]
+    lanes_models = [ { model_dir for model_dir, _ in models_shared } for _ in range(workers) ]
+    lanes_busy = {}
+    started = {}
+    pending = list(jobs)
+
+    print(f"[+] Attacks")
+    with tqdm(bar_format='{l_bar}{bar:30}{r_bar}', total=len(jobs)) as progress_bar:
+        try:
+            while len(pending) > 0 or len(lanes_busy) > 0:
+                # schedule attacks on idle workers
+                for lane_idx, lane in enumerate(lanes):
+                    if lane_idx in lanes_busy.values() or len(pending) == 0:
+                        continue
+                    # pick the (first) job with the largest overlap of loaded models
+                    # => w/ costs, only consider the longest jobs (one per worker)
+                    candidates = pending[:len(lanes)] if costs is not None else pending
+                    job = max(candidates, key=lambda job: len(lanes_models[lane_idx].intersection(job_models(job))))
+                    pending.remove(job)
+                    lanes_models[lane_idx].update(job_models(job))
+                    future = lane.submit(attack, *job[:4], job[4], featurespace_config, problemspace_config, results_queue,
+                                         log_level, compile_service)
+                    lanes_busy[future] = lane_idx
+                    started[future] = (job[0], time.time())
+
+                # wait for attacks
+                done, _ = wait(lanes_busy, return_when=FIRST_COMPLETED)
+                for future in done:
+                    future.result()  # check for exceptions
+                    del lanes_busy[future]
+                    working_dir, tic = started.pop(future)
+                    if cost_model is not None:
+                        cost_model.observe(costs[working_dir][0], observed_running_time(working_dir, time.time() - tic))
+                        reprioritize(pending, cost_model, costs)
+                    progress_bar.update(1)
+        finally:
+            for lane in lanes:
+                lane.shutdown(wait=True)
+
+
+def run_queue(queue_file, trial_name, trials_dir, models_dir, submissions_dir, workers, targets_file, schedule,
+              featurespace_config, problemspace_config, model_memory=None, log_level='INFO', compile_service=None):
+    # Any number of runners (on any number of nodes) can work on the same queue.
+    # The first runner populates the queue w/ the targets file, later runners join the campaign.
+    queue = WorkQueue(queue_file)
+    if queue.trial_name() is None:
+        targets = json.loads(targets_file.read_text())
+        random.seed(2023)
+        random.shuffle(targets)
+        jobs = [ create_job(target_config, trials_dir / trial_name, models_dir, submissions_dir) for target_config in targets ]
+        # longest targets are claimed first
+        priorities = { job[0] : 0 for job in jobs }
+        if schedule == 'cost':
+            cost_model = CostModel(trials_dir.joinpath(SCHEDULER_OBSERVATIONS))
+            priorities = { working_dir : cost for working_dir, (_, cost) in estimate_costs(jobs, cost_model, featurespace_config, problemspace_config).items() }
+        # the queue might have been populated by another runner in the meantime
+        trial_name = queue.init(trial_name, [ (job[0].name, job[4], priorities[job[0]]) for job in jobs ])
+    else:
+        trial_name = queue.trial_name()
+    trial_dir = trials_dir / trial_name
+
+    print(f"[+] Queue {queue_file}")
+    print(f'    - {"trial_dir":<25}: {trial_dir}')
+    print(f'    - {"runner":<25}: {queue.runner}')
+    print(f'    - {"pending":<25}: {queue.pending()}')
+
+    logging.getLogger().addHandler(logging.NullHandler())
+    # every runner has its own writer, runners only contend for the results store across nodes
+    with results_store(trial_dir, shared=True) as results_queue, \
+            ProcessPoolExecutor(workers, initializer=init_worker, initargs=((), model_memory)) as executor:
+        futures = [ executor.submit(queue_runner, queue_file, trial_dir, models_dir, submissions_dir,
+                                    featurespace_config, problemspace_config, results_queue, log_level, compile_service)
+                    for _ in range(workers) ]
+        for future in futures:
+            future.result()  # check for exceptions
+
+    print(f"[+] Queue drained")
+    for state, cnt in sorted(queue.stats().items()):
+        print(f'    - {state:<25}: {cnt}')
+
+
+def queue_runner(queue_file, trial_dir, models_dir, submissions_dir, featurespace_config, problemspace_config, results_queue=None,
+                 log_level='INFO', compile_service=None):
+    # claim targets until the queue is drained
+    queue = WorkQueue(queue_file)
+    while True:
+        claimed = queue.claim()
+        if claimed is None:
+            break
+        name, target_config, attempts = claimed
+        job = create_job(target_config, trial_dir, models_dir, submissions_dir)
+        # each attempt runs in its own dir next to the trial dir, the target dir is only replaced once it completed
+        # => a runner that lost its lease (but is still running) never writes into the dir of another attempt
+        attempt_dir = trial_dir.with_name(f'.{trial_dir.name}.attempts').joinpath(f'{attempts}', job[0].name)
+        attempt_dir.mkdir(exist_ok=False, parents=True)
+        # records of the attempt are held back until it is completed
+        records = RecordBuffer()
+        with queue.lease(name) as lost:
+            attack(attempt_dir, *job[1:4], job[4], featurespace_config, problemspace_config, records, log_level,
+                   compile_service, attempt=attempts)
+        if lost.is_set():
+            # another runner attacks the target again
+            shutil.rmtree(attempt_dir, ignore_errors=True)
+            continue
+        # remove partial results of a dead runner
+        if job[0].is_dir():
+            shutil.rmtree(job[0])
+        attempt_dir.rename(job[0])
+        with suppress(OSError):
+            attempt_dir.parent.rmdir()
+        # the lease might have been lost w/o the heartbeat noticing it
+        # => the dir is replaced by the runner that attacks the target again
+        if queue.complete(name) and results_queue is not None:
+            records.forward(results_queue)
 
 
 if __name__ == '__main__':
@@ -471,6 +907,28 @@ if __name__ == '__main__':
                         type=int,
                         default=1,
                         help='Number of parallel instances. Each worker utilize one CPU.')
+    parser.add_argument('--schedule',
+                        type=str,
+                        default='shuffle',
+                        choices=['shuffle', 'cost'],
+                        help='Order of targets. "cost" estimates the running time of targets and starts the longest first')
+    parser.add_argument('--queue',
+                        type=Path,
+                        default=None,
+                        help='SQLite work queue shared by multiple runners (e.g., on different nodes). Created from the targets file, if neccessary')
+    parser.add_argument('--model_memory',
+                        type=float,
+                        default=None,
+                        help='Memory budget in MB for resident models per worker. Least-recently-used models are evicted')
+    parser.add_argument('--log_level',
+                        type=str,
+                        default='INFO',
+                        choices=['DEBUG', 'INFO', 'WARNING'],
+                        help='Log level of the targets. DEBUG adds rankings and blocked features (costs extra inference)')
+    parser.add_argument('--compile_workers',
+                        type=int,
+                        default=None,
+                        help='Max. number of concurrent LaTeX compilations of all workers. Default is unbounded')
     parser.add_argument('--targets_file',
                         type=Path,
                         default=Path.home().joinpath('adversarial-papers', 'evaluation', 'targets', 'whitebox', 'targets_model.00_noselect.1_noreject.0_notargets.100.json'),
@@ -515,6 +973,8 @@ if __name__ == '__main__':
                                       help="Continue until all beam candidates are finished")
     feature_space_parser.add_argument('--no_clusters', type=int, default=None,
                                       help='Cluster similar candidates')
+    feature_space_parser.add_argument('--cluster_method', type=str, default='ward', choices=['ward', 'kmeans'],
+                                      help='Clustering of candidates. "kmeans" scales to large beams')
     # ablation
     feature_space_parser.add_argument('--all_topics', action="store_true",
                                       help='Consider all topics during candidate generation')
@@ -571,6 +1031,19 @@ if __name__ == '__main__':
                                       help='Scalar for attack budget')
     problem_space_parser.add_argument('--repeat', type=int, default=0,
                                     help='Number of repetitions if attack fails')
+    problem_space_parser.add_argument('--pipeline', action="store_true",
+                                      help='Overlap the problem-space attack with the feature-space attack of the next iteration')
+    # compilation
+    problem_space_parser.add_argument('--preamble_format', action="store_true",
+                                      help='Precompile the preamble of submissions into a format file (requires mylatexformat)')
+    problem_space_parser.add_argument('--compile_cache', type=str, default=None,
+                                      help='Dir of a compile cache shared by all workers. Identical LaTeX projects are compiled only once')
+    problem_space_parser.add_argument('--compile_cache_size', type=float, default=2048,
+                                      help='Size of the compile cache in MB. Least-recently-used compilations are evicted')
+    problem_space_parser.add_argument('--scratch_dir', type=str, default=None,
+                                      help='Root of all temporary LaTeX projects, e.g. /dev/shm. Default is the system temp dir')
+    problem_space_parser.add_argument('--scratch_min_free', type=float, default=512,
+                                      help='Free space in MB to keep in the scratch dir, otherwise projects fall back to the system temp dir')
 
     # parse and group arguments
     # -> args w/o group are added directly to result dict
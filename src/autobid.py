@@ -7,6 +7,7 @@ os.environ["NUMEXPR_NUM_THREADS"] = "1"
 import argparse
 import json
 import logging
+import time
 from collections import Counter, defaultdict
 from multiprocessing import Pool, cpu_count
 from pathlib import Path
@@ -16,17 +17,21 @@ from gensim import corpora
 from gensim.models.ldamodel import LdaModel
 from tqdm import tqdm
 
+from utils.model_manager import get_lda, has_memory_budget
 from utils.pdf_utils import analyze_words
 
 logger = logging.getLogger(__name__)
 
 class AutoBid:
 
-    def __init__(self, model_dir, corpus_dir=None, no_topics=50, workers=1, lazy=False):
+    def __init__(self, model_dir, corpus_dir=None, no_topics=50, workers=1, lazy=False, passes=30, iterations=50, random_state=None):
         self.model_dir = model_dir
         self.lazy = lazy
         self.no_topics = no_topics
         self.workers = workers
+        # inference statistics
+        self.inference_calls = 0
+        self.inference_time = 0.
 
         # Step 0: check model
         if corpus_dir is None and \
@@ -54,14 +59,17 @@ class AutoBid:
             corpus = json.loads(corpus_cache.read_text())
             # b. encode corpus with id <-> term dictionary
             id2word = corpora.Dictionary(corpus)
+            # reverse mapping used by the strategies (cf. utils.lda), gensim only builds it on lookups
+            id2word.id2token = { token_id : token for token, token_id in id2word.token2id.items() }
             corpus = [id2word.doc2bow(text) for text in corpus]
             # c. train model
-            ldamodel = LdaModel(corpus, num_topics=self.no_topics, iterations=50, id2word=id2word, passes=30)
+            ldamodel = LdaModel(corpus, num_topics=self.no_topics, iterations=iterations, id2word=id2word, passes=passes,
+                                random_state=random_state)
             ldamodel.save(model_cache.as_posix())
         # load model
         if not lazy:
             # lazily load model to reduce memory load
-            self.model = LdaModel.load(model_cache.as_posix())
+            get_lda(model_dir)
 
         # Step 2: Reviewers
         reviewers_to_topics_cache = model_dir.joinpath('reviewer_topics.json')
@@ -104,15 +112,21 @@ class AutoBid:
     def __repr__(self):
         return f'AutoBid <{self.model_dir}>'
 
+    @property
+    def model(self):
+        # LDA models are shared and evicted process-wide (cf. utils.model_manager)
+        # => lazy models are only kept if the memory is managed by a budget
+        return get_lda(self.model_dir, resident=not self.lazy or has_memory_budget())
+
     def get_topics(self, words):
-        if self.lazy:
-            model = LdaModel.load(self.model_dir.joinpath('lda.model').as_posix())
-            topics = model[model.id2word.doc2bow(words)]
-        else:
-            topics = self.model[self.model.id2word.doc2bow(words)]
+        tic = time.time()
+        model = self.model
+        topics = model[model.id2word.doc2bow(words)]
         topic_probabilities = [0]*self.no_topics
         for topic in topics:
             topic_probabilities[topic[0]] = topic[1]
+        self.inference_calls += 1
+        self.inference_time += time.time() - tic
         return np.array(topic_probabilities)
 
     def get_reviewer(self, reviewer_name):
@@ -162,12 +176,13 @@ class AutoBid:
         # get topic vector
         reviewer_topics = self.reviewers_topics[reviewer_idx]
         # get words for each topic
+        model = self.model
         reviewer_words = defaultdict(list)
         for idx, topic_prob in enumerate(reviewer_topics):
             if topic_prob == 0:
                 continue
-            for word_id, word_prob in  self.model.get_topic_terms(idx, topn=int(1e6)):
-                word = self.model.id2word[word_id]
+            for word_id, word_prob in  model.get_topic_terms(idx, topn=int(1e6)):
+                word = model.id2word[word_id]
                 reviewer_words[word] += [ word_prob*topic_prob ]
         # aggregate
         reviewer_words = [ (w, np.mean(p)) for w, p in reviewer_words.items() ]
@@ -207,4 +222,5 @@ if __name__ == "__main__":
     logging.basicConfig(format='%(message)s', level=logging.DEBUG)
 
     for model_idx in tqdm(range(args.no_models), ncols=80):
-        AutoBid(model_dir=models_dir, corpus_dir=args.corpus_dir, workers=args.workers)
+        AutoBid(model_dir=models_dir, corpus_dir=args.corpus_dir, no_topics=args.no_topics, workers=args.workers,
+                passes=args.passes, iterations=args.iterations)
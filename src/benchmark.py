@@ -0,0 +1,273 @@
+import os
+os.environ["OMP_NUM_THREADS"] = "1"
+os.environ["OPENBLAS_NUM_THREADS"] = "1"
+os.environ["MKL_NUM_THREADS"] = "1"
+os.environ["VECLIB_MAXIMUM_THREADS"] = "1"
+os.environ["NUMEXPR_NUM_THREADS"] = "1"
+import argparse
+import json
+import logging
+import random
+import resource
+import subprocess
+import sys
+import time
+from multiprocessing import Pool
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+import numpy as np
+
+from autobid import AutoBid
+from featurespace.attack import featurespace_attack
+from featurespace.telemetry import TELEMETRY_FILE
+
+STRATEGIES = ['basic', 'topic_based', 'word_based', 'aggregated']
+
+# entry points and the modules of the problem-space stack that are slow to import
+IMPORT_MODULES = ['attack', 'hypersearch', 'problemspace.attackstrategy.problemspace_attack',
+                  'problemspace.attackstrategy.TextModification']
+HEAVY_MODULES = ['torch', 'transformers', 'spacy', 'pandas', 'sklearn', 'bibtexparser', 'fuzzywuzzy', 'homoglyphs']
+
+IMPORT_SNIPPET = """
+import json, sys, time
+tic = time.perf_counter()
+import {module}
+print(json.dumps({{ 'time' : time.perf_counter() - tic, 'modules' : [ m for m in {heavy} if m in sys.modules ] }}))
+"""
+
+FEATURESPACE_CONFIG = {
+    "stop_condition": "all_successful",
+    "hold_out_surrogates": [],
+    "max_itr": 100,
+    "delta": -0.02,
+    "beam_width": 2,
+    "step": 16,
+    "no_successors": 64,
+    "reviewer_window": 4,
+    "reviewer_offset": 1,
+    "strategy": "word_based",
+    "lambda": 0.8,
+    "omega": 1e-06,
+    "max_man_norm": None,
+    "max_inf_norm": None,
+    "only_feature_space": True,
+    "finish_all": False,
+    "no_clusters": None,
+    "cluster_method": "ward",
+    "all_topics": False,
+    "regular_beam_search": False,
+    "morphing": False,
+}
+
+
+def synthetic_word(idx):
+    # pronounceable words that survive the usual preprocessing
+    consonants, vowels = 'bcdfghjklmnprstvwz', 'aeiou'
+    word = ''
+    for _ in range(3):
+        idx, c = divmod(idx, len(consonants))
+        idx, v = divmod(idx, len(vowels))
+        word += consonants[c] + vowels[v]
+    return word
+
+
+def synthetic_document(rng, topics_words, topic_mixture, no_words):
+    no_words_per_topic = rng.multinomial(no_words, topic_mixture)
+    words = []
+    for topic_words, topic_no_words in zip(topics_words, no_words_per_topic):
+        words += list(rng.choice(topic_words[0], topic_no_words, p=topic_words[1]))
+    return [ str(word) for word in words ]
+
+
+def create_synthetic_corpus(corpus_dir, seed, no_topics, no_words, no_documents, no_reviewers, no_submissions):
+    # Generative LDA-style corpus: every topic is a Dirichlet distribution over the vocabulary,
+    # documents mix a few topics, and reviewers publish documents around their own topics
+    rng = np.random.RandomState(seed)
+    vocabulary = [ synthetic_word(idx) for idx in range(no_words) ]
+    topics_words = []
+    for _ in range(no_topics):
+        probs = rng.dirichlet(np.full(no_words, 0.05))
+        topics_words += [ (vocabulary, probs) ]
+
+    def topic_mixture(main_topics):
+        alpha = np.full(no_topics, 0.05)
+        alpha[list(main_topics)] = 2
+        return rng.dirichlet(alpha)
+
+    corpus = [ synthetic_document(rng, topics_words, topic_mixture(rng.choice(no_topics, 2, replace=False)), 400)
+               for _ in range(no_documents) ]
+
+    reviewers = {}
+    for reviewer_idx in range(no_reviewers):
+        main_topics = rng.choice(no_topics, 2, replace=False)
+        reviewers[f'reviewer_{reviewer_idx:02}'] = [ word for _ in range(5)
+                                                          for word in synthetic_document(rng, topics_words, topic_mixture(main_topics), 400) ]
+
+    submissions = [ synthetic_document(rng, topics_words, topic_mixture(rng.choice(no_topics, 3, replace=False)), 3000)
+                    for _ in range(no_submissions) ]
+
+    corpus_dir.joinpath('archives').mkdir(parents=True, exist_ok=True)
+    corpus_dir.joinpath('corpus.json').write_text(json.dumps(corpus))
+    corpus_dir.joinpath('archives', 'reviewer_archives.json').write_text(json.dumps(reviewers))
+    corpus_dir.joinpath('submissions.json').write_text(json.dumps(submissions))
+    return submissions
+
+
+def create_targets(model, submissions, no_targets, rank):
+    # request the reviewer at the given rank of the clean submission
+    # => same difficulty for all submissions
+    targets = []
+    for submission_idx, submission in enumerate(submissions[:no_targets]):
+        ranking = model.get_ranking(submission)
+        targets += [ { 'submission' : submission_idx, 'request' : [ranking[rank][0]], 'reject' : [] } ]
+    return targets
+
+
+def run_case(kwargs):
+    # executed in a fresh process, s.t. peak memory is not shared across cases
+    random.seed(kwargs['seed'])
+    np.random.seed(kwargs['seed'])
+
+    model = AutoBid(Path(kwargs['model_dir']), no_topics=kwargs['no_topics'])
+    submission = kwargs['submission']
+    target = kwargs['target']
+    config = dict(FEATURESPACE_CONFIG, **kwargs['config'])
+
+    logger = logging.getLogger(f'benchmark_{config["strategy"]}_{target["submission"]}')
+    logger.addHandler(logging.NullHandler())
+    logger.propagate = False
+
+    with TemporaryDirectory() as working_dir:
+        working_dir = Path(working_dir)
+        tic = time.time()
+        results = featurespace_attack(working_dir, logger, [model], [model], target, submission, submission, [], config)
+        running_time = time.time() - tic
+        telemetry = [ json.loads(line) for line in working_dir.joinpath(TELEMETRY_FILE).read_text().splitlines() ] \
+                    if working_dir.joinpath(TELEMETRY_FILE).is_file() else []
+
+    no_candidates = sum([ record['counters'].get('loss', 0) for record in telemetry ])
+    no_iterations = len([ record for record in telemetry if record['stage'] in ['bootstrap', 'search'] ])
+    successful = bool(min(results['loss']) <= config['delta'])
+    return {
+        'strategy' : config['strategy'],
+        'submission' : target['submission'],
+        'successful' : successful,
+        'iterations' : no_iterations if successful else None,
+        'candidates' : no_candidates,
+        'candidates_per_sec' : no_candidates / running_time if running_time > 0 else None,
+        'running_time' : running_time,
+        'l1' : min(results['l1']),
+        # ru_maxrss is reported in kilobytes on linux
+        'peak_rss_mb' : resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def benchmark(benchmark_dir, strategies, no_targets, seed, no_topics, no_words, no_documents, no_reviewers, rank, max_itr):
+    benchmark_dir.mkdir(parents=True, exist_ok=True)
+    corpus_dir = benchmark_dir.joinpath('corpus')
+    model_dir = benchmark_dir.joinpath('model')
+
+    # A. Synthetic corpus and model
+    # => cached, s.t. only the first run pays for training
+    if not model_dir.joinpath('reviewer_to_words_mapping.json').is_file():
+        print(f'[+] Train synthetic model @ {model_dir}')
+        create_synthetic_corpus(corpus_dir, seed, no_topics, no_words, no_documents, no_reviewers, no_targets)
+        AutoBid(model_dir, corpus_dir=corpus_dir, no_topics=no_topics, passes=10, iterations=50, random_state=seed)
+    submissions = json.loads(corpus_dir.joinpath('submissions.json').read_text())
+    model = AutoBid(model_dir, no_topics=no_topics)
+    targets = create_targets(model, submissions, no_targets, rank)
+    del model
+
+    # B. Run cases
+    cases = [ { 'model_dir' : model_dir.as_posix(), 'no_topics' : no_topics, 'seed' : seed,
+                'submission' : submissions[target['submission']], 'target' : target,
+                'config' : { 'strategy' : strategy, 'max_itr' : max_itr } }
+              for strategy in strategies for target in targets ]
+    results = []
+    with Pool(1, maxtasksperchild=1) as p:
+        for result in p.imap(run_case, cases):
+            print(f"    {result['strategy']:<12} {result['submission']:>3}: {'success' if result['successful'] else 'failed ':<7} "
+                  f"{result['candidates_per_sec'] or 0:>8.1f} candidates/s {result['peak_rss_mb']:>8.1f} MB")
+            results += [ result ]
+
+    # C. Summary
+    summary = {}
+    for strategy in strategies:
+        strategy_results = [ r for r in results if r['strategy'] == strategy ]
+        iterations = [ r['iterations'] for r in strategy_results if r['successful'] ]
+        summary[strategy] = {
+            'successful' : len(iterations),
+            'targets' : len(strategy_results),
+            'iterations' : float(np.median(iterations)) if len(iterations) > 0 else None,
+            'candidates_per_sec' : float(sum([ r['candidates'] for r in strategy_results ]) / sum([ r['running_time'] for r in strategy_results ])),
+            'peak_rss_mb' : max([ r['peak_rss_mb'] for r in strategy_results ]),
+        }
+    benchmark_dir.joinpath('results.json').write_text(json.dumps({'cases' : results, 'summary' : summary}, indent=4))
+
+    print(f"\n[+] Summary")
+    print(f"    {'Strategy':<12} {'Success':>9} {'Iterations':>10} {'Candidates/s':>12} {'Peak RSS':>10}")
+    for strategy, s in summary.items():
+        iterations = f"{s['iterations']:.1f}" if s['iterations'] is not None else '-'
+        print(f"    {strategy:<12} {s['successful']:>4} / {s['targets']:<2} {iterations:>10} {s['candidates_per_sec']:>12.1f} {s['peak_rss_mb']:>7.1f} MB")
+    return summary
+
+
+def import_time(benchmark_dir, modules, repeat):
+    # every import runs in a fresh interpreter, as imported modules are cached per process
+    benchmark_dir.mkdir(parents=True, exist_ok=True)
+    results = {}
+    print(f"[+] Import time ({repeat} runs)")
+    for module in modules:
+        runs = []
+        for _ in range(repeat):
+            p = subprocess.run([sys.executable, '-c', IMPORT_SNIPPET.format(module=module, heavy=HEAVY_MODULES)],
+                               cwd=Path(__file__).parent, capture_output=True, text=True, check=True)
+            runs += [ json.loads(p.stdout.splitlines()[-1]) ]
+        results[module] = { 'time' : float(np.median([ r['time'] for r in runs ])), 'modules' : runs[0]['modules'] }
+        print(f"    {module:<48}: {results[module]['time']:>6.2f}s {' '.join(results[module]['modules'])}")
+    benchmark_dir.joinpath('import_time.json').write_text(json.dumps(results, indent=4))
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Offline benchmark of the feature-space attack on synthetic models')
+    parser.add_argument('--benchmark_dir', type=Path,
+                        default=Path.home().joinpath('adversarial-papers', 'evaluation', 'trials', '_benchmark'),
+                        help='Directory for the synthetic corpus, model and results')
+    parser.add_argument('--strategies', type=str, nargs='+', default=STRATEGIES,
+                        help=f'Strategies to benchmark. Any of {STRATEGIES}')
+    parser.add_argument('--no_targets', type=int, default=4,
+                        help='Number of synthetic submissions')
+    parser.add_argument('--rank', type=int, default=10,
+                        help='Initial rank of the requested reviewer')
+    parser.add_argument('--max_itr', type=int, default=100,
+                        help='Max number of iterations per target')
+    parser.add_argument('--seed', type=int, default=2023)
+    parser.add_argument('--no_topics', type=int, default=10)
+    parser.add_argument('--no_words', type=int, default=2000)
+    parser.add_argument('--no_documents', type=int, default=300)
+    parser.add_argument('--no_reviewers', type=int, default=30)
+    parser.add_argument('--import_time', action='store_true',
+                        help='Only measure the import time of the entry points')
+    parser.add_argument('--import_modules', type=str, nargs='+', default=IMPORT_MODULES,
+                        help='Modules for --import_time')
+    parser.add_argument('--import_repeat', type=int, default=5,
+                        help='Number of runs per module for --import_time')
+    args = parser.parse_args()
+
+    if args.import_time:
+        import_time(args.benchmark_dir, args.import_modules, args.import_repeat)
+        sys.exit(0)
+    args = { name : value for name, value in vars(args).items() if not name.startswith('import_') }
+
+    # python randomizes hashes of strings per process, which changes the iteration order of sets
+    # => restart with a fixed seed to make the search deterministic
+    if os.environ.get('PYTHONHASHSEED') != '0':
+        os.environ['PYTHONHASHSEED'] = '0'
+        os.execv(sys.executable, [sys.executable] + sys.argv)
+
+    logging.getLogger("gensim").setLevel(logging.WARNING)
+    logging.getLogger("utils.lda").setLevel(logging.WARNING)
+
+    benchmark(**args)
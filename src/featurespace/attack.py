@@ -8,31 +8,46 @@ from pathlib import Path
 import numpy as np
 from autobid import AutoBid
 from scipy.special import softmax
+from utils.lda import get_topics_to_words
+from utils.model_registry import get_model
 
 from .grid import create_candidate_grid
+from .loss import LossCache
 from .loss import loss as _loss
 from .strategies.basic import BasicStrategy
 from .strategies.predictive import PredictiveWordsStrategy
 from .strategies.topic_based import TopicStrategy
 from .strategies.word_based import WordStrategy
 from .submission import Submission
-from .utils import cluster, print_scores
+from .telemetry import Telemetry
+from .utils import cluster, cluster_sparse, print_scores
 
 
 def featurespace_attack(working_dir, logger, victim_models, surrogate_models, target, submission_words, submission_words_clean, features_blocked, config):
-    submissions, victim_loss, loss = _featurespace_attack(working_dir, logger, victim_models, surrogate_models, target, submission_words, submission_words_clean, features_blocked, config)
+    telemetry = Telemetry(working_dir, models=victim_models + surrogate_models)
+    submissions, victim_loss, loss = _featurespace_attack(working_dir, logger, victim_models, surrogate_models, target, submission_words, submission_words_clean, features_blocked, config, telemetry)
     # loss = partial(_loss, autobid, config, target)
 
     if config['no_clusters'] is not None:
         no_clusters = min(config['no_clusters'], len(submissions))
         logger.info(f'\n    Cluster {len(submissions)} candidates into {no_clusters} cluster')
-        submission_to_cluster_idx = cluster(submissions, no_clusters)
+        with telemetry.timer('clustering'):
+            if config['cluster_method'] == 'ward':
+                submission_to_cluster_idx = cluster(submissions, no_clusters)
+            elif config['cluster_method'] == 'kmeans':
+                submission_to_cluster_idx = cluster_sparse(submissions, no_clusters)
+            else:
+                raise ValueError(config['cluster_method'])
         submissions_ = []
         for cluster_idx in range(no_clusters):
             # get all submission in this cluster
             cluster_submissions = [ submission for submission_label, submission in zip(submission_to_cluster_idx, submissions) 
                                                if submission_label == cluster_idx ]
+            # k-means might leave clusters empty
+            if len(cluster_submissions) == 0:
+                continue
             # select submission with minimal loss
+            # => losses of the beam are already known from the search
             losses = [ loss(submission) for submission in cluster_submissions ]
             best_submission_idx = np.argmin(losses)
             submissions_ += [cluster_submissions[best_submission_idx]]
@@ -41,6 +56,7 @@ def featurespace_attack(working_dir, logger, victim_models, surrogate_models, ta
             for idx, (submission, submission_loss) in enumerate(zip(cluster_submissions, losses)):
                 logger.info(f"    {'->' if idx == best_submission_idx else '  '} {submission_loss:7.4f} {json.dumps(submission.modified_words_cnt)[:128]}...")
         submissions = submissions_
+        telemetry.flush(itr=None, stage='clustering', no_submissions=len(submissions))
     
     results = {
         'loss' : [ loss(submission) for submission in submissions ],
@@ -86,7 +102,7 @@ def _stop_condition(loss_fn, config, target, submission):
         raise ValueError(config['stop_condition'])
 
 
-def _featurespace_attack(working_dir, logger, victim_models_, surrogate_models_, target, submission_words, submission_words_clean, features_blocked, config):
+def _featurespace_attack(working_dir, logger, victim_models_, surrogate_models_, target, submission_words, submission_words_clean, features_blocked, config, telemetry):
 
     global surrogate_models #, victim_models, hold_out_surrogates
     victim_models = victim_models_
@@ -110,15 +126,21 @@ def _featurespace_attack(working_dir, logger, victim_models_, surrogate_models_,
     else:
         grid_size = 0
 
+    # track caches of the strategies
+    if config['strategy'] == 'word_based':
+        telemetry.add_cache('word_based', strategies['word_based'].cache_info)
+    elif config['strategy'] == 'aggregated':
+        telemetry.add_cache('topics_to_words', get_topics_to_words.cache_info)
+
     # Step 2: init loss
     loss_fn = _loss
     victim_loss = partial(loss_fn, victim_models[0], config, target)
-    loss = partial(surrogate_loss, loss_fn, config, target)
+    loss = telemetry.wrap('loss', partial(surrogate_loss, loss_fn, config, target))
     surrogate_losses = defaultdict(list)
 
     # Step 3: init stop condition
     if config['stop_condition'] == 'hold_out_surrogates':
-        hold_out_surrogates = [ AutoBid(Path(model_dir)) for model_dir in config['hold_out_surrogates'] ]
+        hold_out_surrogates = [ get_model(model_dir) for model_dir in config['hold_out_surrogates'] ]
     stop_condition = partial(_stop_condition, loss_fn, config, target)
 
     # Step 4: init submission
@@ -174,8 +196,15 @@ def _featurespace_attack(working_dir, logger, victim_models_, surrogate_models_,
         return [submission], victim_loss, loss
     
     # Step 5: bootstrap beam search
-    grid = create_candidate_grid(surrogate_models, target, submission, config, grid_size, logger)
-    submissions = submission.get_best_successors(grid, loss, config['beam_width'], config['max_inf_norm'], config['max_man_norm'])
+    # => submissions are now defined by their history, s.t. losses can be reused
+    loss_uncached = loss
+    loss = LossCache(loss_uncached)
+    telemetry.add_cache('loss', loss.cache_info)
+    with telemetry.timer('grid'):
+        grid = create_candidate_grid(surrogate_models, target, submission, config, grid_size, logger)
+    telemetry.count('grid', len(grid))
+    submissions = submission.get_best_successors(grid, loss_uncached, config['beam_width'], config['max_inf_norm'], config['max_man_norm'])
+    telemetry.flush(itr=0, stage='bootstrap', no_candidates=len(submissions))
 
     # break when there aren't any available successors
     if len(submissions) == 0:
@@ -191,6 +220,12 @@ def _featurespace_attack(working_dir, logger, victim_models_, surrogate_models_,
 
         tic = time.time()
 
+        # deadline of the target (cf. hypersearch), checked between iterations
+        # => the attack stops cleanly and writes its results
+        if config.get('deadline') is not None and tic > config['deadline']:
+            logger.info(f'\n[{itr+1:>4}] Reached deadline')
+            break
+
         # check if we done
         finished = [ stop_condition(submission) for submission in submissions ]
         if (    config['finish_all'] and np.all(finished)) or \
@@ -201,45 +236,53 @@ def _featurespace_attack(working_dir, logger, victim_models_, surrogate_models_,
         # get successors for each submission
         candidates = []
         for submission in submissions:
-            grid = create_candidate_grid(surrogate_models, target, submission, config, grid_size, logger)
-            candidates += submission.get_best_successors(grid, loss, config['beam_width'], config['max_inf_norm'], config['max_man_norm'])
+            with telemetry.timer('grid'):
+                grid = create_candidate_grid(surrogate_models, target, submission, config, grid_size, logger)
+            telemetry.count('grid', len(grid))
+            # successors are evaluated relative to the current submission
+            # => not cacheable by history
+            candidates += submission.get_best_successors(grid, loss_uncached, config['beam_width'], config['max_inf_norm'], config['max_man_norm'])
     
         # de-duplicate
-        candidates_unique = {}
-        for candidate in candidates:
-            key = hash(tuple(sorted(candidate.history)))
-            candidates_unique[key] = candidate
-        candidates_unique = list(candidates_unique.values())
-        candidates_unique = [ (loss(candidate), candidate) for candidate in candidates_unique ]
-
-        # remove candidates that are identical to a current submission
-        candidates = []
-        submission_cnts = [ submission.modified_words_cnt for submission in submissions ]
-        for candidate_loss, candidate in candidates_unique:
-            # cache words cnt
-            candidate_cnt = candidate.modified_words_cnt
-            # check submissions one by one
-            for submission_cnt in submission_cnts:
-                # check if submission and candidate contain the same words
-                if set(submission_cnt.keys()) == set(candidate_cnt.keys()):
-                    # if yes, check word cnts
-                    for word, cnt in candidate.modified_words_cnt.items():
-                        # break if there is at least one difference
-                        # => continue w/ the next submission
-                        if submission_cnt[word] != cnt:
+        with telemetry.timer('dedup'):
+            candidates_unique = {}
+            for candidate in candidates:
+                key = hash(tuple(sorted(candidate.history)))
+                candidates_unique[key] = candidate
+            candidates_unique = list(candidates_unique.values())
+
+            # remove candidates that are identical to a current submission
+            candidates = []
+            submission_cnts = [ submission.modified_words_cnt for submission in submissions ]
+            for candidate in candidates_unique:
+                # cache words cnt
+                candidate_cnt = candidate.modified_words_cnt
+                # check submissions one by one
+                for submission_cnt in submission_cnts:
+                    # check if submission and candidate contain the same words
+                    if set(submission_cnt.keys()) == set(candidate_cnt.keys()):
+                        # if yes, check word cnts
+                        for word, cnt in candidate.modified_words_cnt.items():
+                            # break if there is at least one difference
+                            # => continue w/ the next submission
+                            if submission_cnt[word] != cnt:
+                                break
+                        else:
+                            # candidate is identical to submission
+                            # => break s.t. candidate is not added 
                             break
-                    else:
-                        # candidate is identical to submission
-                        # => break s.t. candidate is not added 
-                        break
-            else:
-                # we did not break from loop
-                # => there is no submission that is identical
-                candidates += [(candidate_loss, candidate)]
-        candidates_unique = candidates   
+                else:
+                    # we did not break from loop
+                    # => there is no submission that is identical
+                    candidates += [candidate]
+
+        # losses of the remaining candidates (incl. hits of the loss cache)
+        with telemetry.timer('candidate_loss'):
+            candidates_unique = [ (loss(candidate), candidate) for candidate in candidates ]
 
         if len(candidates_unique) == 0:
             logger.info(f'\n[{itr+1:>4}] No candidates left ({len(candidates_unique)} candidates)')
+            telemetry.flush(itr=itr, stage='search', no_candidates=0, loss_spread=None)
             break
 
         # select candidates
@@ -259,11 +302,13 @@ def _featurespace_attack(working_dir, logger, victim_models_, surrogate_models_,
                                                  if idx in idxes]
             # sort
             submissions = [ candidate for _, candidate in sorted(candidates, key=lambda x: x[0], reverse=False) ]
+            beam_losses = [ beam_loss for beam_loss, _ in candidates ]
 
         else:
             # pick the best candidates
             candidates = sorted(candidates_unique, key=lambda x: x[0], reverse=False)
             submissions = [ candidate for _, candidate in candidates ][:config['beam_width']]
+            beam_losses = [ beam_loss for beam_loss, _ in candidates ][:config['beam_width']]
 
         # log stats
         logger.info(f'\n[{itr+1:>4}] {"Loss":<16}: {victim_loss(submissions[0]):3.2f} - {victim_loss(submissions[-1]):3.2f}')
@@ -281,6 +326,8 @@ def _featurespace_attack(working_dir, logger, victim_models_, surrogate_models_,
         logger.info(f'       {"Surrogates":<16}: {" ".join(surrogate_loss_)}')
         print_scores(logger, victim_models[0], submissions[0], target)
         working_dir.joinpath('surrogate_losses.json').write_text(json.dumps(surrogate_losses, indent=4))
+        telemetry.flush(itr=itr, stage='search', no_candidates=len(candidates_unique), 
+                        loss_spread=float(np.max(beam_losses) - np.min(beam_losses)))
 
     else:
         # reached max iteration
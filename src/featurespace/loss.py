@@ -1,5 +1,29 @@
 import numpy as np
 
+
+class LossCache:
+    # Memoizes the loss of submissions. Within a single attack all submissions
+    # start from the same words, s.t. a submission is fully defined by its history.
+    # Note: not applicable to submissions with extra words (morphing baseline)
+
+    def __init__(self, loss):
+        self.loss = loss
+        self.cache = {}
+        self.hits, self.misses = 0, 0
+
+    def __call__(self, submission):
+        key = tuple(sorted(submission.history))
+        if key in self.cache:
+            self.hits += 1
+        else:
+            self.misses += 1
+            self.cache[key] = self.loss(submission)
+        return self.cache[key]
+
+    def cache_info(self):
+        return self.hits, self.misses
+
+
 def loss(model, config, T, p):
     # calculate loss with raw scores
     scores = model.get_scores(p.words, normalized=False)
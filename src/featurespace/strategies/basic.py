@@ -1,15 +1,15 @@
 
 from collections import Counter, defaultdict
 import numpy as np
+from utils.model_registry import get_topic_terms
 
 class BasicStrategy:
 
-    def __init__(self, autobid, n_sample_words=5000):
+    def __init__(self, autobid, features_blocked, n_sample_words=5000):
         self.words = {}
         for topic_id in range(autobid.no_topics):
-            words, probs = zip(*[ (autobid.model.id2word.id2token[token_id], prob) 
-                                   for token_id, prob in autobid.model.get_topic_terms(topic_id, int(1e6))
-                                   if prob > 1e-8 ])
+            words, probs = zip(*[ (word, prob) for word, prob in zip(*get_topic_terms(autobid, topic_id))
+                                   if prob > 1e-8 and word not in features_blocked ])
             probs = np.array(probs) / np.sum(probs)
             self.words[topic_id] = np.random.choice(words, n_sample_words, p=probs)
 
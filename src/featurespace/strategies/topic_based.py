@@ -1,6 +1,7 @@
 
 from collections import Counter, defaultdict
 import numpy as np
+from utils.model_registry import get_topic_terms
 
 class TopicStrategy:
 
@@ -8,10 +9,8 @@ class TopicStrategy:
         self.words = []
         for surrogate_model in surrogate_models:
             for topic_id in range(surrogate_model.no_topics):
-                words, probs = zip(*[ (surrogate_model.model.id2word.id2token[token_id], prob) 
-                                    for token_id, prob in surrogate_model.model.get_topic_terms(topic_id, int(1e6))
-                                    if surrogate_model.model.id2word.id2token[token_id] and
-                                       surrogate_model.model.id2word.id2token[token_id] not in features_blocked ])
+                words, probs = zip(*[ (word, prob) for word, prob in zip(*get_topic_terms(surrogate_model, topic_id))
+                                    if word and word not in features_blocked ])
 
                 probs = np.array(probs) / np.sum(probs)
                 self.words.append(np.random.choice(words, n_sample_words, p=probs))
@@ -1,8 +1,8 @@
 
 from collections import Counter, defaultdict
 import numpy as np
-import json
 from itertools import chain
+from utils.model_registry import get_reviewer_to_words
 
 
 class WordStrategy:
@@ -10,19 +10,22 @@ class WordStrategy:
     def __init__(self, surrogate_models, target, features_blocked, submission_words, n_sample_words=1000):
 
         self.words = {}
+        self.cache_hits, self.cache_misses = 0, 0
         self.features_blocked = features_blocked
         self.n_sample_words = n_sample_words
         # assert len(target['request']) <= 1 and len(target['reject']) <= 1
 
-        self.surrogate_to_reviewers_words = [ [dict(reviewer_words) for reviewer_words in json.loads(surrogate_model.model_dir.joinpath('reviewer_to_words_mapping.json').read_text()) ]
-                                               for surrogate_model in surrogate_models                                                      ]
+        # mappings are shared across targets (read-only)
+        self.surrogate_to_reviewers_words = [ get_reviewer_to_words(surrogate_model) for surrogate_model in surrogate_models ]
         self.submission_words = submission_words
 
     def init_words(self, key):
 
         # is cached?
         if key in self.words:
+            self.cache_hits += 1
             return self.words[key]
+        self.cache_misses += 1
         
         surrogate_idx, target_reviewer_idx, reviewer_idxes, mode, op = key
         reviewers_words = self.surrogate_to_reviewers_words[surrogate_idx]
@@ -68,6 +71,9 @@ class WordStrategy:
 
         return self.words[key]
 
+    def cache_info(self):
+        return self.cache_hits, self.cache_misses
+
     def add_words(self, words_cnt, current_state, no_words, topic_id):
         return words_cnt + Counter(self.words[topic_id][current_state:current_state+no_words])
 
@@ -0,0 +1,140 @@
+import argparse
+import json
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+
+TELEMETRY_FILE = 'telemetry.jsonl'
+
+
+class Telemetry:
+    # Collects performance counters of the feature-space attack and writes
+    # one JSON line per iteration to <working_dir>/telemetry.jsonl
+
+    def __init__(self, working_dir=None, models=(), caches=None):
+        self.telemetry_file = None if working_dir is None else Path(working_dir).joinpath(TELEMETRY_FILE)
+        # models and caches are polled, s.t. only the delta per iteration is reported
+        self.models = list({ model.model_dir.as_posix() : model for model in models }.values())
+        self.caches = {} if caches is None else caches
+        self._reset()
+
+    def _reset(self):
+        self.tic = time.time()
+        self.counters = Counter()
+        self.timers = defaultdict(float)
+        self.inference = self._poll_inference()
+        self.cache_stats = self._poll_caches()
+
+    def _poll_inference(self):
+        return (sum([ model.inference_calls for model in self.models ]),
+                sum([ model.inference_time for model in self.models ]))
+
+    def _poll_caches(self):
+        return { name : tuple(cache_info()[:2]) for name, cache_info in self.caches.items() }
+
+    def add_cache(self, name, cache_info):
+        # cache_info returns (hits, misses), e.g., functools.lru_cache
+        self.caches[name] = cache_info
+        self.cache_stats[name] = tuple(cache_info()[:2])
+
+    def count(self, name, n=1):
+        self.counters[name] += n
+
+    @contextmanager
+    def timer(self, name):
+        tic = time.time()
+        try:
+            yield
+        finally:
+            self.timers[name] += time.time() - tic
+
+    def wrap(self, name, fn):
+        # count calls and measure time of fn
+        def wrapped(*args, **kwargs):
+            self.counters[name] += 1
+            with self.timer(name):
+                return fn(*args, **kwargs)
+        return wrapped
+
+    def flush(self, itr, stage, **fields):
+        inference_calls, inference_time = self._poll_inference()
+        record = {
+            'itr' : itr,
+            'stage' : stage,
+            'time' : time.time() - self.tic,
+            'counters' : dict(self.counters),
+            'timers' : dict(self.timers),
+        }
+        record['counters']['inference'] = inference_calls - self.inference[0]
+        record['timers']['inference'] = inference_time - self.inference[1]
+        # cache hit rates
+        record['caches'] = {}
+        for name, (hits, misses) in self._poll_caches().items():
+            hits, misses = hits - self.cache_stats[name][0], misses - self.cache_stats[name][1]
+            record['caches'][name] = { 'hits' : hits, 'misses' : misses,
+                                       'hit_rate' : hits / (hits + misses) if hits + misses > 0 else None }
+        record.update(fields)
+        if self.telemetry_file is not None:
+            with self.telemetry_file.open('a') as f:
+                f.write(json.dumps(record) + '\n')
+        self._reset()
+        return record
+
+
+def load_telemetry(trial_dir):
+    records = []
+    for telemetry_file in sorted(Path(trial_dir).rglob(TELEMETRY_FILE)):
+        for line in telemetry_file.read_text().splitlines():
+            records += [ json.loads(line) ]
+    return records
+
+
+def summarize(trial_dir):
+    records = load_telemetry(trial_dir)
+    summary = {
+        'files' : len(list(Path(trial_dir).rglob(TELEMETRY_FILE))),
+        'iterations' : len([ r for r in records if r['stage'] == 'search' ]),
+        'time' : sum([ r['time'] for r in records ]),
+        'counters' : Counter(),
+        'timers' : Counter(),
+        'caches' : defaultdict(Counter),
+        'loss_spread' : [ r['loss_spread'] for r in records if r.get('loss_spread') is not None ],
+    }
+    for r in records:
+        summary['counters'].update(r['counters'])
+        summary['timers'].update(r['timers'])
+        for name, stats in r['caches'].items():
+            summary['caches'][name].update({ 'hits' : stats['hits'], 'misses' : stats['misses'] })
+    return summary
+
+
+def print_summary(summary):
+    print(f"[+] Telemetry")
+    print(f"    {'Files':<16}: {summary['files']}")
+    print(f"    {'Iterations':<16}: {summary['iterations']}")
+    print(f"    {'Time':<16}: {summary['time']:.2f}s")
+    if summary['time'] > 0:
+        print(f"    {'Candidates/s':<16}: {summary['counters']['loss'] / summary['time']:.2f}")
+    print(f"\n[+] Counters")
+    for name, cnt in sorted(summary['counters'].items()):
+        print(f"    {name:<16}: {cnt:>10} ({cnt / max(summary['iterations'], 1):.1f} per iteration)")
+    print(f"\n[+] Timers")
+    for name, t in sorted(summary['timers'].items(), key=lambda x: x[1], reverse=True):
+        print(f"    {name:<16}: {t:>10.2f}s ({100 * t / summary['time'] if summary['time'] > 0 else 0:5.1f}%)")
+    print(f"\n[+] Caches")
+    for name, stats in sorted(summary['caches'].items()):
+        total = stats['hits'] + stats['misses']
+        print(f"    {name:<16}: {stats['hits']:>10} / {total:<10} ({100 * stats['hits'] / total if total > 0 else 0:5.1f}%)")
+    if len(summary['loss_spread']) > 0:
+        spread = sorted(summary['loss_spread'])
+        print(f"\n[+] Beam loss spread")
+        print(f"    {'Median':<16}: {spread[len(spread) // 2]:.4f}")
+        print(f"    {'Max':<16}: {spread[-1]:.4f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Summarize the feature-space telemetry of a trial')
+    parser.add_argument('trial_dir', type=Path)
+    args = parser.parse_args()
+    print_summary(summarize(args.trial_dir))
@@ -1,10 +1,16 @@
 import json
+import logging
+
 import numpy as np
 from gensim.corpora import Dictionary
-from sklearn.cluster import AgglomerativeClustering
+from scipy.sparse import csr_matrix
 
 def print_scores(logger, model, submission, target):
-    logger.info("       Scores")
+    # diagnostics only
+    # => skip the extra inference if not logged
+    if not logger.isEnabledFor(logging.DEBUG):
+        return
+    logger.debug("       Scores")
     ranking = model.get_ranking(submission.words)
     for idx, (reviewer_name, score) in enumerate(ranking[:10]):
         if reviewer_name in target['request']:
@@ -13,9 +19,9 @@ def print_scores(logger, model, submission, target):
             status = "v"
         else:
             status = ""
-        logger.info(f'       {idx+1:>2} {reviewer_name.upper().replace("_", " "):<20} ({model.reviewers_list.index(reviewer_name):>3}) : {score:.2f} {status}')
+        logger.debug(f'       {idx+1:>2} {reviewer_name.upper().replace("_", " "):<20} ({model.reviewers_list.index(reviewer_name):>3}) : {score:.2f} {status}')
         if idx == 4:
-            logger.info(f'        -')
+            logger.debug(f'        -')
 
 def log_mem(prefix=""):        
     import resource
@@ -34,7 +40,27 @@ def cluster(submissions, no_clusters):
             modified_words_vec[word_id] = cnt
         modified_words_vecs += [ modified_words_vec ]
 
+    # sklearn is slow to import and clustering is optional
+    from sklearn.cluster import AgglomerativeClustering
     model = AgglomerativeClustering(linkage="ward", affinity="euclidean", distance_threshold=None, n_clusters=no_clusters, compute_distances=True)    
     model.fit(modified_words_vecs)
 
     return model.labels_
+
+def cluster_sparse(submissions, no_clusters, seed=2023):
+    # sparse modification vectors
+    # => memory is linear in the number of modified words (instead of #submissions x vocabulary)
+    vocabulary = {}
+    data, indices, indptr = [], [], [0]
+    for s in submissions:
+        for word, cnt in s.modified_words_cnt.items():
+            indices += [ vocabulary.setdefault(word, len(vocabulary)) ]
+            data += [ cnt ]
+        indptr += [ len(indices) ]
+    modified_words_vecs = csr_matrix((data, indices, indptr), shape=(len(submissions), max(len(vocabulary), 1)), dtype=np.float64)
+
+    # mini-batch k-means
+    # => linear in the number of submissions (ward linkage is quadratic)
+    from sklearn.cluster import MiniBatchKMeans
+    model = MiniBatchKMeans(n_clusters=no_clusters, random_state=seed, batch_size=min(1024, len(submissions)), n_init=3)
+    return model.fit_predict(modified_words_vecs)
@@ -5,6 +5,7 @@ os.environ["MKL_NUM_THREADS"] = "1"
 os.environ["VECLIB_MAXIMUM_THREADS"] = "1"
 os.environ["NUMEXPR_NUM_THREADS"] = "1"
 import argparse
+import bisect
 import json
 import logging
 import random
@@ -20,24 +21,75 @@ import re
 import numpy as np
 import pandas as pd
 import signal
-from attack import main
+from attack import attack, create_job, main
+from utils.model_registry import init_worker
 
 
-def append_to_dataframe(df, element):
-    # add element
-    df = df.append(element, ignore_index=True)
-    # sort data frame
-    df = df.sort_values(['finished', 'failed', 'median', 'mean'], ascending=[False, True, True, True])
-    df = df.reset_index(drop=True)
-    # find element
-    rank = [int(idx)+1 for idx in df.index if dict(df.loc[idx]) == element]; 
+class Leaderboard:
+    # Results sorted by (no. targets, finished, failed, median, mean)
+    # => results are inserted at their rank instead of re-sorting all results
 
-    if len(rank) != 1:
-        print(df)
-        print(element)
-        print(rank)
+    def __init__(self, columns):
+        self.columns = columns
+        self.keys = []
+        self.results = []
 
-    return df, rank.pop()
+    @staticmethod
+    def key(result):
+        return (-result.get('no_targets', 0), -result['finished'], result['failed'], result['median'], result['mean'])
+
+    def add(self, result):
+        # returns the rank of the result
+        key = Leaderboard.key(result)
+        idx = bisect.bisect_right(self.keys, key)
+        self.keys.insert(idx, key)
+        self.results.insert(idx, result)
+        return idx + 1
+
+    def to_dataframe(self):
+        return pd.DataFrame(self.results, columns=self.columns)
+
+    def __len__(self):
+        return len(self.results)
+
+    def dump(self, trials_dir, name):
+        df = self.to_dataframe()
+        trials_dir.joinpath(f'{name}.json').write_text(df.to_json())
+        trials_dir.joinpath(f'{name}.txt').write_text(df.to_string())
+        return df
+
+
+def analyze_run(log_file):
+    # None if the run is not finished, otherwise (no. failed models, l1 or None if trivial)
+    feature_space_results = list(log_file.parent.rglob('feature_space_results*.json'))
+    assert len(feature_space_results) <= 1, len(feature_space_results)
+
+    # finished?
+    if len(feature_space_results) == 0:
+        return None
+    
+    # load featurespace results
+    feature_space_results = feature_space_results[0]
+    feature_space_results = json.loads(feature_space_results.read_text())  
+
+    # trivial?
+    if len([ r for r in feature_space_results['successful'] if r is None]) == len(feature_space_results['successful']):
+        return 0, None
+    
+    # successful?
+    no_failed = len([ r for r in feature_space_results['successful'] if r == False])
+
+    # words?
+    return no_failed, min(feature_space_results['l1'])
+
+
+def summarize_runs(runs):
+    finished = len([ run for run in runs if run is not None ])
+    failed = sum([ run[0] for run in runs if run is not None ])
+    words = [ run[1] for run in runs if run is not None and run[1] is not None ]
+    median = int(np.median(words)) if len(words) > 0 else np.inf
+    mean = int(np.mean(words)) if len(words) > 0 else np.inf
+    return finished, failed, median, mean
 
 def run_trial(config, targets, featurespace_config, max_time):
     with redirect_stderr(open(os.devnull, 'w')):
@@ -60,38 +112,110 @@ def run_trial(config, targets, featurespace_config, max_time):
                 running_time = round(time.time() - tic)
 
                 # analyze
-                finished = 0 
-                failed = 0
-                words = []
-                for log_file in Path(trials_dir).rglob('log.txt'):
-                    feature_space_results = list(log_file.parent.rglob('feature_space_results*.json'))
-                    assert len(feature_space_results) <= 1, len(feature_space_results)
-
-                    # finished?
-                    if len(feature_space_results) == 0:
-                        continue
-                    finished += 1
-                    
-                    # load featurespace results
-                    feature_space_results = feature_space_results[0]
-                    feature_space_results = json.loads(feature_space_results.read_text())  
+                runs = [ analyze_run(log_file) for log_file in Path(trials_dir).rglob('log.txt') ]
+                finished, failed, median, mean = summarize_runs(runs)
+                return finished, failed, median, mean, running_time
 
-                    # trivial?
-                    if len([ r for r in feature_space_results['successful'] if r is None]) == len(feature_space_results['successful']):
-                        continue
-                    
-                    # successful?
-                    no_failed = len([ r for r in feature_space_results['successful'] if r == False])
 
-                    # if no_success == 0:
-                    failed += no_failed
+def run_target(target, featurespace_config, problemspace_config, models_dir, submissions_dir, max_time):
+    # Executed in long-lived workers: models are kept across targets and configs (cf. utils.model_registry)
+    # The feature-space attack checks the deadline between its iterations (cf. featurespace_attack)
+    # => a target that exceeds the deadline is stopped cleanly and counts as unfinished
+    deadline = time.time() + max_time
+    featurespace_config = dict(featurespace_config, deadline=deadline)
+    with open(os.devnull, 'w') as devnull, redirect_stderr(devnull), redirect_stdout(devnull):
+        with TemporaryDirectory() as trials_dir:
+            job = create_job(target, Path(trials_dir), models_dir, submissions_dir)
+            attack(*job[:4], job[4], featurespace_config, problemspace_config)
+            if time.time() > deadline:
+                return None
+            return analyze_run(job[0].joinpath('log.txt'))
+
+
+def successive_halving(kwargs, config, targets, featurespace_config_grid, parameters_variable_grid):
+    # Asynchronous successive halving: configs are evaluated on growing subsets of the targets (rungs).
+    # A config is promoted to the next rung once it is in the top 1/eta of all configs finished on its rung.
+    # Idle workers either evaluate a promoted config or start a new config on the first rung.
+    # Results of smaller rungs are reused, i.e., promoted configs only run on the additional targets.
+    eta = max(kwargs['eta'], 2)
+    rungs = [ min(kwargs['min_targets'], len(targets)) ]
+    while rungs[-1] < len(targets):
+        rungs += [ min(rungs[-1] * eta, len(targets)) ]
+    print(f'\n[+] Rungs: {rungs}')
+
+    configs = []
+    runs = {}                                  # (config idx, target idx) -> run
+    rung_results = [ {} for _ in rungs ]       # config idx -> result
+    promoted = [ set() for _ in rungs ]
+    remaining = {}                             # (config idx, rung) -> no. unfinished targets
+    pending = []                               # (config idx, rung, target idx)
+
+    def next_config():
+        # promotions first, higher rungs first
+        for rung in reversed(range(len(rungs) - 1)):
+            finished = sorted(rung_results[rung], key=lambda config_idx: Leaderboard.key(rung_results[rung][config_idx]))
+            for config_idx in finished[:len(finished) // eta]:
+                if config_idx not in promoted[rung]:
+                    promoted[rung].add(config_idx)
+                    return config_idx, rung + 1
+        if len(featurespace_config_grid) == 0:
+            return None
+        configs.append(featurespace_config_grid.pop())
+        return len(configs) - 1, 0
+
+    leaderboard = Leaderboard(['rung', 'no_targets', 'failed', 'finished', 'median', 'mean'] + list(parameters_variable_grid.keys()))
+    logging.getLogger().addHandler(logging.NullHandler())
 
-                    # words?
-                    words += [ min(feature_space_results['l1']) ]
+    with ProcessPoolExecutor(kwargs['workers'], initializer=init_worker) as executor:
+        futures = {}
+        while True:
+            # keep workers busy
+            while len(futures) < kwargs['workers']:
+                if len(pending) == 0:
+                    candidate = next_config()
+                    if candidate is None:
+                        break
+                    config_idx, rung = candidate
+                    target_idxes = range(rungs[rung - 1] if rung > 0 else 0, rungs[rung])
+                    pending += [ (config_idx, rung, target_idx) for target_idx in target_idxes ]
+                    remaining[(config_idx, rung)] = len(target_idxes)
+                config_idx, rung, target_idx = pending.pop(0)
+                future = executor.submit(run_target, targets[target_idx], configs[config_idx], config['problemspace_config'],
+                                         config['models_dir'], config['submissions_dir'], kwargs['target_timeout'])
+                futures[future] = (config_idx, rung, target_idx)
+            if len(futures) == 0:
+                break
+
+            # wait for targets
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                config_idx, rung, target_idx = futures.pop(future)
+                try:
+                    runs[(config_idx, target_idx)] = future.result()
+                except Exception as e:
+                    runs[(config_idx, target_idx)] = None
+                    print(f"[!] Error for {configs[config_idx]}")
+                    traceback.print_exc()
+                remaining[(config_idx, rung)] -= 1
+                if remaining[(config_idx, rung)] > 0:
+                    continue
+
+                # config finished on rung
+                finished, failed, median, mean = summarize_runs([ runs[(config_idx, target_idx)] for target_idx in range(rungs[rung]) ])
+                result = { key : value for key, value in configs[config_idx].items() if key in parameters_variable_grid }
+                result.update({ 'rung' : rung, 'no_targets' : rungs[rung], 'finished' : finished, 'failed' : failed,
+                                'median' : median, 'mean' : mean })
+                rung_results[rung][config_idx] = result
+                rank = leaderboard.add(result)
+                print(f"\n[+] Finished rung {rung} with rank {rank}: {result}")
+
+                # dump
+                results = leaderboard.dump(kwargs['trials_dir'], kwargs["name"])
+                print(f"\n[+] Hyperparameter Search ({len(configs)} configs started, " + \
+                      ", ".join([ f"{len(r)} @ {no_targets}" for r, no_targets in zip(rung_results, rungs) ]) + " targets)")
+                for line in str(results.head(20)).splitlines():
+                    print(f'    {line}')
 
-                median = int(np.median(words)) if len(words) > 0 else np.inf
-                mean = int(np.mean(words)) if len(words) > 0 else np.inf
-                return finished, failed, median, mean, running_time
 
 def hypersearch(**kwargs):
 
@@ -104,6 +228,11 @@ def hypersearch(**kwargs):
     print(f'    - {"no_targets":<25}: {kwargs["no_targets"]}')
     print(f'    - {"trials_dir":<25}: {kwargs["trials_dir"]}')
     print(f'    - {"timeout":<25}: {kwargs["timeout"]}')
+    print(f'    - {"successive_halving":<25}: {kwargs["successive_halving"]}')
+    if kwargs["successive_halving"]:
+        print(f'      * {"min_targets":<23}: {kwargs["min_targets"]}')
+        print(f'      * {"eta":<23}: {kwargs["eta"]}')
+        print(f'      * {"target_timeout":<23}: {kwargs["target_timeout"]}')
     print(f'    - {"grid":<25}')
     print(f'      * {"beam_width":<23}: {kwargs["beam_width"]}')
     print(f'      * {"step":<23}: {kwargs["step"]}')
@@ -135,6 +264,12 @@ def hypersearch(**kwargs):
             "problem_space_block_features": False,
             "attack_budget": 1,
             "repeat": 0,
+            "pipeline": False,
+            "preamble_format": False,
+            "compile_cache": None,
+            "compile_cache_size": 2048,
+            "scratch_dir": None,
+            "scratch_min_free": 512,
             "text_level": False,
             "encoding_level": False,
             "format_level": False
@@ -177,9 +312,11 @@ def hypersearch(**kwargs):
         "only_feature_space": True,
         "finish_all": False,
         "no_clusters": None,
+        "cluster_method": "ward",
         "transferability": False,
         "all_topics": False,
         "regular_beam_search": False,
+        "morphing": False,
         "only_basic_words": False,
         "baseline": False
     }
@@ -207,8 +344,12 @@ def hypersearch(**kwargs):
     # SEARCH
     #
 
+    if kwargs['successive_halving']:
+        successive_halving(kwargs, config, targets, featurespace_config_grid, parameters_variable_grid)
+        return
+
     logging.getLogger().addHandler(logging.NullHandler())
-    results = pd.DataFrame(columns=['failed', 'finished', 'median', 'mean'] + list(parameters_variable_grid.keys()))
+    leaderboard = Leaderboard(['failed', 'finished', 'median', 'mean', 'running_time'] + list(parameters_variable_grid.keys()))
 
     with ProcessPoolExecutor(kwargs['workers'] // kwargs['workers_per_trial']) as executor:
 
@@ -243,7 +384,7 @@ def hypersearch(**kwargs):
                     result['running_time'] = running_time
                     
                     # save result and get rank
-                    results, rank = append_to_dataframe(results, result)
+                    rank = leaderboard.add(result)
                     print(f"\n[+] Finished with rank {rank}: {result}")
 
                 except Exception as e:
@@ -265,8 +406,7 @@ def hypersearch(**kwargs):
             futures = new_futures
                 
             # dump
-            kwargs['trials_dir'].joinpath(f'{kwargs["name"]}.json').write_text(results.to_json())
-            kwargs['trials_dir'].joinpath(f'{kwargs["name"]}.txt').write_text(results.to_string())
+            results = leaderboard.dump(kwargs['trials_dir'], kwargs["name"])
             print(f"\n[+] Hyperparameter Search ({len(results)} / {grid_size} completed)")
             for line in str(results).splitlines():
                 print(f'    {line}')
@@ -343,6 +483,25 @@ if __name__ == "__main__":
                     default=28800,
                     help='')
 
+    parser.add_argument('--successive_halving', 
+                        action="store_true",
+                        help='Evaluate configs on growing subsets of the targets and only promote the best 1/eta configs')
+
+    parser.add_argument('--min_targets', 
+                        type=int, 
+                        default=8,
+                        help='Number of targets on the first rung (successive halving)')
+
+    parser.add_argument('--eta', 
+                        type=int, 
+                        default=3,
+                        help='Reduction factor between rungs (successive halving)')
+
+    parser.add_argument('--target_timeout', 
+                        type=int, 
+                        default=3600,
+                        help='Timeout per target (successive halving)')
+
 
     # parse and group arguments
     # -> args w/o group are added directly to result dict
@@ -0,0 +1,209 @@
+import collections
+import contextlib
+import fcntl
+import hashlib
+import json
+import os
+import pathlib
+import shutil
+import tempfile
+import typing
+
+
+class CompileCache:
+    """
+    Content-addressed cache of compiled latex projects, shared by all workers (processes) on a host.
+    A compilation is identified by the main document and the content of all project files that pdflatex
+    read (taken from the .fls file of -recorder). For each main document, a manifest lists the
+    dependencies of its known compilations, so that a lookup only needs to hash these files.
+    Hits restore the PDF and the auxiliary files into the project. Entries are evicted in LRU order
+    once the cache exceeds its size. The total size is tracked in a file, so that the entries are only
+    walked if the cache is full.
+    """
+
+    def __init__(self,
+                 cache_dir: pathlib.Path,
+                 max_size_mb: float = 2048,
+                 max_manifest_entries: int = 16):
+        """
+        :param cache_dir: directory of the cache, created if necessary
+        :param max_size_mb: maximum size of all entries in MB
+        :param max_manifest_entries: maximum number of compilations per main document
+        """
+        self.cache_dir: pathlib.Path = cache_dir
+        self.max_size: int = int(max_size_mb * 1024**2)
+        self.max_manifest_entries: int = max_manifest_entries
+        self.stats: typing.Counter[str] = collections.Counter()
+
+        # (device, inode, size, mtime) -> hash, valid across copies of a project that hardlink a file
+        self._file_hashes: typing.Dict[typing.Tuple[int, int, int, int], str] = {}
+
+        for subdir in ['manifests', 'entries', 'tmp']:
+            (self.cache_dir / subdir).mkdir(parents=True, exist_ok=True)
+
+    def __getstate__(self):
+        # hashes are a per-process memo
+        state = self.__dict__.copy()
+        state['_file_hashes'] = {}
+        return state
+
+    @contextlib.contextmanager
+    def _lock(self):
+        with open(self.cache_dir / 'lock', 'a') as lockfile:
+            fcntl.flock(lockfile, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lockfile, fcntl.LOCK_UN)
+
+    def _hash_file(self, projectdir: pathlib.Path, mainfilename: str, relpath: str) -> typing.Optional[str]:
+        try:
+            # files of the main document (e.g., main.tex, main.bbl) are rewritten in place, possibly within
+            # the resolution of mtime => never memoized
+            if pathlib.PurePath(relpath).stem == pathlib.PurePath(mainfilename).stem:
+                return hashlib.sha1((projectdir / relpath).read_bytes()).hexdigest()
+            stat = (projectdir / relpath).stat()
+            memokey = (stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns)
+            if memokey not in self._file_hashes:
+                self._file_hashes[memokey] = hashlib.sha1((projectdir / relpath).read_bytes()).hexdigest()
+            return self._file_hashes[memokey]
+        except OSError:
+            return None
+
+    @staticmethod
+    def _manifest_key(projectdir: pathlib.Path, mainfilename: str) -> str:
+        key = hashlib.sha1(mainfilename.encode())
+        key.update((projectdir / mainfilename).read_bytes())
+        return key.hexdigest()
+
+    def _read_manifest(self, manifestkey: str) -> typing.List[dict]:
+        try:
+            return json.loads((self.cache_dir / 'manifests' / (manifestkey + '.json')).read_text())
+        except (OSError, ValueError):
+            return []
+
+    @staticmethod
+    def read_recorder_file(projectdir: pathlib.Path,
+                           mainfilename: str) -> typing.Tuple[typing.Set[str], typing.Set[str]]:
+        """
+        Parse the .fls file of the last pdflatex run.
+        :return: (input files, output files) inside the project as relative paths
+        """
+        inputs: typing.Set[str] = set()
+        outputs: typing.Set[str] = set()
+        projectdir = projectdir.resolve()
+        flsfile: pathlib.Path = projectdir / (pathlib.Path(mainfilename).stem + '.fls')
+        for line in flsfile.read_text(errors='ignore').splitlines():
+            kind, _, filepath = line.partition(' ')
+            if kind not in ['INPUT', 'OUTPUT']:
+                continue
+            path: pathlib.Path = (projectdir / filepath).resolve()
+            # files outside the project (tex distribution, formats) are assumed to be static
+            if projectdir not in path.parents:
+                continue
+            (inputs if kind == 'INPUT' else outputs).add(path.relative_to(projectdir).as_posix())
+        # generated files are not part of the key, the result does not depend on the state of a previous compilation
+        return inputs - outputs, outputs
+
+    def lookup(self, projectdir: pathlib.Path, mainfilename: str) -> bool:
+        """
+        Restore a cached compilation into the project.
+        :return: true if the cache contained the compilation
+        """
+        manifestkey: str = self._manifest_key(projectdir, mainfilename)
+        for manifestentry in reversed(self._read_manifest(manifestkey)):
+            if any(self._hash_file(projectdir, mainfilename, relpath) != filehash for relpath, filehash in manifestentry['inputs'].items()):
+                continue
+            entrydir: pathlib.Path = self.cache_dir / 'entries' / manifestentry['entry']
+            try:
+                for relpath in manifestentry['outputs']:
+                    # never write in-place, the file might be a hardlink shared with other copies of the project
+                    (projectdir / relpath).unlink(missing_ok=True)
+                    shutil.copyfile(entrydir / relpath, projectdir / relpath)
+                os.utime(entrydir)
+            except OSError:
+                # evicted in the meantime
+                continue
+            self.stats['hits'] += 1
+            return True
+
+        self.stats['misses'] += 1
+        return False
+
+    def store(self, projectdir: pathlib.Path, mainfilename: str) -> None:
+        """
+        Add the last compilation of the project to the cache. The project must have been compiled w/ -recorder.
+        """
+        inputs, outputs = self.read_recorder_file(projectdir, mainfilename)
+        inputhashes: typing.Dict[str, typing.Optional[str]] = {relpath: self._hash_file(projectdir, mainfilename, relpath)
+                                                                 for relpath in sorted(inputs)}
+        outputs = {relpath for relpath in outputs if (projectdir / relpath).is_file()}
+        manifestkey: str = self._manifest_key(projectdir, mainfilename)
+        entryname: str = hashlib.sha1(json.dumps([manifestkey, inputhashes], sort_keys=True).encode()).hexdigest()
+
+        # entries are immutable, written to a temp dir first and renamed into place
+        entrydir: pathlib.Path = self.cache_dir / 'entries' / entryname
+        entrysize: int = 0
+        if not entrydir.exists():
+            tmpdir: pathlib.Path = pathlib.Path(tempfile.mkdtemp(dir=self.cache_dir / 'tmp'))
+            for relpath in outputs:
+                (tmpdir / relpath).parent.mkdir(parents=True, exist_ok=True)
+                shutil.copyfile(projectdir / relpath, tmpdir / relpath)
+                entrysize += (tmpdir / relpath).stat().st_size
+            try:
+                os.rename(tmpdir, entrydir)
+            except OSError:
+                entrysize = 0
+                # stored by another worker concurrently
+                shutil.rmtree(tmpdir, ignore_errors=True)
+        self.stats['stores'] += 1
+
+        with self._lock():
+            manifest: typing.List[dict] = [manifestentry for manifestentry in self._read_manifest(manifestkey)
+                                           if manifestentry['entry'] != entryname]
+            manifest.append({'inputs': inputhashes, 'outputs': sorted(outputs), 'entry': entryname})
+            manifestfile: pathlib.Path = self.cache_dir / 'manifests' / (manifestkey + '.json')
+            tmpfile: pathlib.Path = self.cache_dir / 'tmp' / (manifestkey + f'.{os.getpid()}.json')
+            tmpfile.write_text(json.dumps(manifest[-self.max_manifest_entries:]))
+            os.replace(tmpfile, manifestfile)
+
+            totalsize: typing.Optional[int] = self._read_size()
+            # w/o a size file, the new entry is included in the walk
+            totalsize = self.size() if totalsize is None else totalsize + entrysize
+            if totalsize > self.max_size:
+                totalsize = self._evict()
+            self._write_size(totalsize)
+
+    def size(self) -> int:
+        return sum(f.stat().st_size for f in (self.cache_dir / 'entries').rglob('*') if f.is_file())
+
+    def _read_size(self) -> typing.Optional[int]:
+        try:
+            return int((self.cache_dir / 'size').read_text())
+        except (OSError, ValueError):
+            return None
+
+    def _write_size(self, totalsize: int) -> None:
+        tmpfile: pathlib.Path = self.cache_dir / 'tmp' / f'size.{os.getpid()}'
+        tmpfile.write_text(str(totalsize))
+        os.replace(tmpfile, self.cache_dir / 'size')
+
+    def _evict(self) -> int:
+        """
+        Remove the least recently used entries (lookups touch their entry) until the cache fits its size.
+        Must be called while holding the lock.
+        :return: size of the remaining entries
+        """
+        entries = []
+        for entrydir in (self.cache_dir / 'entries').iterdir():
+            with contextlib.suppress(OSError):
+                entries.append((entrydir.stat().st_mtime, entrydir,
+                                sum(f.stat().st_size for f in entrydir.rglob('*') if f.is_file())))
+        totalsize: int = sum(entrysize for _, _, entrysize in entries)
+        for _, entrydir, entrysize in sorted(entries):
+            if totalsize <= self.max_size:
+                break
+            shutil.rmtree(entrydir, ignore_errors=True)
+            totalsize -= entrysize
+            self.stats['evictions'] += 1
+        return totalsize
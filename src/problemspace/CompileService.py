@@ -0,0 +1,178 @@
+import collections
+import itertools
+import json
+import os
+import pathlib
+import queue
+import socket
+import socketserver
+import subprocess
+import threading
+import time
+import typing
+
+# priority lanes, lower values are served first
+PRIORITY_FINAL: int = 0
+PRIORITY_EXPLORATORY: int = 1
+LANES: typing.Dict[int, str] = {PRIORITY_FINAL: 'final', PRIORITY_EXPLORATORY: 'exploratory'}
+
+
+def _completed_process(cmd: typing.List[str], timeout: float, result: dict) -> subprocess.CompletedProcess:
+    # same interface as subprocess.run, i.e., timeouts raise subprocess.TimeoutExpired
+    if result['timeout']:
+        raise subprocess.TimeoutExpired(cmd, timeout)
+    return subprocess.CompletedProcess(cmd, result['returncode'],
+                                       result['stdout'].encode('latin-1'), result['stderr'].encode('latin-1'))
+
+
+class CompileService:
+    """
+    Runs the pdflatex and bibtex commands of all workers with bounded concurrency, so that compile bursts
+    do not oversubscribe the host. Commands are queued in priority lanes: compilations that finish a
+    problem-space step (final) are served before the compilations of single transformers (exploratory).
+    The service is used in-process via run() or by other processes via a CompileClient on its Unix socket.
+    """
+
+    def __init__(self,
+                 workers: int,
+                 socket_path: typing.Optional[pathlib.Path] = None):
+        """
+        :param workers: maximum number of commands that run concurrently
+        :param socket_path: if given, the service accepts commands of CompileClients on this Unix socket
+        """
+        self.workers: int = workers
+        self.socket_path: typing.Optional[pathlib.Path] = socket_path
+
+        self._jobs: queue.PriorityQueue = queue.PriorityQueue()
+        self._order = itertools.count()  # FIFO within a lane
+        self._lock = threading.Lock()
+        self._threads: typing.List[threading.Thread] = []
+        self._server: typing.Optional[socketserver.ThreadingUnixStreamServer] = None
+
+        self.stats: typing.Dict[str, typing.Counter[str]] = {lane: collections.Counter() for lane in LANES.values()}
+        self.times: typing.Dict[str, typing.Dict[str, float]] = {lane: {'wait': 0., 'run': 0.} for lane in LANES.values()}
+
+    def start(self) -> 'CompileService':
+        for _ in range(self.workers):
+            thread = threading.Thread(target=self._work, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+        if self.socket_path is not None:
+            if self.socket_path.exists():
+                self.socket_path.unlink()
+            self._server = socketserver.ThreadingUnixStreamServer(str(self.socket_path), _RequestHandler)
+            self._server.daemon_threads = True
+            self._server.service = self
+            threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def close(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self.socket_path.unlink(missing_ok=True)
+        for _ in self._threads:
+            self._jobs.put((len(LANES), next(self._order), None))
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def __enter__(self) -> 'CompileService':
+        return self.start()
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def _work(self) -> None:
+        while True:
+            priority, _, job = self._jobs.get()
+            if job is None:
+                break
+            lane: str = LANES[priority]
+            started: float = time.time()
+            try:
+                p = subprocess.run(job['cmd'], stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=False,
+                                   timeout=job['timeout'], cwd=job['cwd'], env=job['env'])
+                job['result'] = {'timeout': False, 'returncode': p.returncode,
+                                 'stdout': p.stdout.decode('latin-1'), 'stderr': p.stderr.decode('latin-1')}
+            except subprocess.TimeoutExpired:
+                job['result'] = {'timeout': True}
+            except OSError as e:
+                job['result'] = {'timeout': False, 'returncode': 127, 'stdout': '', 'stderr': str(e)}
+            with self._lock:
+                self.stats[lane]['timeouts' if job['result']['timeout'] else
+                                 'completed' if job['result']['returncode'] == 0 else 'failed'] += 1
+                self.times[lane]['wait'] += started - job['submitted']
+                self.times[lane]['run'] += time.time() - started
+            job['done'].set()
+
+    def execute(self, cmd: typing.List[str], cwd: str, env: typing.Optional[typing.Dict[str, str]],
+                timeout: float, priority: int) -> dict:
+        """
+        Queue command and wait for its result (as dict, cf. CompileClient).
+        """
+        job = {'cmd': cmd, 'cwd': cwd, 'env': env, 'timeout': timeout, 'submitted': time.time(),
+               'done': threading.Event(), 'result': None}
+        with self._lock:
+            self.stats[LANES[priority]]['submitted'] += 1
+        self._jobs.put((priority, next(self._order), job))
+        job['done'].wait()
+        return job['result']
+
+    def run(self, cmd: typing.List[str], cwd: str, env: typing.Optional[typing.Dict[str, str]] = None,
+            timeout: float = 600, priority: int = PRIORITY_EXPLORATORY) -> subprocess.CompletedProcess:
+        return _completed_process(cmd, timeout, self.execute(cmd, cwd, env, timeout, priority))
+
+    def metrics(self) -> typing.Dict[str, typing.Dict[str, float]]:
+        """
+        :return: per lane, the counts of commands and their average waiting and running times in seconds
+        """
+        with self._lock:
+            metrics = {}
+            for lane in LANES.values():
+                finished: int = self.stats[lane]['completed'] + self.stats[lane]['failed'] + self.stats[lane]['timeouts']
+                metrics[lane] = dict(self.stats[lane],
+                                     avg_wait=self.times[lane]['wait'] / max(finished, 1),
+                                     avg_run=self.times[lane]['run'] / max(finished, 1))
+            return metrics
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    # one request (JSON line) per connection
+
+    def handle(self) -> None:
+        request: dict = json.loads(self.rfile.readline())
+        if request.get('metrics', False):
+            response = self.server.service.metrics()
+        else:
+            response = self.server.service.execute(request['cmd'], request['cwd'], request['env'],
+                                                   request['timeout'], request['priority'])
+        self.wfile.write(json.dumps(response).encode() + b'\n')
+
+
+class CompileClient:
+    """
+    Submits commands to a CompileService of another process. Has the same interface as the service,
+    but can be pickled, i.e., passed to worker processes.
+    """
+
+    def __init__(self, socket_path: pathlib.Path):
+        self.socket_path: pathlib.Path = socket_path
+
+    def _request(self, request: dict) -> dict:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(str(self.socket_path))
+            sock.sendall(json.dumps(request).encode() + b'\n')
+            with sock.makefile('rb') as response:
+                return json.loads(response.readline())
+
+    def run(self, cmd: typing.List[str], cwd: str, env: typing.Optional[typing.Dict[str, str]] = None,
+            timeout: float = 600, priority: int = PRIORITY_EXPLORATORY) -> subprocess.CompletedProcess:
+        # environment of the caller, as the service might run w/ a different one
+        result: dict = self._request({'cmd': cmd, 'cwd': cwd, 'env': env if env is not None else dict(os.environ),
+                                      'timeout': timeout, 'priority': priority})
+        return _completed_process(cmd, timeout, result)
+
+    def metrics(self) -> typing.Dict[str, typing.Dict[str, float]]:
+        return self._request({'metrics': True})
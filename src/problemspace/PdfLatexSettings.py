@@ -0,0 +1,61 @@
+import pathlib
+import typing
+
+from problemspace.CompileCache import CompileCache
+from problemspace.CompileService import CompileClient, CompileService
+
+
+class PdfLatexSettings:
+    """
+    Settings we can pass to PdfLatexSource to control how latex projects are compiled.
+    """
+
+    def __init__(self,
+                 max_passes: int = 3,
+                 draftmode: bool = True,
+                 preamble_format: bool = False,
+                 format_dir: typing.Optional[pathlib.Path] = None,
+                 max_formats: int = 8,
+                 compile_cache: typing.Optional[CompileCache] = None,
+                 copy_on_write: bool = True,
+                 scratch_dir: typing.Optional[pathlib.Path] = None,
+                 scratch_min_free_mb: float = 512,
+                 compile_service: typing.Optional[typing.Union[CompileService, CompileClient]] = None):
+        """
+        :param max_passes: maximum number of pdflatex passes per compilation. Passes stop earlier
+        as soon as the auxiliary files (aux, toc, bbl, ...) do not change anymore.
+        :param draftmode: if true, the first pass of a project without aux file runs in draft mode,
+        i.e., pdflatex only writes the auxiliary files but skips images and the PDF output.
+        :param preamble_format: if true, the preamble of the main document is precompiled into a format
+        file (mylatexformat), so that later compilations do not need to process the preamble again.
+        The format is rebuilt automatically if the preamble (or a project file read by it) changes.
+        :param format_dir: directory for the format files, shared by all copies of a project.
+        If None, a directory in the scratch dir is used.
+        :param max_formats: number of formats kept per preamble (i.e., for different files read by the preamble),
+        the least recently used ones are removed. Formats of other preambles are never removed, as the format dir
+        is shared by all workers.
+        :param compile_cache: if given, compilations are looked up in and added to this cache.
+        :param copy_on_write: if true, copies of a project hardlink immutable assets (figures, styles, ...)
+        instead of copying them. Files that are modified (main document, auxiliary files, PDF) are always copied.
+        Linked assets are shared with the original project and must never be written in place, i.e.,
+        unlink such a file before writing a new version of it.
+        :param scratch_dir: root of the temporary directories of copied projects, e.g. /dev/shm.
+        If None, the default temp dir is used.
+        :param scratch_min_free_mb: if a copy would leave less free space (in MB) in the scratch dir,
+        the copy is created in the default temp dir instead.
+        :param compile_service: if given, pdflatex and bibtex run via this service (in-process or a client
+        of a shared service) instead of being started directly.
+        """
+        if max_passes < 1:
+            raise ValueError("At least one pdflatex pass is required, got {}".format(max_passes))
+
+        self.max_passes = max_passes
+        self.draftmode = draftmode
+        self.preamble_format = preamble_format
+        self.format_dir = format_dir
+        self.max_formats = max_formats
+        self.compile_cache = compile_cache
+        self.copy_on_write = copy_on_write
+        self.scratch_dir = scratch_dir
+        self.scratch_min_free_mb = scratch_min_free_mb
+        self.compile_service = compile_service
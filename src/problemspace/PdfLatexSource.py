@@ -1,11 +1,36 @@
+import contextlib
+import hashlib
+import json
+import os
 import pathlib
+import re
 import shutil
 import subprocess
 import sys
 import tempfile
 import typing
 
+from problemspace.CompileCache import CompileCache
+from problemspace.CompileService import PRIORITY_EXPLORATORY
 from problemspace.exceptions.PdfLatexException import PdfLatexException
+from problemspace.PdfLatexSettings import PdfLatexSettings
+
+# auxiliary files that pdflatex reads in the next pass, i.e., another pass is only needed if one of them changes
+AUXILIARY_SUFFIXES = ['aux', 'toc', 'lof', 'lot', 'out', 'bbl']
+
+# files that are never written by pdflatex, bibtex, or the transformers, i.e., they can be shared between copies
+# => files named after the main document (e.g. main.pdf or main-figure0.pdf of tikz externalize) are always copied
+IMMUTABLE_SUFFIXES = {'.png', '.jpg', '.jpeg', '.gif', '.eps', '.ps', '.pdf', '.svg', '.tif', '.tiff',
+                      '.cls', '.sty', '.clo', '.bst', '.def', '.ttf', '.otf', '.pfb', '.tfm'}
+
+# warnings of latex and packages that ask for another pass
+RERUN_PATTERN = re.compile(rb'Rerun to get|Please rerun|\(rerunfilecheck\) +Rerun|Rerun LaTeX')
+
+# warning about a full scratch dir is only shown once per process
+_scratch_full_warned: bool = False
+
+# preamble formats that could not be built or used in this process (cf. PdfLatexSettings.preamble_format)
+_failed_formats: typing.Set[str] = set()
 
 
 class PdfLatexSource:
@@ -17,13 +42,15 @@ class PdfLatexSource:
     def __init__(self,
                  latexsourcedir: pathlib.Path,
                  latexmainfilename: str = "main.tex",
-                 tempdir: typing.Optional[tempfile.TemporaryDirectory] = None):
+                 tempdir: typing.Optional[tempfile.TemporaryDirectory] = None,
+                 pdflatexsettings: typing.Optional[PdfLatexSettings] = None):
         """
         Init proxy.
         :param latexsourcedir: directory where latex project is located
         :param latexmainfilename: the name of the main file of the paper, e.g. main.tex
         :param tempdir: if given, it means that the source of the paper is within a temporary directory,
         and if this python object is deleted, then the temporary directory will also be cleaned.
+        :param pdflatexsettings: settings for compiling the project, if None, the default settings are used.
         """
 
         if not latexsourcedir.exists():
@@ -41,6 +68,14 @@ class PdfLatexSource:
         if tempdir is not None:
             self.tempdir = tempdir
 
+        self.pdflatexsettings: PdfLatexSettings = pdflatexsettings if pdflatexsettings is not None else PdfLatexSettings()
+        # number of pdflatex passes of the last compilation
+        self.last_compile_passes: int = 0
+        # incremented whenever the PDF might change, i.e., data extracted from the PDF is valid as long as the version is the same
+        self.pdf_version: int = 0
+        # size of the project on disk, computed once and passed on to copies (cf. _scratch_root)
+        self._project_size: typing.Optional[int] = None
+
         self._maindoc = self._read_latex()
 
     def __del__(self):
@@ -73,34 +108,249 @@ class PdfLatexSource:
         Create a copy of this object (includes copying the latex project on the disk to a temporary directory).
         :return: copy of current PdfLatexSource object.
         """
-        tempdir = tempfile.TemporaryDirectory()
+        tempdir = tempfile.TemporaryDirectory(dir=self._scratch_root())
         newlatexsourcedir: pathlib.Path = pathlib.Path(tempdir.name)
 
-        shutil.copytree(self._latexsourcedir, newlatexsourcedir / self._latexsourcedir.name)
+        if self.pdflatexsettings.copy_on_write:
+            shutil.copytree(self._latexsourcedir, newlatexsourcedir / self._latexsourcedir.name,
+                            copy_function=self._link_or_copy)
+        else:
+            shutil.copytree(self._latexsourcedir, newlatexsourcedir / self._latexsourcedir.name)
         newpdflatexsource: PdfLatexSource = PdfLatexSource(latexsourcedir=newlatexsourcedir / self._latexsourcedir.name,
                                                            latexmainfilename=self._latexmainfilename,
-                                                           tempdir=tempdir)
+                                                           tempdir=tempdir,
+                                                           pdflatexsettings=self.pdflatexsettings)
+        # the copy has the same PDF
+        newpdflatexsource.pdf_version = self.pdf_version
+        newpdflatexsource._project_size = self._project_size
         return newpdflatexsource
 
+    def _scratch_root(self) -> typing.Optional[str]:
+        """
+        Get the root for a temporary copy of this project, i.e., the scratch dir if it has enough free space.
+        :return: directory or None for the default temp dir
+        """
+        scratchdir: typing.Optional[pathlib.Path] = self.pdflatexsettings.scratch_dir
+        if scratchdir is None:
+            return None
+
+        # upper bound, hardlinked assets do not need space if the project is already in the scratch dir
+        # => estimated once per project, the edits of an attack hardly change its size
+        if self._project_size is None:
+            self._project_size = sum(f.stat().st_size for f in self._latexsourcedir.rglob('*') if f.is_file())
+        projectsize: int = self._project_size
+        try:
+            freespace: int = shutil.disk_usage(scratchdir).free
+        except OSError:
+            freespace = 0
+        if freespace - projectsize < self.pdflatexsettings.scratch_min_free_mb * 1024**2:
+            global _scratch_full_warned
+            if not _scratch_full_warned:
+                print(f"Scratch dir {scratchdir} is (nearly) full, temporary projects fall back to {tempfile.gettempdir()}",
+                      file=sys.stderr)
+                _scratch_full_warned = True
+            return None
+        return str(scratchdir)
+
+    def _link_or_copy(self, src: str, dst: str) -> str:
+        # hardlinks share the inode, so that they must never be written in-place
+        # => only immutable assets are linked, everything else is copied
+        srcpath: pathlib.Path = pathlib.Path(src)
+        if srcpath.suffix.lower() in IMMUTABLE_SUFFIXES and \
+                not srcpath.name.startswith(pathlib.Path(self._latexmainfilename).stem):
+            try:
+                os.link(src, dst)
+                return dst
+            except OSError:
+                pass  # e.g. different file systems
+        return shutil.copy2(src, dst)
+
     def copy_project_for_debugging(self, targetdir: pathlib.Path):
         newlatexsourcedir = targetdir
         shutil.copytree(self._latexsourcedir, newlatexsourcedir / self._latexsourcedir.name)
         newpdflatexsource: PdfLatexSource = PdfLatexSource(latexsourcedir=newlatexsourcedir / self._latexsourcedir.name,
                                                            latexmainfilename=self._latexmainfilename,
-                                                           tempdir=None)
+                                                           tempdir=None,
+                                                           pdflatexsettings=self.pdflatexsettings)
         return newpdflatexsource
 
 
-    def runpdflatex(self) -> None:
+    def _hash_auxiliary_files(self) -> typing.Dict[str, typing.Optional[str]]:
+        hashes: typing.Dict[str, typing.Optional[str]] = {}
+        for suffix in AUXILIARY_SUFFIXES:
+            auxfile: pathlib.Path = self.get_maindocument_tempfile(suffix=suffix)
+            hashes[suffix] = hashlib.sha1(auxfile.read_bytes()).hexdigest() if auxfile.exists() else None
+        return hashes
+
+    def _rerun_requested(self) -> bool:
+        # e.g. "Label(s) may have changed. Rerun to get cross-references right." by latex or packages
+        # => only the warnings, as "Rerun" also appears in banners, e.g. "Rerun checks for auxiliary files"
+        logfile: pathlib.Path = self.get_maindocument_tempfile(suffix="log")
+        return logfile.exists() and RERUN_PATTERN.search(logfile.read_bytes()) is not None
+
+    def _run(self, cmd: typing.List[str], priority: int,
+             env: typing.Optional[typing.Dict[str, str]] = None) -> subprocess.CompletedProcess:
+        # commands run via the compile service if given, otherwise directly
+        compileservice = self.pdflatexsettings.compile_service
+        if compileservice is not None:
+            return compileservice.run(cmd, cwd=str(self._latexsourcedir), env=env, timeout=600, priority=priority)
+        return subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=False, timeout=600,
+                              cwd=str(self._latexsourcedir), env=env)
+
+    def _hash_project_file(self, relpath: str) -> typing.Optional[str]:
+        projectfile: pathlib.Path = self._latexsourcedir / relpath
+        return hashlib.sha1(projectfile.read_bytes()).hexdigest() if projectfile.is_file() else None
+
+    def _preamble_format(self, priority: int) -> typing.Optional[typing.Tuple[pathlib.Path, str]]:
+        """
+        Get the precompiled format of the preamble, build it if necessary.
+        A format is identified by the hash of the preamble and the local cls/sty files, and the hashes of all
+        project files read while it was built (e.g. macros in the preamble via \\input), so that any change of
+        the preamble (e.g. additional packages for debug coloring) or its files leads to a new format.
+        :return: (directory, name) of format or None if no format is available
+        """
+        maindoc: str = self._read_latex()
+        preambleend: int = maindoc.find('\\begin{document}')
+        if preambleend == -1:
+            return None
+
+        key = hashlib.sha1(maindoc[:preambleend].encode())
+        for localfile in sorted(self._latexsourcedir.glob('*.cls')) + sorted(self._latexsourcedir.glob('*.sty')):
+            key.update(localfile.name.encode())
+            key.update(localfile.read_bytes())
+        basename: str = 'preamble-' + key.hexdigest()[:20]
+        if basename in _failed_formats:
+            return None
+
+        formatdir: pathlib.Path = self.pdflatexsettings.format_dir if self.pdflatexsettings.format_dir is not None \
+            else pathlib.Path(self.pdflatexsettings.scratch_dir or tempfile.gettempdir()) / 'pdflatex-formats'
+
+        # formats w/ the same preamble, but possibly different project files
+        for depsfile in sorted(formatdir.glob(basename + '-*.json')):
+            formatname: str = depsfile.stem
+            formatfile: pathlib.Path = formatdir / (formatname + '.fmt')
+            if formatname in _failed_formats or not formatfile.exists():
+                continue
+            try:
+                dependencies: typing.Dict[str, str] = json.loads(depsfile.read_text())
+            except (OSError, ValueError):
+                continue
+            if all(self._hash_project_file(relpath) == filehash for relpath, filehash in dependencies.items()):
+                with contextlib.suppress(OSError):
+                    os.utime(formatfile)  # recently used, cf. _prune_formats
+                return formatdir, formatname
+
+        # dump format w/ mylatexformat, i.e., everything until \\begin{document}
+        # => unique job name, as other processes might build the same format concurrently
+        jobname: str = f'{basename}-{os.getpid()}'
+        cmd = ['pdflatex', '-ini', '-interaction=nonstopmode', '-recorder', f'-jobname={jobname}', '&pdflatex',
+               'mylatexformat.ltx', self._latexmainfilename]
+        p = self._run(cmd, priority=priority)
+        builtformat: pathlib.Path = self._latexsourcedir / (jobname + '.fmt')
+        (self._latexsourcedir / (jobname + '.log')).unlink(missing_ok=True)
+        flsfile: pathlib.Path = self._latexsourcedir / (jobname + '.fls')
+        if p.returncode != 0 or not builtformat.exists() or not flsfile.exists():
+            builtformat.unlink(missing_ok=True)
+            flsfile.unlink(missing_ok=True)
+            _failed_formats.add(basename)
+            return None
+
+        # project files read by the preamble, except for the main document (its preamble is part of the name)
+        inputs, _ = CompileCache.read_recorder_file(self._latexsourcedir, jobname)
+        flsfile.unlink()
+        inputs.discard(self._latexmainfilename)
+        dependencies = {relpath: self._hash_project_file(relpath) for relpath in sorted(inputs)}
+        formatname = basename + '-' + hashlib.sha1(json.dumps(dependencies, sort_keys=True).encode()).hexdigest()[:12]
+
+        formatdir.mkdir(parents=True, exist_ok=True)
+        shutil.move(str(builtformat), str(formatdir / builtformat.name))
+        os.replace(formatdir / builtformat.name, formatdir / (formatname + '.fmt'))
+        # the format is only found once its dependencies are written
+        depsfile = formatdir / f'{jobname}.json.tmp'
+        depsfile.write_text(json.dumps(dependencies, sort_keys=True))
+        os.replace(depsfile, formatdir / (formatname + '.json'))
+
+        self._prune_formats(formatdir, basename)
+        return formatdir, formatname
+
+    def _prune_formats(self, formatdir: pathlib.Path, basename: str) -> None:
+        # keep the most recently used formats only, a format is several MB (and the format dir might be in memory)
+        # => only formats of the same preamble, as the format dir is shared by all workers (and submissions)
+        formats = []
+        for formatfile in formatdir.glob(basename + '-*.fmt'):
+            with contextlib.suppress(OSError):
+                formats.append((formatfile.stat().st_mtime, formatfile))
+        for _, formatfile in sorted(formats, reverse=True)[self.pdflatexsettings.max_formats:]:
+            formatfile.with_suffix('.json').unlink(missing_ok=True)
+            formatfile.unlink(missing_ok=True)
+
+    def runpdflatex(self, priority: int = PRIORITY_EXPLORATORY) -> None:
         """
         Compile latex document on the disk.
+        Instead of a fixed number of passes, pdflatex is re-run only as long as the auxiliary files change
+        (or a package requests a rerun), up to pdflatexsettings.max_passes. Most modifications such as
+        a replaced word do not change any references, so that a single pass suffices if the project was
+        compiled before. A project without aux file starts with a (faster) draft pass.
+        If enabled, the passes use the precompiled format of the preamble, and
+        compilations are restored from the compile cache if the project was compiled before.
+        :param priority: lane of the compile service (cf. CompileService), final compilations of an attack step
+        should use PRIORITY_FINAL.
         """
 
+        self.pdf_version += 1
+
+        compilecache = self.pdflatexsettings.compile_cache
+        if compilecache is not None and compilecache.lookup(self._latexsourcedir, self._latexmainfilename):
+            self.last_compile_passes = 0
+            return
+
+        self._runpdflatex_uncached(priority=priority)
+
+        if compilecache is not None:
+            compilecache.store(self._latexsourcedir, self._latexmainfilename)
+
+    def _runpdflatex_uncached(self, priority: int) -> None:
+
+        preambleformat = self._preamble_format(priority=priority) if self.pdflatexsettings.preamble_format else None
+        if preambleformat is None:
+            self._runpdflatex_passes(preambleformat=None, priority=priority)
+            return
+
+        try:
+            self._runpdflatex_passes(preambleformat=preambleformat, priority=priority)
+        except PdfLatexException:
+            if not (preambleformat[0] / (preambleformat[1] + '.fmt')).exists():
+                # the format was removed in the meantime (e.g. pruned by another process), it is not broken
+                self._runpdflatex_passes(preambleformat=None, priority=priority)
+                return
+            # the format might be the culprit (e.g. a package that does not support being dumped),
+            # so let's compile w/o format and do not use it anymore if this works.
+            _failed_formats.add(preambleformat[1])
+            try:
+                self._runpdflatex_passes(preambleformat=None, priority=priority)
+            except PdfLatexException:
+                _failed_formats.discard(preambleformat[1])
+                raise
+
+    def _runpdflatex_passes(self, preambleformat: typing.Optional[typing.Tuple[pathlib.Path, str]], priority: int) -> None:
+
+        settings: PdfLatexSettings = self.pdflatexsettings
+        draftmode: bool = settings.draftmode and settings.max_passes > 1 and \
+            not self.get_maindocument_tempfile(suffix="aux").exists()
+
+        # format dir is searched first, the trailing separator keeps the default search path
+        env = None if preambleformat is None else dict(os.environ, TEXFORMATS=str(preambleformat[0]) + os.pathsep)
+
+        self.last_compile_passes = 0
         try:
-            cmd = ['pdflatex', '-interaction', 'nonstopmode', self._latexmainfilename]
-            for i in range(2):  # run twice for pdflatex due to references, ...
-                p = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=False, timeout=600,
-                                   cwd=str(self._latexsourcedir))
+            while True:
+                # -recorder lists the files read and written by pdflatex (cf. CompileCache)
+                cmd = ['pdflatex', '-interaction', 'nonstopmode'] + (['-draftmode'] if draftmode else []) + \
+                      ([f'-fmt={preambleformat[1]}'] if preambleformat is not None else []) + \
+                      (['-recorder'] if settings.compile_cache is not None else []) + [self._latexmainfilename]
+                hashes_before = self._hash_auxiliary_files()
+                p = self._run(cmd, priority=priority, env=env)
+                self.last_compile_passes += 1
                 output, err = p.stdout, p.stderr
                 # if err != b'':
                 # 'mismatch between font type and embedded font', for example, causes an uncritical stderr output.
@@ -111,15 +361,23 @@ class PdfLatexSource:
                     raise PdfLatexException(
                         f'Pdflatex: Executing error {p.returncode} with command: {" ".join(cmd)}')
 
+                # a draft pass never writes the PDF, so at least one more pass is required
+                if draftmode:
+                    draftmode = False
+                    continue
+                if self._hash_auxiliary_files() == hashes_before and not self._rerun_requested():
+                    break
+                if self.last_compile_passes >= settings.max_passes:
+                    break
+
         finally:
             pass
 
-    def runbibtex(self) -> None:
+    def runbibtex(self, priority: int = PRIORITY_EXPLORATORY) -> None:
         try:
             cmd = ['bibtex', pathlib.Path(self._latexmainfilename).stem + ".aux"]
             for i in range(1):  # run twice for pdflatex due to references, ...
-                p = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=False, timeout=600,
-                                   cwd=str(self._latexsourcedir))
+                p = self._run(cmd, priority=priority)
                 output, err = p.stdout, p.stderr
                 if err != b'':
                     raise PdfLatexException(
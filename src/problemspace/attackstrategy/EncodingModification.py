@@ -1,5 +1,6 @@
 from typing import Optional
 
+from problemspace.CompileService import PRIORITY_FINAL
 from problemspace.transformers.LogSettings import LogSettings
 from problemspace.attackstrategy.GenericModification import GenericModification
 from problemspace.transformers.HomoglyphTransformer import HomoglyphTransformer
@@ -34,7 +35,7 @@ class EncodingModification(GenericModification):
         # B. Final source w/ all changes
         adv_pdflatexsource = transfstate.pdflatexsource
         # compile and return pdf
-        adv_pdflatexsource.runpdflatex()
+        adv_pdflatexsource.runpdflatex(priority=PRIORITY_FINAL)
 
         if self.modifier is not None:
             return self.modifier.perform_attack(transfstate=transfstate, seed=seed)
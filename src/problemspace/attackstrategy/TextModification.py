@@ -2,6 +2,7 @@ import pathlib
 import time
 from typing import Optional
 
+from problemspace.CompileService import PRIORITY_FINAL
 from problemspace.transformers.LogSettings import LogSettings
 from problemspace.attackstrategy.GenericModification import GenericModification
 from problemspace.transformers.TransformationState import TransformationState
@@ -133,7 +134,7 @@ class TextModification(GenericModification):
         # B. final source w/ all changes
         adv_pdflatexsource = transfstate.pdflatexsource
         # compile and return pdf
-        adv_pdflatexsource.runpdflatex()
+        adv_pdflatexsource.runpdflatex(priority=PRIORITY_FINAL)
 
         if self.modifier is not None:
             return self.modifier.perform_attack(transfstate=transfstate, seed=seed)
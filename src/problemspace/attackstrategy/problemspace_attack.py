@@ -8,9 +8,6 @@ from problemspace.transformers.LogSettings import LogSettings
 from problemspace.transformers.TransformationState import TransformationState
 from problemspace.attackstrategy.ProblemSpaceAttackStrategy import ProblemSpaceAttackStrategy
 from problemspace.attackstrategy.GenericModification import GenericModification
-from problemspace.attackstrategy.FormatModification import FormatModification
-from problemspace.attackstrategy.TextModification import TextModification
-from problemspace.attackstrategy.EncodingModification import EncodingModification
 from problemspace.attackstrategy.RequestedChanges import RequestedChanges
 from problemspace.attackstrategy.AttackSettings import AttackSettings
 from problemspace.attackstrategy.Budgeting.ProblemSpaceCostBudgetManager import CostBudget
@@ -72,19 +69,23 @@ def problemspace_attack(logger: logging.Logger,
     modifiers: typing.List[GenericModification] = []
 
     # if all levels are set, this creates a sequence of text -> encoding -> format
+    # modifications are imported on demand, as their dependencies (e.g., language models) are slow to import
     if config['format_level'] is True:
+        from problemspace.attackstrategy.FormatModification import FormatModification
         modifiers.append(FormatModification(
             logsettings=logsettings,
             attacksettings=attacksettings,
             modifier=None if len(modifiers) == 0 else modifiers[-1]
         ))
     if config['encoding_level'] is True:
+        from problemspace.attackstrategy.EncodingModification import EncodingModification
         modifiers.append(EncodingModification(
             logsettings=logsettings,
             attacksettings=attacksettings,
             modifier=None if len(modifiers) == 0 else modifiers[-1]
         ))
     if config['text_level'] is True:
+        from problemspace.attackstrategy.TextModification import TextModification
         modifiers.append(TextModification(
             logsettings=logsettings,
             attacksettings=attacksettings,
@@ -104,7 +105,7 @@ def problemspace_attack(logger: logging.Logger,
                                 seed=seed)
 
     # Update the blocked features that were cleaned at the very beginning
-    adv_transfstate.probspacerestrictions.update(requested_changes.removed_requested_changes_best)
+    adv_transfstate.add_problemspacerestrictions(words=requested_changes.removed_requested_changes_best)
 
     # 5. Save some results
     if working_dir is not None:
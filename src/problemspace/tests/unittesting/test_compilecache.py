@@ -0,0 +1,66 @@
+import pathlib
+import tempfile
+
+from problemspace.CompileCache import CompileCache
+from problemspace.PdfLatexSettings import PdfLatexSettings
+from problemspace.PdfLatexSource import PdfLatexSource
+from problemspace.tests.unittesting.UnitBaseClass import UnitBaseClass
+from utils.pdf_utils import analyze_words
+
+
+class TestCompileCache(UnitBaseClass):
+
+    def setUp(self):
+        """
+        Runs before any test.
+        """
+        self.setup_all()
+        self.cachedir = tempfile.TemporaryDirectory()
+        self.compilecache = CompileCache(cache_dir=pathlib.Path(self.cachedir.name))
+        path_to_latex_file: pathlib.Path = self.problemspace_path / "tests" / "unittesting" / "unit_latex"
+        self.pdflatexsource: PdfLatexSource = PdfLatexSource(latexsourcedir=path_to_latex_file,
+                                                             latexmainfilename="main.tex",
+                                                             pdflatexsettings=PdfLatexSettings(compile_cache=self.compilecache))
+
+    def tearDown(self):
+        self.cachedir.cleanup()
+
+
+    def test_identical_projects(self):
+        first: PdfLatexSource = self.pdflatexsource.copyto()
+        first.runpdflatex()
+        self.assertEqual(1, self.compilecache.stats['misses'])
+
+        second: PdfLatexSource = self.pdflatexsource.copyto()
+        second.get_maindocument_pdf_path().unlink(missing_ok=True)
+        second.runpdflatex()
+        self.assertEqual(1, self.compilecache.stats['hits'])
+        self.assertEqual(0, second.last_compile_passes)
+
+        word_vector_after: list = analyze_words(pdf_file=second.get_maindocument_pdf_path())
+        UnitBaseClass.check_counts_before_and_after_valuebased(word_vector_before=self.word_vector_before,
+                                                               word_vector_after=word_vector_after,
+                                                               ignore_words={})
+
+
+    def test_modified_project(self):
+        first: PdfLatexSource = self.pdflatexsource.copyto()
+        first.runpdflatex()
+
+        # modified main document
+        second: PdfLatexSource = self.pdflatexsource.copyto()
+        second.save_latex(newmaindoc=second.get_main_document().replace("\\end{document}", "kpqnfop4aatft\n\\end{document}"))
+        second.runpdflatex()
+        self.assertEqual(0, self.compilecache.stats['hits'])
+        self.assertEqual(1, analyze_words(pdf_file=second.get_maindocument_pdf_path()).count("kpqnfop4aatft"))
+
+        # modified input file (the document class is read from the project)
+        third: PdfLatexSource = self.pdflatexsource.copyto()
+        clsfile: pathlib.Path = third.get_filepath_in_dir(filename="IEEEtran.cls")
+        clscontent: str = clsfile.read_text()
+        # the copy hardlinks the document class of the fixture, never write it in place
+        clsfile.unlink()
+        clsfile.write_text(clscontent + "\n% modified\n")
+        third.runpdflatex()
+        self.assertEqual(0, self.compilecache.stats['hits'])
+        self.assertEqual(3, self.compilecache.stats['misses'])
@@ -0,0 +1,127 @@
+import os
+import pathlib
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+from problemspace.CompileService import (LANES, PRIORITY_EXPLORATORY,
+                                         PRIORITY_FINAL, CompileClient,
+                                         CompileService)
+
+
+class TestCompileService(unittest.TestCase):
+    """
+    The service runs arbitrary commands, i.e., python is used instead of pdflatex.
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.tmppath: pathlib.Path = pathlib.Path(self.tmpdir.name)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    @staticmethod
+    def python(code: str) -> list:
+        return [sys.executable, "-c", code]
+
+
+    def test_in_process(self):
+        with CompileService(workers=2) as service:
+            p: subprocess.CompletedProcess = service.run(self.python("import os; print(os.getcwd())"), cwd=self.tmpdir.name)
+            self.assertEqual(0, p.returncode)
+            self.assertEqual(pathlib.Path(p.stdout.decode().strip()).resolve(), self.tmppath.resolve())
+
+            p = service.run(self.python("import sys; sys.stderr.write('error'); sys.exit(3)"), cwd=self.tmpdir.name)
+            self.assertEqual(3, p.returncode)
+            self.assertEqual(b"error", p.stderr)
+
+
+    def test_socket(self):
+        with CompileService(workers=1, socket_path=self.tmppath / "compile.sock") as service:
+            client: CompileClient = CompileClient(socket_path=self.tmppath / "compile.sock")
+            # environment of the caller is passed on
+            os.environ["COMPILE_SERVICE_TEST"] = "kpqnfop4aatft"
+            try:
+                p: subprocess.CompletedProcess = client.run(
+                    self.python("import os; print(os.environ['COMPILE_SERVICE_TEST'])"), cwd=self.tmpdir.name,
+                    priority=PRIORITY_FINAL)
+            finally:
+                del os.environ["COMPILE_SERVICE_TEST"]
+            self.assertEqual(0, p.returncode)
+            self.assertEqual(b"kpqnfop4aatft\n", p.stdout)
+
+            p = client.run(self.python("import sys; sys.exit(1)"), cwd=self.tmpdir.name)
+            self.assertEqual(1, p.returncode)
+
+            self.assertEqual(service.metrics(), client.metrics())
+        self.assertFalse((self.tmppath / "compile.sock").exists())
+
+
+    def test_timeout(self):
+        with CompileService(workers=1, socket_path=self.tmppath / "compile.sock") as service:
+            client: CompileClient = CompileClient(socket_path=self.tmppath / "compile.sock")
+            for runner in [service, client]:
+                with self.assertRaises(subprocess.TimeoutExpired):
+                    runner.run(self.python("import time; time.sleep(10)"), cwd=self.tmpdir.name, timeout=0.2)
+            # the service keeps working after a timeout
+            self.assertEqual(0, service.run(self.python("pass"), cwd=self.tmpdir.name).returncode)
+
+
+    def test_metrics(self):
+        with CompileService(workers=2) as service:
+            service.run(self.python("pass"), cwd=self.tmpdir.name, priority=PRIORITY_FINAL)
+            service.run(self.python("pass"), cwd=self.tmpdir.name)
+            service.run(self.python("import sys; sys.exit(1)"), cwd=self.tmpdir.name)
+            with self.assertRaises(subprocess.TimeoutExpired):
+                service.run(self.python("import time; time.sleep(10)"), cwd=self.tmpdir.name, timeout=0.2)
+            service.run(["/nonexistent/pdflatex"], cwd=self.tmpdir.name)
+            metrics: dict = service.metrics()
+
+        self.assertEqual(1, metrics['final']['submitted'])
+        self.assertEqual(1, metrics['final']['completed'])
+        self.assertEqual(4, metrics['exploratory']['submitted'])
+        self.assertEqual(1, metrics['exploratory']['completed'])
+        # a missing command counts as failed
+        self.assertEqual(2, metrics['exploratory']['failed'])
+        self.assertEqual(1, metrics['exploratory']['timeouts'])
+        self.assertGreaterEqual(metrics['exploratory']['avg_run'], 0.2 / 4)
+
+
+    def test_final_before_exploratory(self):
+        orderfile: pathlib.Path = self.tmppath / "order.txt"
+        gofile: pathlib.Path = self.tmppath / "go"
+
+        def append(name: str) -> list:
+            return self.python(f"open({str(orderfile)!r}, 'a').write({name!r} + '\\n')")
+
+        with CompileService(workers=1) as service:
+            def submit(cmd: list, priority: int) -> threading.Thread:
+                lane: str = LANES[priority]
+                submitted: int = service.metrics()[lane].get('submitted', 0)
+                thread = threading.Thread(target=service.run, args=(cmd, self.tmpdir.name),
+                                          kwargs={'priority': priority})
+                thread.start()
+                # wait until the command is queued
+                while service.metrics()[lane].get('submitted', 0) == submitted:
+                    time.sleep(0.01)
+                return thread
+
+            # the single worker is blocked until all other commands are queued
+            threads = [submit(self.python(f"import os, time\nwhile not os.path.exists({str(gofile)!r}): time.sleep(0.01)"),
+                              PRIORITY_EXPLORATORY)]
+            threads += [submit(append(f"exploratory{i}"), PRIORITY_EXPLORATORY) for i in range(2)]
+            threads += [submit(append(f"final{i}"), PRIORITY_FINAL) for i in range(2)]
+            gofile.touch()
+            for thread in threads:
+                thread.join()
+
+        # FIFO within a lane
+        self.assertEqual(["final0", "final1", "exploratory0", "exploratory1"], orderfile.read_text().split())
+
+
+if __name__ == '__main__':
+    unittest.main()
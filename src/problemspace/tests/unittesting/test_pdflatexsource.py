@@ -0,0 +1,174 @@
+import pathlib
+import tempfile
+
+from problemspace.CompileService import PRIORITY_EXPLORATORY
+from problemspace.PdfLatexSource import PdfLatexSource, _failed_formats
+from problemspace.PdfLatexSettings import PdfLatexSettings
+from problemspace.tests.unittesting.UnitBaseClass import UnitBaseClass
+from problemspace.transformers.TransformationState import TransformationState
+from utils.pdf_utils import analyze_words
+
+
+class TestPdfLatexSource(UnitBaseClass):
+
+    def setUp(self):
+        """
+        Runs before any test.
+        """
+        self.setup_all()
+
+
+    def test_recompile_without_changes(self):
+        # the project was compiled in setUp, nothing changed, so that one pass suffices
+        self.newpdflatexsource.runpdflatex()
+        self.assertEqual(1, self.newpdflatexsource.last_compile_passes)
+
+        word_vector_after: list = analyze_words(pdf_file=self.newpdflatexsource.get_maindocument_pdf_path())
+        UnitBaseClass.check_counts_before_and_after_valuebased(word_vector_before=self.word_vector_before,
+                                                               word_vector_after=word_vector_after,
+                                                               ignore_words={})
+
+
+    def test_fresh_compile_with_draftmode(self):
+        path_to_latex_file: pathlib.Path = self.problemspace_path / "tests" / "unittesting" / "unit_latex"
+        pdflatexsource: PdfLatexSource = PdfLatexSource(latexsourcedir=path_to_latex_file,
+                                                        latexmainfilename="main.tex").copyto()
+        pdflatexsource.get_maindocument_tempfile(suffix="aux").unlink(missing_ok=True)
+        pdflatexsource.get_maindocument_pdf_path().unlink(missing_ok=True)
+
+        pdflatexsource.runpdflatex()
+        # draft pass + at least one pass that writes the PDF
+        self.assertGreaterEqual(pdflatexsource.last_compile_passes, 2)
+        self.assertLessEqual(pdflatexsource.last_compile_passes, pdflatexsource.pdflatexsettings.max_passes)
+        self.assertTrue(pdflatexsource.get_maindocument_pdf_path().exists())
+
+        word_vector_after: list = analyze_words(pdf_file=pdflatexsource.get_maindocument_pdf_path())
+        UnitBaseClass.check_counts_before_and_after_valuebased(word_vector_before=self.word_vector_before,
+                                                               word_vector_after=word_vector_after,
+                                                               ignore_words={})
+
+
+    def test_max_passes(self):
+        path_to_latex_file: pathlib.Path = self.problemspace_path / "tests" / "unittesting" / "unit_latex"
+        pdflatexsource: PdfLatexSource = PdfLatexSource(latexsourcedir=path_to_latex_file,
+                                                        latexmainfilename="main.tex",
+                                                        pdflatexsettings=PdfLatexSettings(max_passes=1)).copyto()
+        pdflatexsource.get_maindocument_tempfile(suffix="aux").unlink(missing_ok=True)
+
+        pdflatexsource.runpdflatex()
+        self.assertEqual(1, pdflatexsource.last_compile_passes)
+        self.assertTrue(pdflatexsource.get_maindocument_pdf_path().exists())
+        # settings are passed on to copies
+        self.assertEqual(1, pdflatexsource.copyto().pdflatexsettings.max_passes)
+
+        with self.assertRaises(ValueError):
+            PdfLatexSettings(max_passes=0)
+
+
+    def test_copy_on_write(self):
+        # setUp's project was compiled, the copy shares the document class but not the outputs
+        newpdflatexsource: PdfLatexSource = self.newpdflatexsource.copyto()
+        for filename, shared in [("IEEEtran.cls", True), ("main.tex", False), ("main.pdf", False), ("main.aux", False)]:
+            self.assertEqual(shared, self.newpdflatexsource.get_filepath_in_dir(filename).samefile(
+                newpdflatexsource.get_filepath_in_dir(filename)))
+
+        newpdflatexsource.save_latex(newmaindoc=newpdflatexsource.get_main_document().replace("\\end{document}", "kpqnfop4aatft\n\\end{document}"))
+        newpdflatexsource.runpdflatex()
+        self.assertEqual(0, analyze_words(pdf_file=self.newpdflatexsource.get_maindocument_pdf_path()).count("kpqnfop4aatft"))
+        self.assertEqual(1, analyze_words(pdf_file=newpdflatexsource.get_maindocument_pdf_path()).count("kpqnfop4aatft"))
+
+
+    def test_words_cache(self):
+        # words of a transformation state are cached per pdf version
+        transformationstate: TransformationState = TransformationState(pdflatexsource=self.newpdflatexsource)
+        words: list = transformationstate.get_words()
+        self.assertEqual(self.word_vector_before, words)
+        cachedwords = transformationstate._words
+
+        # unchanged version: cached, callers get a copy
+        words.append("kpqnfop4aatft")
+        self.assertEqual(self.word_vector_before, transformationstate.get_words())
+        self.assertIs(cachedwords, transformationstate._words)
+
+        # recompilation: new version, words are extracted again
+        pdf_version: int = self.newpdflatexsource.pdf_version
+        self.newpdflatexsource.save_latex(newmaindoc=self.newpdflatexsource.get_main_document().replace("\\end{document}", "kpqnfop4aatft\n\\end{document}"))
+        self.newpdflatexsource.runpdflatex()
+        self.assertEqual(pdf_version + 1, self.newpdflatexsource.pdf_version)
+        self.assertEqual(1, transformationstate.get_words().count("kpqnfop4aatft"))
+        self.assertIsNot(cachedwords, transformationstate._words)
+
+        # copies share the cache of the same pdf version
+        self.assertIs(transformationstate._words, transformationstate.copyto()._words)
+
+
+    def test_rerun_requested(self):
+        logfile: pathlib.Path = self.newpdflatexsource.get_maindocument_tempfile(suffix="log")
+        # the fixture loads hyperref, i.e., the log contains the banner of rerunfilecheck
+        self.assertFalse(self.newpdflatexsource._rerun_requested())
+
+        logfile.write_text("Package: rerunfilecheck 2022/07/10 v1.10 Rerun checks for auxiliary files (HO)\n")
+        self.assertFalse(self.newpdflatexsource._rerun_requested())
+
+        for warning in ["LaTeX Warning: Label(s) may have changed. Rerun to get cross-references right.",
+                        "Package rerunfilecheck Warning: File `main.out' has changed.\n"
+                        "(rerunfilecheck)                Rerun to get outlines right",
+                        "Package biblatex Warning: Please rerun LaTeX."]:
+            logfile.write_text(warning + "\n")
+            self.assertTrue(self.newpdflatexsource._rerun_requested())
+
+
+    def test_preamble_format(self):
+        path_to_latex_file: pathlib.Path = self.problemspace_path / "tests" / "unittesting" / "unit_latex"
+        with tempfile.TemporaryDirectory() as formatdir:
+            settings: PdfLatexSettings = PdfLatexSettings(preamble_format=True, format_dir=pathlib.Path(formatdir),
+                                                          max_formats=2)
+            pdflatexsource: PdfLatexSource = PdfLatexSource(latexsourcedir=path_to_latex_file,
+                                                            latexmainfilename="main.tex",
+                                                            pdflatexsettings=settings).copyto()
+
+            # build
+            preambleformat = pdflatexsource._preamble_format(priority=PRIORITY_EXPLORATORY)
+            self.assertIsNotNone(preambleformat)
+            self.assertTrue((preambleformat[0] / (preambleformat[1] + ".fmt")).exists())
+
+            # reuse by a copy
+            self.assertEqual(preambleformat, pdflatexsource.copyto()._preamble_format(priority=PRIORITY_EXPLORATORY))
+            self.assertEqual(1, len(list(pathlib.Path(formatdir).glob("*.fmt"))))
+
+            # rebuild on a change of the preamble
+            changedsource: PdfLatexSource = pdflatexsource.copyto()
+            changedsource.save_latex(changedsource.get_main_document().replace(
+                "\\begin{document}", "\\input{macros}\n\\begin{document}", 1))
+            changedsource.get_filepath_in_dir("macros.tex").write_text("\\newcommand{\\foo}{foo}\n")
+            macroformat = changedsource._preamble_format(priority=PRIORITY_EXPLORATORY)
+            self.assertNotEqual(preambleformat[1], macroformat[1])
+
+            # rebuild on a change of a file read by the preamble, the same preamble text
+            changedsource.get_filepath_in_dir("macros.tex").write_text("\\newcommand{\\foo}{bar}\n")
+            othermacroformat = changedsource._preamble_format(priority=PRIORITY_EXPLORATORY)
+            self.assertNotEqual(macroformat[1], othermacroformat[1])
+            changedsource.get_filepath_in_dir("macros.tex").write_text("\\newcommand{\\foo}{foo}\n")
+            self.assertEqual(macroformat, changedsource._preamble_format(priority=PRIORITY_EXPLORATORY))
+
+            # compiling w/ the format gives the same words
+            pdflatexsource.runpdflatex()
+            word_vector_after: list = analyze_words(pdf_file=pdflatexsource.get_maindocument_pdf_path())
+            UnitBaseClass.check_counts_before_and_after_valuebased(word_vector_before=self.word_vector_before,
+                                                                   word_vector_after=word_vector_after,
+                                                                   ignore_words={})
+
+            # only the most recently used formats of a preamble are kept, formats of other preambles are not touched
+            changedsource.get_filepath_in_dir("macros.tex").write_text("\\newcommand{\\foo}{baz}\n")
+            self.assertIsNotNone(changedsource._preamble_format(priority=PRIORITY_EXPLORATORY))
+            self.assertEqual(3, len(list(pathlib.Path(formatdir).glob("*.fmt"))))
+            self.assertEqual(3, len(list(pathlib.Path(formatdir).glob("*.json"))))
+            self.assertTrue((preambleformat[0] / (preambleformat[1] + ".fmt")).exists())
+            self.assertTrue((macroformat[0] / (macroformat[1] + ".fmt")).exists())
+            self.assertFalse((othermacroformat[0] / (othermacroformat[1] + ".fmt")).exists())
+
+            # a format removed after its lookup (e.g. by another worker) is not considered broken
+            (preambleformat[0] / (preambleformat[1] + ".fmt")).unlink()
+            pdflatexsource._preamble_format = lambda priority: preambleformat
+            pdflatexsource._runpdflatex_uncached(priority=PRIORITY_EXPLORATORY)
+            self.assertNotIn(preambleformat[1], _failed_formats)
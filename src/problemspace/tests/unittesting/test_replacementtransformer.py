@@ -1,11 +1,15 @@
 from problemspace.tests.unittesting.UnitBaseClass import UnitBaseClass
+from nltk.stem import PorterStemmer
+
 from problemspace.transformers.CommentBoxDelWordTransformer import \
     CommentBoxDelWordTransformer
+from problemspace.transformers.DemandTracker import DemandTracker
+from problemspace.transformers.DocumentIndex import DocumentIndex
 from problemspace.transformers.HomoglyphTransformer import HomoglyphTransformer
 from problemspace.transformers.IgnoredEnvironments import IGNORED_ENVS
 from problemspace.transformers.LogSettings import LogSettings
 from problemspace.transformers.ReplacementTransform import (
-    create_inside_ignored, merge)
+    IntervalIndex, TransformInfo, create_inside_ignored, merge)
 
 
 class TestReplacementTransformer(UnitBaseClass):
@@ -284,3 +288,131 @@ class TestReplacementTransformer(UnitBaseClass):
             check_within_cmd=True)
 
         self.assertEqual(ignored_sections, [(0, 13), (13, 47), (47, 57)])
+
+    def test_interval_index(self):
+        # unsorted, overlapping, nested, and bordering sections
+        sections = [(30, 40), (0, 5), (3, 8), (12, 14), (14, 20), (32, 35), (50, 50)]
+        interval_index = IntervalIndex(sections)
+
+        self.assertEqual(list(zip(interval_index.starts, interval_index.ends)),
+                         [(0, 8), (12, 14), (14, 20), (30, 40), (50, 50)])
+
+        # same result as checking every section
+        for token_start in range(0, 55):
+            for token_end in range(token_start, token_start + 4):
+                expected = any(not (token_end <= s or e <= token_start) for s, e in sections)
+                self.assertEqual(expected, interval_index.overlaps(token_start, token_end))
+
+        inside_ignored = create_inside_ignored(sections)
+        self.assertTrue(inside_ignored(4, 6))
+        self.assertFalse(inside_ignored(8, 12))
+        self.assertFalse(create_inside_ignored([])(0, 1))
+
+    def test_document_index(self):
+        doc = "\\documentclass{article}\n\\begin{document}\n\\begin{abstract}Not this\\end{abstract}\n" \
+              "Some words {and brackets} in here, $$x$$ and more words.\n% a comment\nLast words here\n\\end{document}\n"
+
+        transformer = HomoglyphTransformer(logsettings=LogSettings(), ignored_environments=IGNORED_ENVS)
+        tokenizer = transformer._build_tokenizer()
+        DocumentIndex.clear()
+
+        tokens = list(transformer._iterate_over_document(doc=doc, tokenizer=tokenizer, check_within_cmd=True))
+        self.assertEqual([token for _, _, token in tokens],
+                         ["Some", "words", "in", "here", ",", "and", "more", "words.", "Last", "words", "here"])
+        index = DocumentIndex.for_document(doc)
+        self.assertIs(transformer._get_tokens(index, tokenizer, True, True),
+                      transformer._get_tokens(index, tokenizer, True, True))
+
+        # replacing plain words and adding a package updates the index instead of tokenizing the new document
+        some, words = tokens[0], tokens[1]
+        transforms = [TransformInfo(some[0], some[1], some[2], "", "Many", ""),
+                      TransformInfo(words[0], words[1], words[2], "", "tokens", ""),
+                      TransformInfo(24, 24, "", "", "\\usepackage{xcolor}\n", "")]
+        new_doc = transformer._apply_transforms(doc, transforms)
+        self.assertIsNotNone(DocumentIndex._recent.get(new_doc))
+        updated_tokens = list(transformer._iterate_over_document(doc=new_doc, tokenizer=tokenizer, check_within_cmd=True))
+
+        DocumentIndex.clear()
+        new_tokens = list(transformer._iterate_over_document(doc=new_doc, tokenizer=tokenizer, check_within_cmd=True))
+        self.assertEqual(updated_tokens, new_tokens)
+        self.assertEqual(new_tokens[0][2], "Many")
+
+        # a replacement w/ latex commands is indexed from scratch
+        transforms = [TransformInfo(new_tokens[0][0], new_tokens[0][1], "Many", "", "{\\debugcolor{red}Many}", "")]
+        self.assertIsNone(DocumentIndex._recent.get(transformer._apply_transforms(new_doc, transforms)))
+
+    def _scan_separately(self, doc, content_start, content_end, ignored_environments, ignore_quick_math):
+        comment_sections = list(HomoglyphTransformer._find_comments(doc))
+        is_inside_comment = create_inside_ignored(comment_sections)
+        ignored_env_sections = HomoglyphTransformer._find_ignored_env_sections(
+            doc, content_start, content_end, ignored_environments, ignore_quick_math, is_inside_comment)
+        brackets = HomoglyphTransformer._find_active_brackets(
+            doc, content_start, content_end, create_inside_ignored(ignored_env_sections), is_inside_comment)
+        return comment_sections, ignored_env_sections, brackets
+
+    def test_scan_document(self):
+        docs = [
+            (r"{ignore this} not this $$\{$$ {ignore this} ---- {ignore} \[\{\] {ignore} not this", []),
+            (r"{ignore this} not this $$\{$$ \begin{lstlisting}Some words\end{lstlisting}", ["lstlisting"]),
+            ("{Ignore}% do not parse this -> { \n {Ignore this {and this} too} \n% Ignore }} \n", []),
+            (r"\begin{lstlisting}int foo() {\end{lstlisting} Text{ignored} {Ignore this {and this} too} End.",
+             ["lstlisting"]),
+            (r"begin \begin{comment}\begin{lstlisting}insensitive{\end{comment}\begin{comment}\end{comment} {x}",
+             ["comment", "lstlisting"]),
+            ("a \\\\[5em] b \\$$ c \\\\begin{comment}{x} 50\\% $$ x % $$ \n $$ d $$ %\\begin{comment}\n",
+             ["comment"]),
+        ]
+
+        for doc, ignored_environments in docs:
+            for content_start in [0, 1]:
+                for ignore_quick_math in [False, True]:
+                    self.assertEqual(
+                        HomoglyphTransformer._scan_document(doc, content_start, len(doc), ignored_environments,
+                                                            ignore_quick_math),
+                        self._scan_separately(doc, content_start, len(doc), ignored_environments,
+                                              ignore_quick_math))
+
+        doc = self.newpdflatexsource.get_main_document()
+        content_start = doc.index("\\begin{document}") + len("\\begin{document}")
+        content_end = doc.index("\\end{document}")
+        self.assertEqual(
+            HomoglyphTransformer._scan_document(doc, content_start, content_end, IGNORED_ENVS, True),
+            self._scan_separately(doc, content_start, content_end, IGNORED_ENVS, True))
+
+    def test_demand_tracker(self):
+        wordsdict = {"secur": -2, "attack": 1, "model": 0, "data": -1}
+        demand = DemandTracker(wordsdict, first_letter_prefilter=True)
+
+        self.assertEqual((demand.addition_count, demand.deletion_count), (1, 3))
+        self.assertTrue(demand.wants_deletion("secur") and demand.wants_addition("attack"))
+        self.assertFalse(demand.wants_deletion("model") or demand.wants_deletion("attack"))
+        self.assertFalse(demand.skip_deletion("Security"))
+        self.assertTrue(demand.skip_deletion("model"))
+
+        demand.update("secur", 1)
+        demand.update("secur", 1)
+        demand.update("attack", -1)
+        self.assertEqual((demand.addition_count, demand.deletion_count), (0, 1))
+        self.assertTrue(demand.skip_deletion("security"))
+        self.assertFalse(demand.has_additions())
+        self.assertFalse(demand.is_done())
+
+        demand.update("data", 1)
+        self.assertTrue(demand.is_done())
+        self.assertEqual(wordsdict, {"secur": -2, "attack": 1, "model": 0, "data": -1})
+
+        # skipping tokens before stemming does not change the transforms
+        doc = self.newpdflatexsource.get_main_document()
+        wordsdict = {"use": -3, "the": -2, "of": -5, "paper": -1, "foo": 3}
+
+        class NoPrefilterStemmer(PorterStemmer):
+            pass
+
+        transforms = []
+        for stemmer in [PorterStemmer(), NoPrefilterStemmer()]:
+            transformer = HomoglyphTransformer(logsettings=LogSettings(), ignored_environments=IGNORED_ENVS)
+            found, featuredelta = transformer._find_transforms(
+                doc, wordsdict, stemmer, transformer._build_tokenizer(), {"e": ["\\'e"], "o": ["\\\"o"]})
+            transforms.append(([repr(t) for t in found], featuredelta.changes))
+        self.assertEqual(transforms[0], transforms[1])
+        self.assertGreater(len(transforms[0][0]), 0)
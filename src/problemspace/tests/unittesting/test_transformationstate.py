@@ -0,0 +1,87 @@
+import pathlib
+import unittest
+
+from problemspace.PdfLatexSource import PdfLatexSource
+from problemspace.transformers.FeatureDelta import FeatureDelta
+from problemspace.transformers.TransformationState import TransformationState
+
+
+class TestTransformationState(unittest.TestCase):
+    """
+    Copies of a transformation state share dicts, sets, and histories until they are modified (copy-on-write).
+    """
+
+    def setUp(self):
+        """
+        Runs before any test.
+        """
+        path_to_latex_file: pathlib.Path = pathlib.Path.cwd() / "problemspace" / "tests" / "unittesting" / "unit_latex"
+        pdflatexsource: PdfLatexSource = PdfLatexSource(latexsourcedir=path_to_latex_file, latexmainfilename="main.tex")
+        self.parent: TransformationState = TransformationState(pdflatexsource=pdflatexsource.copyto(),
+                                                               original_wordsdict={'attack': 2, 'paper': -1})
+
+    @staticmethod
+    def delta(**changes) -> FeatureDelta:
+        deltadict: FeatureDelta = FeatureDelta()
+        for word, cnt in changes.items():
+            deltadict[word] = cnt
+        return deltadict
+
+    def test_child_modifications_are_isolated(self):
+        self.parent.update_with_delta(self.delta(attack=1), "SynonymTransformer")
+        child: TransformationState = self.parent.copyto()
+
+        child.update_with_delta(self.delta(attack=1), "SynonymTransformer")
+        child.update_side_effects_with_delta(self.delta(model=1), "SynonymTransformer")
+        child.extend_wordsdict({'review': 1})
+
+        self.assertEqual(self.parent.current_wordsdict, {'attack': 1, 'paper': -1})
+        self.assertEqual(self.parent.side_effects_worddict, {})
+        self.assertEqual(child.current_wordsdict, {'attack': 0, 'paper': -1, 'review': 1})
+        self.assertEqual(child.side_effects_worddict, {'model': 1})
+        self.assertEqual(self.parent.original_wordsdict, {'attack': 2, 'paper': -1})
+
+    def test_appends_after_copy_are_isolated(self):
+        self.parent.update_applied_transformers("BibTexTransformer")
+        self.parent.update_with_delta(self.delta(attack=1), "BibTexTransformer")
+        child: TransformationState = self.parent.copyto()
+
+        # both states append to the shared segments
+        self.parent.update_applied_transformers("SynonymTransformer")
+        self.parent.update_with_delta(self.delta(paper=-1), "SynonymTransformer")
+        child.update_applied_transformers("SpellingMistakeTransformer")
+        child.update_with_delta(self.delta(attack=1), "SpellingMistakeTransformer")
+        child.history_group = "1"
+        child.update_with_delta(self.delta(paper=-1), "SpellingMistakeTransformer")
+
+        self.assertEqual(self.parent.applied_transformers, ["BibTexTransformer", "SynonymTransformer"])
+        self.assertEqual(child.applied_transformers, ["BibTexTransformer", "SpellingMistakeTransformer"])
+        self.assertEqual([transformer for transformer, _ in self.parent.history["0"]],
+                         ["BibTexTransformer", "SynonymTransformer"])
+        self.assertEqual([transformer for transformer, _ in child.history["0"]],
+                         ["BibTexTransformer", "SpellingMistakeTransformer"])
+        self.assertNotIn("1", self.parent.history)
+        self.assertEqual(len(child.history["1"]), 1)
+
+        # a copy of the copy continues from its parent's entries
+        grandchild: TransformationState = child.copyto()
+        grandchild.update_applied_transformers("HomoglyphTransformer")
+        self.assertEqual(child.applied_transformers, ["BibTexTransformer", "SpellingMistakeTransformer"])
+        self.assertEqual(grandchild.applied_transformers,
+                         ["BibTexTransformer", "SpellingMistakeTransformer", "HomoglyphTransformer"])
+
+    def test_problemspacerestrictions_are_isolated(self):
+        self.parent.add_problemspacerestrictions(["attack"])
+        child: TransformationState = self.parent.copyto()
+
+        child.add_problemspacerestrictions(["paper"])
+        deltadict: FeatureDelta = FeatureDelta()
+        deltadict.unrealizable_words.add("review")
+        self.parent.update_problemspacerestrictions(deltadict)
+
+        self.assertEqual(self.parent.probspacerestrictions, {"attack", "review"})
+        self.assertEqual(child.probspacerestrictions, {"attack", "paper"})
+
+
+if __name__ == '__main__':
+    unittest.main()
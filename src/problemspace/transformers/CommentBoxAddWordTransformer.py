@@ -87,7 +87,7 @@ class CommentBoxAddWordTransformer(CommentBoxTransformer):
         # Iterate over document and its tokens
         for token_start, token_end, token in \
                 self._iterate_over_document(doc=doc, tokenizer=tokenizer, check_within_cmd=True):
-            stem = stemmer.stem(token)
+            stem = self._stem(stemmer, token)
 
             # we ignore words that should be added
             if stemsdict.get(stem, 0) >= 0:
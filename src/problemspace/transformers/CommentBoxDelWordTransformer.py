@@ -1,4 +1,3 @@
-from copy import copy
 
 from problemspace.transformers.LogSettings import LogSettings
 from problemspace.transformers.CommentBoxTransformer import CommentBoxTransformer
@@ -49,7 +48,7 @@ class CommentBoxDelWordTransformer(CommentBoxTransformer):
         tokenizer = self._build_tokenizer()
         stemmer = self._build_stemmer()
         transforms = []
-        stemsdict = copy(current_wordsdict)
+        demand = self._build_demand(current_wordsdict, stemmer)
 
         feature_delta: FeatureDelta = FeatureDelta()
         stringtoadd = "is" # this transformer only adds 'stop word' which is not parsed.
@@ -59,13 +58,16 @@ class CommentBoxDelWordTransformer(CommentBoxTransformer):
                 self._iterate_over_document(doc=doc, tokenizer=tokenizer, check_within_cmd=True):
 
             # there are no more words left to remove
-            if all(x >= 0 for x in stemsdict.values()):
+            if not demand.has_deletions():
                 break
 
-            stem = stemmer.stem(token)
-
             # we ignore words that should be added
-            if stemsdict.get(stem, 0) >= 0:
+            if demand.skip_deletion(token):
+                continue
+
+            stem = self._stem(stemmer, token)
+
+            if not demand.wants_deletion(stem):
                 continue
 
             if self.debug_coloring:
@@ -79,7 +81,7 @@ class CommentBoxDelWordTransformer(CommentBoxTransformer):
                                       new_token=colored_token, new_stem=stem)
             transforms.append(transform)
 
-            stemsdict[stem] += 1
+            demand.update(stem, 1)
             feature_delta.changes[stem] = feature_delta.changes.get(
                 stem, 0) - 1
 
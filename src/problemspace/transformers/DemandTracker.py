@@ -0,0 +1,88 @@
+import typing
+
+
+class DemandTracker:
+    """
+    Outstanding changes of a wordsdict (stem -> requested change) while a replacement transformer iterates
+    over the tokens of a document. Keeps the stems that should still be added or removed, so that checking
+    whether any change is left or whether a stem is wanted does not iterate over the whole wordsdict.
+    """
+
+    def __init__(self,
+                 wordsdict: typing.Dict[str, int],
+                 first_letter_prefilter: bool = False):
+        """
+        :param wordsdict: requested changes, not modified
+        :param first_letter_prefilter: if true, tokens whose first letter does not start any stem that should be
+        removed are skipped by skip_deletion, i.e., before stemming. Only valid if the stemmer keeps the
+        first (lowercase) letter of a token, e.g., the PorterStemmer.
+        """
+        self.stemsdict: typing.Dict[str, int] = dict(wordsdict)
+        self.additions: typing.Set[str] = {stem for stem, change in self.stemsdict.items() if change > 0}
+        self.deletions: typing.Set[str] = {stem for stem, change in self.stemsdict.items() if change < 0}
+        # total number of outstanding additions and deletions
+        self.addition_count: int = sum(self.stemsdict[stem] for stem in self.additions)
+        self.deletion_count: int = -sum(self.stemsdict[stem] for stem in self.deletions)
+
+        # first letter -> number of stems that should be removed and start with this letter
+        self._deletion_letters: typing.Optional[typing.Dict[str, int]] = None
+        if first_letter_prefilter:
+            self._deletion_letters = {}
+            for stem in self.deletions:
+                self._deletion_letters[stem[:1]] = self._deletion_letters.get(stem[:1], 0) + 1
+
+    def get(self, stem: str, default: int = 0) -> int:
+        return self.stemsdict.get(stem, default)
+
+    def has_additions(self) -> bool:
+        return len(self.additions) > 0
+
+    def has_deletions(self) -> bool:
+        return len(self.deletions) > 0
+
+    def is_done(self) -> bool:
+        """
+        :return: true if there are no more words left to add or remove
+        """
+        return len(self.additions) == 0 and len(self.deletions) == 0
+
+    def wants_addition(self, stem: str) -> bool:
+        return stem in self.additions
+
+    def wants_deletion(self, stem: str) -> bool:
+        return stem in self.deletions
+
+    def skip_deletion(self, token: str) -> bool:
+        """
+        :return: true if the stem of token cannot be one that should be removed (w/o stemming the token)
+        """
+        if self._deletion_letters is None:
+            return False
+        return token.lower()[:1] not in self._deletion_letters
+
+    def update(self, stem: str, change: int) -> None:
+        """
+        Record a change of the document, e.g., +1 if an occurrence of a stem that should be removed was removed.
+        """
+        old: int = self.stemsdict.get(stem, 0)
+        new: int = old + change
+        self.stemsdict[stem] = new
+
+        self.addition_count += max(new, 0) - max(old, 0)
+        self.deletion_count += max(-new, 0) - max(-old, 0)
+
+        if old > 0 and new <= 0:
+            self.additions.discard(stem)
+        elif old <= 0 and new > 0:
+            self.additions.add(stem)
+
+        if old < 0 and new >= 0:
+            self.deletions.discard(stem)
+            if self._deletion_letters is not None:
+                self._deletion_letters[stem[:1]] -= 1
+                if self._deletion_letters[stem[:1]] == 0:
+                    del self._deletion_letters[stem[:1]]
+        elif old >= 0 and new < 0:
+            self.deletions.add(stem)
+            if self._deletion_letters is not None:
+                self._deletion_letters[stem[:1]] = self._deletion_letters.get(stem[:1], 0) + 1
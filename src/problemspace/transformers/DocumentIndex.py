@@ -0,0 +1,163 @@
+import bisect
+import collections
+import functools
+import re
+import threading
+import typing
+
+# edits that replace a plain word by another plain word keep the tokenization of the remaining document
+PLAIN_WORD_PATTERN = re.compile(r"[A-Za-z]+")
+WORD_SEPARATORS = set(" \t\r\n,;:!?()")
+# strings that move the content / abstract boundaries or change the tokenization around an edit
+STRUCTURAL_STRINGS = ["\\begin{document}", "\\end{document}", "\\end{abstract}", "\\section{",
+                      "%", "\"", "'", "`"]
+
+
+class DocumentIndex:
+    """
+    Tokens of a latex document, shared by all replacement transformers that work on the same document version.
+    The index holds the content and abstract boundaries, the token spans of each tokenizer, the ignored sections
+    of each configuration (ignored environments, check_within_cmd, ignore_quick_math), the resulting tokens,
+    and their stem counts. Each part is computed on first use by ReplacementTransformer._iterate_over_document.
+
+    Indices are looked up by the content of the document, i.e., all copies of a PdfLatexSource share the index.
+    If a document is derived from an indexed document by ReplacementTransformer._apply_transforms, the index of
+    the new document is updated from the applied edits instead of being computed again (see derive).
+    """
+
+    # number of document versions kept per process
+    MAX_DOCUMENTS: int = 16
+    # number of stemmed tokens kept per process
+    MAX_STEMS: int = 2 ** 16
+
+    _recent: 'collections.OrderedDict[str, DocumentIndex]' = collections.OrderedDict()
+    _lock = threading.Lock()
+    # (stemmer type, stemmer mode) -> stemmer, stems do not depend on the document
+    _stemmers: typing.Dict[tuple, typing.Any] = {}
+
+    def __init__(self, doc: str):
+        self.doc: str = doc
+        # content_start, content_end, abstract_end
+        self.boundaries: typing.Optional[typing.Tuple[int, int, int]] = None
+        # tokenizer type -> (tokenizer, sorted spans within the content after the abstract)
+        self.spans: typing.Dict[type, typing.Tuple[typing.Any, typing.List[typing.Tuple[int, int]]]] = {}
+        # (ignored environments, check_within_cmd, ignore_quick_math) -> ignored sections
+        self.ignored_sections: typing.Dict[tuple, typing.List[typing.Tuple[int, int]]] = {}
+        # (tokenizer type, ignored environments, check_within_cmd, ignore_quick_math) -> tokens
+        self.tokens: typing.Dict[tuple, typing.List[typing.Tuple[int, int, str]]] = {}
+        # (tokens key, stemmer key) -> stem counts
+        self.stem_counts: typing.Dict[tuple, typing.Counter[str]] = {}
+
+    @classmethod
+    def for_document(cls, doc: str) -> 'DocumentIndex':
+        with cls._lock:
+            index: typing.Optional[DocumentIndex] = cls._recent.get(doc)
+            if index is None:
+                index = cls(doc)
+                cls._recent[doc] = index
+                if len(cls._recent) > cls.MAX_DOCUMENTS:
+                    cls._recent.popitem(last=False)
+            else:
+                cls._recent.move_to_end(doc)
+            return index
+
+    @classmethod
+    def clear(cls) -> None:
+        with cls._lock:
+            cls._recent.clear()
+
+    @classmethod
+    def stem(cls, stemmer, token: str) -> str:
+        """
+        Stem of token, memoized per stemmer type.
+        """
+        key: tuple = (type(stemmer), getattr(stemmer, 'mode', None))
+        cls._stemmers.setdefault(key, stemmer)
+        return cls._cached_stem(key, token)
+
+    @staticmethod
+    @functools.lru_cache(maxsize=MAX_STEMS)
+    def _cached_stem(key: tuple, token: str) -> str:
+        return DocumentIndex._stemmers[key].stem(token)
+
+    @classmethod
+    def derive(cls, doc: str, new_doc: str, transforms: typing.List) -> None:
+        """
+        Register the index of new_doc, which is doc with the transforms applied, if doc is indexed and the
+        transforms can be applied to the index. Otherwise, new_doc is indexed from scratch on first use.
+        :param doc: document before the transforms
+        :param new_doc: document after the transforms
+        :param transforms: list of TransformInfo, sorted by token_start and not overlapping
+        """
+        with cls._lock:
+            index: typing.Optional[DocumentIndex] = cls._recent.get(doc)
+            if index is None or new_doc in cls._recent:
+                return
+        new_index: typing.Optional[DocumentIndex] = index._updated(new_doc, transforms)
+        if new_index is None:
+            return
+        with cls._lock:
+            cls._recent[new_doc] = new_index
+            if len(cls._recent) > cls.MAX_DOCUMENTS:
+                cls._recent.popitem(last=False)
+
+    def _is_plain_word_edit(self, transform) -> bool:
+        # an edit inside the content must replace a whole plain word by another one, so that it stays one token
+        # and does not change the ignored sections (no braces, comments, math, ...)
+        if PLAIN_WORD_PATTERN.fullmatch(transform.token) is None or \
+                PLAIN_WORD_PATTERN.fullmatch(transform.new_token) is None:
+            return False
+        if self.doc[transform.token_start - 1] not in WORD_SEPARATORS or \
+                self.doc[transform.token_end:transform.token_end + 1] not in WORD_SEPARATORS:
+            return False
+        for tokenizer, spans in self.spans.values():
+            i: int = bisect.bisect_left(spans, (transform.token_start, transform.token_end))
+            if i == len(spans) or spans[i] != (transform.token_start, transform.token_end):
+                return False
+            if list(tokenizer.span_tokenize(transform.new_token)) != [(0, len(transform.new_token))]:
+                return False
+        return True
+
+    def _updated(self, new_doc: str, transforms: typing.List) -> typing.Optional['DocumentIndex']:
+        if self.boundaries is None:
+            return None
+        content_start, content_end, abstract_end = self.boundaries
+        document_start: int = content_start - len("\\begin{document}")
+
+        # (position in doc, length difference) of each edit
+        edits: typing.List[typing.Tuple[int, int]] = []
+        replaced: typing.Dict[int, str] = {}
+        for transform in transforms:
+            if transform.token_end <= document_start:
+                # edit in the preamble, e.g., an additional package
+                if any(s in transform.token or s in transform.new_token for s in STRUCTURAL_STRINGS):
+                    return None
+            elif self._is_plain_word_edit(transform):
+                replaced[transform.token_start] = transform.new_token
+            else:
+                return None
+            edits.append((transform.token_end, len(transform.new_token) - (transform.token_end - transform.token_start)))
+
+        edit_ends: typing.List[int] = [end for end, _ in edits]
+        offsets: typing.List[int] = [0]
+        for _, delta in edits:
+            offsets.append(offsets[-1] + delta)
+
+        def shift(pos: int) -> int:
+            # every edit that ends before pos moves it
+            return pos + offsets[bisect.bisect_right(edit_ends, pos)]
+
+        new_index: DocumentIndex = DocumentIndex(new_doc)
+        new_index.boundaries = (shift(content_start), shift(content_end),
+                                shift(abstract_end) if abstract_end >= 0 else abstract_end)
+
+        for key, (tokenizer, spans) in self.spans.items():
+            new_index.spans[key] = (tokenizer, [(shift(s), shift(s) + len(replaced[s]) if s in replaced else shift(e))
+                                                for s, e in spans])
+        for key, sections in self.ignored_sections.items():
+            new_index.ignored_sections[key] = [(shift(s), shift(e)) for s, e in sections]
+        for key, tokens in self.tokens.items():
+            new_index.tokens[key] = [(shift(s), shift(s) + len(replaced[s]), replaced[s]) if s in replaced else
+                                     (shift(s), shift(e), token) for s, e, token in tokens]
+        # stem counts are cheap to recompute from the memoized stems
+        return new_index
@@ -1,6 +1,5 @@
 import random
 import re
-from copy import copy
 from typing import List, Optional, Tuple
 
 import homoglyphs as hg
@@ -64,8 +63,8 @@ class HomoglyphTransformer(ReplacementTransformer):
     def _find_transforms(
             self, doc, wordsdict, stemmer, tokenizer,
             replacements) -> Tuple[List[TransformInfo], FeatureDelta]:
-        # copy wordsdict and make sure that we operate on the word stems
-        stemsdict = copy(wordsdict)
+        # track the requested changes, we operate on the word stems
+        demand = self._build_demand(wordsdict, stemmer)
 
         feature_delta: FeatureDelta = FeatureDelta()
 
@@ -83,14 +82,17 @@ class HomoglyphTransformer(ReplacementTransformer):
         # Iterate over document and its tokens
         for token_start, token_end, token in token_generator:
             # there are no more words left to remove
-            if all(x >= 0 for x in stemsdict.values()):
+            if not demand.has_deletions():
                 break
 
-            stem = stemmer.stem(token)
-
             # homoglyph replacement "removes" a word from the document; thus,
             # we ignore words that should be added
-            if stemsdict.get(stem, 0) >= 0:
+            if demand.skip_deletion(token):
+                continue
+
+            stem = self._stem(stemmer, token)
+
+            if not demand.wants_deletion(stem):
                 continue
 
             # we do not want to replace the first letter in each word but
@@ -139,7 +141,7 @@ class HomoglyphTransformer(ReplacementTransformer):
                                           colored_token, new_stem)
                 transforms.append(transform)
 
-                stemsdict[stem] += 1
+                demand.update(stem, 1)
                 feature_delta.changes[stem] = feature_delta.changes.get(
                     stem, 0) - 1
 
@@ -1,11 +1,15 @@
+import bisect
+import functools
 import re
 from abc import abstractmethod
-from typing import List, Optional, Dict, Set
+from typing import List, Optional, Dict, Set, Tuple
 import collections
 
 from nltk.stem import PorterStemmer
 from nltk.tokenize import TreebankWordTokenizer, WhitespaceTokenizer
 from problemspace.exceptions.TransformerException import TransformerException
+from problemspace.transformers.DemandTracker import DemandTracker
+from problemspace.transformers.DocumentIndex import DocumentIndex
 from problemspace.transformers.FeatureDelta import FeatureDelta
 from problemspace.transformers.LogSettings import LogSettings
 from problemspace.transformers.TransformationState import TransformationState
@@ -48,6 +52,24 @@ class UnmatchedBracketsException(RuntimeError):
 
         return f"UnmatchedBracketsException: Fault begins around {first_faulty}"
 
+BRACKETS_PATTERN = re.compile(r"[{}]")
+
+
+@functools.lru_cache(maxsize=None)
+def structure_pattern(ignored_environments: Tuple[str, ...], ignore_quick_math: bool):
+    """
+    Creates the pattern of ReplacementTransformer._scan_document and a map from each begin tag to its end tag.
+    """
+    ignore_boundaries = {f"\\begin{{{env}}}": f"\\end{{{env}}}" for env in ignored_environments}
+    if ignore_quick_math:
+        ignore_boundaries.update({"\\[": "\\]", "$$": "$$"})
+
+    alternatives = [r"(?P<comment>%)", r"(?P<brace>[{}])"]
+    if len(ignore_boundaries) > 0:
+        alternatives.append("(?P<begin>" + "|".join(map(re.escape, ignore_boundaries)) + ")")
+    return re.compile("|".join(alternatives)), ignore_boundaries
+
+
 class TransformInfo:
     def __init__(self, token_start, token_end, token, stem, new_token,
                  new_stem):
@@ -104,7 +126,11 @@ class ReplacementTransformer(Transformer):
         #  - replacing each homoglyph separatly (since it requires a lot of string copies)
         #  - converting the doc to a list, replacing characters in this list and
         #    joining them "".join(list)
-        return "".join(new_doc)
+        new_doc = "".join(new_doc)
+
+        # the next transformer can reuse the tokens of this document
+        DocumentIndex.derive(doc, new_doc, transforms)
+        return new_doc
 
     def _get_problemspace_constraints(self, doc: str, wordsdict: Dict[str, int]) -> Set:
         """
@@ -118,20 +144,14 @@ class ReplacementTransformer(Transformer):
         stemmer = self._build_stemmer()
         strict: bool = False
 
-        token_list = list(
-            self._iterate_over_document(
-                doc=doc,
-                tokenizer=tokenizer,
-                check_within_cmd=True))
+        tokens_counter = self._count_stems(doc=doc, tokenizer=tokenizer, stemmer=stemmer, check_within_cmd=True)
 
         if strict is True:
-            tokens = set([stemmer.stem(token) for _, _, token in token_list])
+            tokens = set(tokens_counter)
             wordsdict_set = set([k for k,v in wordsdict.items() if v < 0])
             return wordsdict_set.difference(tokens)
         else:
             threshold = 0.5
-            tokens = [stemmer.stem(token) for _, _, token in token_list]
-            tokens_counter = collections.Counter(tokens)
 
             blocked_words = set()
             for tkey, tval in wordsdict.items():
@@ -147,14 +167,88 @@ class ReplacementTransformer(Transformer):
                                ignore_quick_math=True):
         """
         Generator for tokens from document.
+        The tokens are cached in the DocumentIndex of the document, i.e., they are only computed once per document.
         :param doc: latex document as string
         :param tokenizer: tokenizer
         :param check_within_cmd: if true, checked if current token is within latex command, e.g. \textbf{}.
         If so, it would not use this token.
         :return: token-start, token-end, token string.
         """
-        ignored_environments: List[str] = self.ignored_environments
+        yield from self._get_tokens(DocumentIndex.for_document(doc), tokenizer, check_within_cmd, ignore_quick_math)
+
+    def _tokens_key(self, tokenizer, check_within_cmd: bool, ignore_quick_math: bool) -> tuple:
+        return type(tokenizer), tuple(self.ignored_environments), check_within_cmd, ignore_quick_math
+
+    def _get_tokens(self,
+                    index: DocumentIndex,
+                    tokenizer,
+                    check_within_cmd: bool,
+                    ignore_quick_math: bool) -> List[tuple]:
+        tokens_key: tuple = self._tokens_key(tokenizer, check_within_cmd, ignore_quick_math)
+        if tokens_key in index.tokens:
+            return index.tokens[tokens_key]
+
+        doc: str = index.doc
+        if index.boundaries is None:
+            index.boundaries = self._find_boundaries(doc)
+        content_start, content_end, abstract_end = index.boundaries
+
+        ignored_key: tuple = tokens_key[1:]
+        if ignored_key not in index.ignored_sections:
+            index.ignored_sections[ignored_key], _ = self._find_ignored_sections(
+                doc, content_start, content_end, self.ignored_environments,
+                check_within_cmd, ignore_quick_math)
+        inside_ignored = create_inside_ignored(index.ignored_sections[ignored_key])
+
+        if type(tokenizer) not in index.spans:
+            # tokenize and sort by token_start position
+            try:
+                token_spans = list(tokenizer.span_tokenize(doc))
+            except ValueError:
+                tokenizer = WhitespaceTokenizer()
+                token_spans = list(tokenizer.span_tokenize(doc))
+            token_spans.sort(key=lambda x: x[0])
+
+            # we are only interested in tokens inside the latex document, after the abstract
+            index.spans[tokens_key[0]] = (tokenizer, [
+                (token_start, token_end) for token_start, token_end in token_spans
+                if content_start <= token_start and token_end <= content_end and abstract_end <= token_start])
+
+        index.tokens[tokens_key] = [(token_start, token_end, doc[token_start:token_end])
+                                    for token_start, token_end in index.spans[tokens_key[0]][1]
+                                    if not inside_ignored(token_start, token_end)]
+        return index.tokens[tokens_key]
+
+    def _count_stems(self, doc: str, tokenizer, stemmer, check_within_cmd: bool,
+                     ignore_quick_math=True) -> collections.Counter:
+        """
+        Count the stems of all tokens from document (cf. _iterate_over_document), cached in the DocumentIndex.
+        """
+        index: DocumentIndex = DocumentIndex.for_document(doc)
+        counts_key: tuple = (self._tokens_key(tokenizer, check_within_cmd, ignore_quick_math),
+                             type(stemmer), getattr(stemmer, 'mode', None))
+        if counts_key not in index.stem_counts:
+            index.stem_counts[counts_key] = collections.Counter(
+                self._stem(stemmer, token)
+                for _, _, token in self._get_tokens(index, tokenizer, check_within_cmd, ignore_quick_math))
+        return index.stem_counts[counts_key]
+
+    @staticmethod
+    def _stem(stemmer, token: str) -> str:
+        return DocumentIndex.stem(stemmer, token)
 
+    @staticmethod
+    def _build_demand(wordsdict: Dict[str, int], stemmer) -> DemandTracker:
+        # the porter stemmer keeps the first letter of a (lowercased) word,
+        # so tokens can be skipped before stemming
+        return DemandTracker(wordsdict, first_letter_prefilter=type(stemmer) is PorterStemmer)
+
+    @staticmethod
+    def _find_boundaries(doc: str) -> Tuple[int, int, int]:
+        """
+        Find the content of the document and the end of its abstract (we do not want to modify the abstract).
+        :return: content-start, content-end, abstract-end (-1 if there is no abstract)
+        """
         # Find suitable location for replacement,
         # retrieve begin and end of document (we only want to edit the content)
         content_start = doc.index("\\begin{document}") + len(
@@ -172,31 +266,7 @@ class ReplacementTransformer(Transformer):
             if firstsectionindexrange is not None:
                 abstract_end = firstsectionindexrange.end()
 
-        _, inside_ignored = self._find_ignored_sections(
-            doc, content_start, content_end, ignored_environments,
-            check_within_cmd, ignore_quick_math)
-
-        # tokenize and sort by token_start position
-        try:
-            token_spans = list(tokenizer.span_tokenize(doc))
-        except ValueError:
-            default_tokenizer = WhitespaceTokenizer()
-            token_spans = list(default_tokenizer.span_tokenize(doc))
-        token_spans.sort(key=lambda x: x[0])
-
-        for token_start, token_end in token_spans:
-            # we are only interested in tokens inside the latex document
-            if token_start < content_start or content_end < token_end:
-                continue
-
-            if token_start < abstract_end:
-                continue
-
-            if inside_ignored(token_start, token_end):
-                continue
-
-            token = doc[token_start:token_end]
-            yield token_start, token_end, token
+        return content_start, content_end, abstract_end
 
     @classmethod
     def _find_ignored_sections(cls,
@@ -213,31 +283,91 @@ class ReplacementTransformer(Transformer):
         The [check_within_cmd] parameter defines whether text inside curly brackets
         should be ignored; this would prevent replacing text in e.g. \section{} elements.
         """
-        comment_sections = list(cls._find_comments(doc))
-        is_inside_comment = create_inside_ignored(comment_sections)
-
-        ignored_env_sections = cls._find_ignored_env_sections(
+        comment_sections, ignored_env_sections, brackets = cls._scan_document(
             doc, content_start, content_end, ignored_environments,
-            ignore_quick_math, is_inside_comment)
+            ignore_quick_math)
 
         assert all(ignored_env_sections[i][0] < ignored_env_sections[i][1] <=
                    ignored_env_sections[i + 1][0]
                    for i in range(0,
                                   len(ignored_env_sections) - 1))
 
-        is_inside_env = create_inside_ignored(ignored_env_sections)
-
         if check_within_cmd:
-            ignored_sections = cls._handle_brackets(doc, content_start,
-                                                    content_end, is_inside_env,
-                                                    ignored_env_sections,
-                                                    is_inside_comment,
-                                                    comment_sections)
+            assert len(brackets) == 0 or brackets[0][1] == "{"
+            bracket_ignore_sections = cls._match_brackets_to_sections(brackets)
+
+            ignored_sections = merge(
+                merge(ignored_env_sections, bracket_ignore_sections,
+                      lambda x, y: x[0] < y[0]), comment_sections,
+                lambda x, y: x[0] < y[0])
         else:
             ignored_sections = ignored_env_sections
 
         return ignored_sections, create_inside_ignored(ignored_sections)
 
+    @classmethod
+    def _scan_document(cls,
+                       doc,
+                       content_start,
+                       content_end,
+                       ignored_environments,
+                       ignore_quick_math=True):
+        """
+        Finds the comments of the document, and the ignored environment sections (incl. math) and the
+        active brackets between [content_start] and [content_end] in a single pass over the document.
+        Gives the same results as _find_comments, _find_ignored_env_sections, and _find_active_brackets
+        (w/ the comments and the environment sections as ignored sections).
+        :return: comment sections, ignored environment sections, active brackets (position, bracket)
+        """
+        pattern, ignore_boundaries = structure_pattern(tuple(ignored_environments), ignore_quick_math)
+
+        comment_sections = []
+        ignored_sections = []
+        brackets = []
+
+        # end of the last ignored environment section
+        ptr = content_start
+        pos = 0
+        while (m := pattern.search(doc, pos)) is not None:
+            s = m.start()
+            pos = m.end()
+
+            if m.lastgroup == "comment":
+                # same behaviour as _find_comments, a comment ends after the line break
+                if doc[s - 1] == "\\":
+                    continue
+                e = doc.find("\n", s)
+                pos = len(doc) if e == -1 else e + 1
+                comment_sections.append((s, pos))
+
+            elif s < content_start or pos > content_end:
+                # outside the content, a match at its border might hide a bracket or tag inside the content
+                pos = s + 1
+
+            elif s < ptr:
+                # inside an ignored environment
+                continue
+
+            elif m.lastgroup == "brace":
+                brackets.append((s, m.group()))
+
+            elif cls._is_behind_escaping_backslash(s, doc):
+                # tag is no environment, but its brackets are active
+                if m.group()[-1] == "}":
+                    brackets.append((s + len("\\begin"), "{"))
+                    brackets.append((pos - 1, "}"))
+
+            else:
+                end_tag = ignore_boundaries[m.group()]
+                end_pos = doc.find(end_tag, pos, content_end)
+
+                assert end_pos >= 0, f"Did not find end_pos for {m.group()} and {end_tag} after character ({s})"
+
+                ptr = end_pos + len(end_tag)
+                ignored_sections.append((s, ptr))
+
+        return comment_sections, ignored_sections, brackets
+
     @classmethod
     def _handle_brackets(cls,
                          doc,
@@ -335,9 +465,8 @@ class ReplacementTransformer(Transformer):
         Finds every bracket in the document that is not already ignored by an
         environment block
         """
-        all_brackets = ((i + content_start, c)
-                        for i, c in enumerate(doc[content_start:content_end])
-                        if (c == "{" or c == "}"))
+        all_brackets = ((m.start(), m.group())
+                        for m in BRACKETS_PATTERN.finditer(doc, content_start, content_end))
 
         active_brackets = all_brackets
 
@@ -508,21 +637,42 @@ class ReplacementTransformer(Transformer):
         return None
 
 
+class IntervalIndex:
+    """
+    Sorted, merged index of sections (start, end) for overlap queries in O(log n).
+    Sections that overlap each other are merged, so that the remaining sections are disjoint
+    and both their starts and their ends are sorted.
+    """
+
+    def __init__(self, sections):
+        self.starts: List[int] = []
+        self.ends: List[int] = []
+        for start, end in sorted(sections):
+            if len(self.starts) > 0 and start < self.ends[-1]:
+                self.ends[-1] = max(self.ends[-1], end)
+            else:
+                self.starts.append(start)
+                self.ends.append(end)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def overlaps(self, token_start, token_end) -> bool:
+        # a token doc[a:b] overlaps a section doc[c:d] iff c < b and a < d.
+        # Among the sections with c < b, the last one has the largest end.
+        idx = bisect.bisect_left(self.starts, token_end) - 1
+        return idx >= 0 and token_start < self.ends[idx]
+
+    def __call__(self, token_start, token_end) -> bool:
+        return self.overlaps(token_start, token_end)
+
+
 def create_inside_ignored(ignored_sections):
     """
     Creates a function that checks whether a token (defined by [token_start] and
     [token_end]) overlaps with any of the section is [ignored_sections].
     """
-    def non_overlap(a, b, c, d):
-        # token0 = doc[a:b]
-        # token1 = doc[c:d]
-        return b <= c or d <= a
-
-    def fn(token_start, token_end):
-        return any(not non_overlap(token_start, token_end, s, e)
-                   for s, e in ignored_sections)
-
-    return fn
+    return IntervalIndex(ignored_sections)
 
 
 def merge(a, b, is_smaller):
@@ -1,6 +1,5 @@
 import random
 from pathlib import Path
-from copy import copy
 from typing import List, Tuple, Optional
 import spacy
 
@@ -85,8 +84,8 @@ class SynonymTransformer(ReplacementTransformer):
     def _find_transforms(
             self, doc, wordsdict, stemmer, tokenizer,
             synonym_model) -> Tuple[List[TransformInfo], FeatureDelta]:
-        # copy wordsdict and make sure that we operate on the word stems
-        stemsdict = copy(wordsdict)
+        # track the requested changes, we operate on the word stems
+        demand = self._build_demand(wordsdict, stemmer)
 
         feature_delta: FeatureDelta = FeatureDelta()
 
@@ -113,22 +112,26 @@ class SynonymTransformer(ReplacementTransformer):
 
         for token_start, token_end, token in token_list:
             # there are no more words left to add / remove
-            if all(x == 0 for x in stemsdict.values()):
+            if demand.is_done():
                 break
             # we have already changed enough words
             if self.max_changes is not None:
                 if len(transforms) >= self.max_changes:
                     break
 
+            # w/o words to add, the token is only replaced if it should be removed
+            if not demand.has_additions() and demand.skip_deletion(token):
+                continue
+
             # find synonyms for token
             synonyms = synonym_dict.get(token, [])
             if len(synonyms) == 0:
                 continue
 
-            stem = stemmer.stem(token)
+            stem = self._stem(stemmer, token)
 
             transform = self._try_adding_word_using_synonym(
-                token_start, token_end, token, stem, stemmer, stemsdict,
+                token_start, token_end, token, stem, stemmer, demand,
                 synonyms, feature_delta, doc)
 
             if transform is not None:
@@ -136,7 +139,7 @@ class SynonymTransformer(ReplacementTransformer):
                 continue
 
             transform = self._try_deleting_word_using_synonym(
-                token_start, token_end, token, stem, stemmer, stemsdict,
+                token_start, token_end, token, stem, stemmer, demand,
                 synonyms, feature_delta, doc)
 
             if transform is not None:
@@ -145,15 +148,15 @@ class SynonymTransformer(ReplacementTransformer):
         return transforms, feature_delta
 
     def _try_adding_word_using_synonym(self, token_start, token_end, token,
-                                       stem, stemmer, stemsdict, synonyms,
+                                       stem, stemmer, demand, synonyms,
                                        feature_delta, doc):
         for synonym in synonyms:
-            synonym_stem = stemmer.stem(synonym)
+            synonym_stem = self._stem(stemmer, synonym)
 
-            if stemsdict.get(synonym_stem, 0) > 0:
+            if demand.wants_addition(synonym_stem):
                 if self._pos_checking(token_start=token_start, token_end=token_end,
                                       token=token, new_token=synonym, doc=doc, mode="ADD") is True:
-                    stemsdict[synonym_stem] -= 1
+                    demand.update(synonym_stem, -1)
                     feature_delta.changes[
                         synonym_stem] = feature_delta.changes.get(synonym_stem,
                                                                   0) + 1
@@ -168,18 +171,18 @@ class SynonymTransformer(ReplacementTransformer):
                                          colored_token, synonym_stem)
 
     def _try_deleting_word_using_synonym(self, token_start, token_end, token,
-                                         stem, stemmer, stemsdict, synonyms,
+                                         stem, stemmer, demand, synonyms,
                                          feature_delta, doc):
         # synonym replacement "removes" a word from the document; thus,
         # we ignore words that should be added
-        if stemsdict.get(stem, 0) >= 0:
+        if not demand.wants_deletion(stem):
             return
 
         # We try all possible synonyms in random order.
         shuffled_synonyms = self.random.sample(synonyms, len(synonyms)) # not in-place here!
         for new_token in shuffled_synonyms:
             # synonym chosen, now get stem
-            new_stem = stemmer.stem(new_token)
+            new_stem = self._stem(stemmer, new_token)
 
             # the synonym's stem must be different from the token's
             # stem to have an effect on the feature space
@@ -192,7 +195,7 @@ class SynonymTransformer(ReplacementTransformer):
                                   new_token=new_token, doc=doc, mode="DEL") is False:
                 continue
 
-            stemsdict[stem] += 1
+            demand.update(stem, 1)
             feature_delta.changes[stem] = feature_delta.changes.get(stem, 0) - 1
 
             if self.debug_coloring:
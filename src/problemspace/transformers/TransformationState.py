@@ -4,6 +4,31 @@ import copy
 from problemspace.PdfLatexSource import PdfLatexSource
 from problemspace.exceptions.TransformerException import TransformerException
 from problemspace.transformers.FeatureDelta import FeatureDelta
+from utils.pdf_utils import analyze_words
+
+
+class _AppendOnlySegment:
+    """
+    View on a list that is shared between a transformation state and its copies. Appending extends the
+    shared list in-place if no other view appended to it yet, otherwise the items of this view are copied first.
+    In this way, copying a history is O(1), although it grows with every transformer.
+    """
+
+    def __init__(self, items: typing.Optional[list] = None, length: typing.Optional[int] = None):
+        self.items: list = items if items is not None else []
+        self.length: int = length if length is not None else len(self.items)
+
+    def append(self, item) -> None:
+        if len(self.items) != self.length:
+            self.items = self.items[:self.length]
+        self.items.append(item)
+        self.length += 1
+
+    def share(self) -> '_AppendOnlySegment':
+        return _AppendOnlySegment(self.items, self.length)
+
+    def tolist(self) -> list:
+        return self.items[:self.length]
 
 
 class TransformationState:
@@ -38,14 +63,50 @@ class TransformationState:
         self.side_effects_worddict: typing.Dict[str, int] = side_effects_worddict if \
             side_effects_worddict is not None else {}
 
-        self.applied_transformers: typing.List[str] = applied_transformers if \
-            applied_transformers is not None else []
+        self._applied_transformers: _AppendOnlySegment = _AppendOnlySegment(
+            list(applied_transformers) if applied_transformers is not None else [])
         self.probspacerestrictions: typing.Set[str] = probspacerestrictions if \
             probspacerestrictions is not None else set()
 
         self.history_group: str = "0"
-        self.history: typing.Dict[str, typing.List[typing.Tuple[str, typing.Dict]]] = {}
-        self.history_side_effects: typing.Dict[str, typing.List[typing.Tuple[str, typing.Dict]]] = {}
+        self._history: typing.Dict[str, _AppendOnlySegment] = {}
+        self._history_side_effects: typing.Dict[str, _AppendOnlySegment] = {}
+
+        # copy-on-write: dicts and sets that are shared with copies of this state are copied before
+        # they are modified (cf. _own). Values are immutable, so that a shallow copy is sufficient.
+        self._owned: typing.Set[str] = {'original_wordsdict', 'current_wordsdict', 'side_effects_worddict',
+                                        'probspacerestrictions'}
+
+        # words of the current PDF as (pdf version, words), cf. get_words
+        self._words: typing.Optional[typing.Tuple[int, typing.List[str]]] = None
+
+    def get_words(self) -> typing.List[str]:
+        """
+        Get the words (features) of the current PDF. The words are only extracted
+        once per PDF version, i.e., again after the document was recompiled.
+        :return: list of words
+        """
+        if self._words is None or self._words[0] != self.pdflatexsource.pdf_version:
+            self._words = (self.pdflatexsource.pdf_version,
+                           analyze_words(pdf_file=self.pdflatexsource.get_maindocument_pdf_path()))
+        return list(self._words[1])
+
+    def _own(self, attribute: str) -> None:
+        if attribute not in self._owned:
+            setattr(self, attribute, copy.copy(getattr(self, attribute)))
+            self._owned.add(attribute)
+
+    @property
+    def applied_transformers(self) -> typing.List[str]:
+        return self._applied_transformers.tolist()
+
+    @property
+    def history(self) -> typing.Dict[str, typing.List[typing.Tuple[str, typing.Dict]]]:
+        return {group: segment.tolist() for group, segment in self._history.items()}
+
+    @property
+    def history_side_effects(self) -> typing.Dict[str, typing.List[typing.Tuple[str, typing.Dict]]]:
+        return {group: segment.tolist() for group, segment in self._history_side_effects.items()}
 
     def update_target_wordsdict(self, wordsdict: typing.Dict[str, int]) -> None:
         """
@@ -57,8 +118,10 @@ class TransformationState:
         """
         self.current_wordsdict = copy.deepcopy(wordsdict)
         self.original_wordsdict = wordsdict
+        self._owned.add('current_wordsdict')
 
     def extend_wordsdict(self, wordsdict: typing.Dict[str, int]):
+        self._own('current_wordsdict')
         for k, v in wordsdict.items():
             if k in self.current_wordsdict:
                 self.current_wordsdict[k] += v  # '+' because we add more words with pos/neg score.
@@ -66,8 +129,9 @@ class TransformationState:
                 self.current_wordsdict[k] = v
 
     def update_with_delta(self, deltadict: FeatureDelta, applied_transformer: str):
-        self._save_history_information(hist=self.history, deltadict=deltadict,
+        self._save_history_information(hist=self._history, deltadict=deltadict,
                                        applied_transformer=applied_transformer)
+        self._own('current_wordsdict')
         for k, v in deltadict.changes.items():
             if k not in self.current_wordsdict:
                 raise TransformerException("Word in delta is not present in saved words-dict")
@@ -82,15 +146,16 @@ class TransformationState:
         return delta_dict
 
     def update_side_effects_with_delta(self, deltadict: FeatureDelta, applied_transformer: str):
-        self._save_history_information(hist=self.history_side_effects, deltadict=deltadict,
+        self._save_history_information(hist=self._history_side_effects, deltadict=deltadict,
                                        applied_transformer=applied_transformer)
+        self._own('side_effects_worddict')
         for k, v in deltadict.changes.items():
             if k not in self.side_effects_worddict:
                 self.side_effects_worddict[k] = v
             else:
                 self.side_effects_worddict[k] += v  # '+' because we update words with pos/neg score.
 
-    def _save_history_information(self, hist: typing.Dict[str, typing.List[typing.Tuple[str, typing.Dict]]],
+    def _save_history_information(self, hist: typing.Dict[str, _AppendOnlySegment],
                                   deltadict: FeatureDelta,
                                   applied_transformer: str):
         """
@@ -98,26 +163,35 @@ class TransformationState:
         Here, we save which transformer at which point changed which features.
         """
         if self.history_group not in hist:
-            hist[self.history_group] = []
+            hist[self.history_group] = _AppendOnlySegment()
         hist[self.history_group].append((applied_transformer, deltadict.get_json_dump_output()))
 
     def update_applied_transformers(self, applied_transformer: str) -> None:
-        self.applied_transformers.append(applied_transformer)
+        self._applied_transformers.append(applied_transformer)
 
     def update_problemspacerestrictions(self, deltadict: FeatureDelta) -> None:
-        self.probspacerestrictions.update(deltadict.unrealizable_words)
+        self.add_problemspacerestrictions(words=deltadict.unrealizable_words)
+
+    def add_problemspacerestrictions(self, words: typing.Iterable[str]) -> None:
+        self._own('probspacerestrictions')
+        self.probspacerestrictions.update(words)
 
     def copyto(self) -> 'TransformationState':
+        """
+        Copy state incl. latex project. Apart from the project, the copy is O(1): dicts and sets are
+        shared until either state modifies them, histories are shared append-only segments.
+        """
         pds = self.pdflatexsource.copyto()
-        ow = copy.deepcopy(self.original_wordsdict)
-        cw = copy.deepcopy(self.current_wordsdict)
-        se = copy.deepcopy(self.side_effects_worddict)
-        ap = copy.deepcopy(self.applied_transformers)
-        ac = copy.deepcopy(self.probspacerestrictions)
-        tr = TransformationState(pdflatexsource=pds, current_wordsdict=cw,
-                                 original_wordsdict=ow, side_effects_worddict=se,
-                                 applied_transformers=ap, probspacerestrictions=ac)
-        tr.history = copy.deepcopy(self.history)
-        tr.history_side_effects = copy.deepcopy(self.history_side_effects)
+        tr = TransformationState(pdflatexsource=pds, current_wordsdict=self.current_wordsdict,
+                                 original_wordsdict=self.original_wordsdict,
+                                 side_effects_worddict=self.side_effects_worddict,
+                                 probspacerestrictions=self.probspacerestrictions)
+        # both states have to copy shared objects before modifying them
+        tr._owned = set()
+        self._owned = set()
+        tr._applied_transformers = self._applied_transformers.share()
+        tr._history = {group: segment.share() for group, segment in self._history.items()}
+        tr._history_side_effects = {group: segment.share() for group, segment in self._history_side_effects.items()}
+        # the copy has the same PDF (and pdf version)
+        tr._words = self._words
         return tr
-
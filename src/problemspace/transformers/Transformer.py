@@ -15,7 +15,6 @@ from problemspace.PdfLatexSource import PdfLatexSource
 from problemspace.exceptions.TransformerException import TransformerException
 from problemspace.transformers.TransformationState import TransformationState
 from problemspace.transformers.FeatureDelta import FeatureDelta
-from utils.pdf_utils import analyze_words
 
 
 class Transformer(ABC):
@@ -92,8 +91,9 @@ class Transformer(ABC):
         pdffile_after: pathlib.Path = transformationstate_after.pdflatexsource.get_maindocument_tempfile(suffix="pdf")
         assert pdffile_after.exists()  # should be true, since we run it in apply_transformer!
 
-        word_vector_before: typing.List[str] = analyze_words(pdf_file=pdffile_before)
-        word_vector_after: typing.List[str] = analyze_words(pdf_file=pdffile_after)
+        # words of the state before are usually known from the previous transformer
+        word_vector_before: typing.List[str] = transformationstate_before.get_words()
+        word_vector_after: typing.List[str] = transformationstate_after.get_words()
 
         word_vector_before_counter = collections.Counter(word_vector_before)
         word_vector_after_counter = collections.Counter(word_vector_after)
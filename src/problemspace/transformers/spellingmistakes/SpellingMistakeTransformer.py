@@ -1,6 +1,5 @@
 import random
 import typing
-from copy import copy
 from typing import List, Optional, Tuple
 import enum
 
@@ -99,8 +98,8 @@ class SpellingMistakeTransformer(ReplacementTransformer):
 
     def _find_transforms(
             self, doc, wordsdict, stemmer, tokenizer) -> Tuple[List[TransformInfo], FeatureDelta]:
-        # copy wordsdict and make sure that we operate on the word stems
-        stemsdict = copy(wordsdict)
+        # track the requested changes, we operate on the word stems
+        demand = self._build_demand(wordsdict, stemmer)
 
         feature_delta: FeatureDelta = FeatureDelta()
 
@@ -117,17 +116,20 @@ class SpellingMistakeTransformer(ReplacementTransformer):
         # Iterate over document and its tokens
         for token_start, token_end, token in token_generator:
             # there are no more words left to remove
-            if all(x >= 0 for x in stemsdict.values()):
+            if not demand.has_deletions():
                 break
             # we have already changed enough words
             if self.max_changes is not None:
                 if len(transforms) >= self.max_changes:
                     break
 
-            stem = stemmer.stem(token)
-
             # we ignore words that should be added
-            if stemsdict.get(stem, 0) >= 0:
+            if demand.skip_deletion(token):
+                continue
+
+            stem = self._stem(stemmer, token)
+
+            if not demand.wants_deletion(stem):
                 continue
 
             # Strategy: Swap letters
@@ -164,7 +166,7 @@ class SpellingMistakeTransformer(ReplacementTransformer):
                                       colored_token, new_stem)
             transforms.append(transform)
 
-            stemsdict[stem] += 1
+            demand.update(stem, 1)
             feature_delta.changes[stem] = feature_delta.changes.get(
                 stem, 0) - 1
 
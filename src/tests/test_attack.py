@@ -0,0 +1,192 @@
+import logging
+import queue
+import tempfile
+import threading
+import unittest
+from collections import Counter
+from pathlib import Path
+from unittest import mock
+
+from attack import (pipelined_feature_problem_space_iterations, queue_runner,
+                    rebase_requested_changes, reprioritize, reset_attack)
+from utils.results_store import emit, set_sink
+from utils.workqueue import WorkQueue
+
+
+class TestRebaseRequestedChanges(unittest.TestCase):
+
+    def test_all_changes_realized(self):
+        features_requested = ['attack', 'paper', 'paper']
+        requested_changes = {'secur': 2, 'paper': -1}
+        features_realized = ['attack', 'paper', 'secur', 'secur']
+
+        self.assertEqual(rebase_requested_changes(requested_changes, features_requested, features_realized), {})
+
+    def test_missing_changes(self):
+        features_requested = ['attack', 'paper', 'paper']
+        requested_changes = {'secur': 2, 'paper': -1, 'model': 1}
+        # only one 'secur' was added, 'paper' was not removed, 'attack' was removed as side effect
+        features_realized = ['paper', 'paper', 'secur', 'model']
+
+        self.assertEqual(rebase_requested_changes(requested_changes, features_requested, features_realized),
+                         {'secur': 1, 'paper': -1, 'attack': 1})
+
+    def test_target_is_preserved(self):
+        # features_realized + rebased changes == features_requested + requested changes
+        features_requested = ['a', 'b', 'b', 'c']
+        requested_changes = {'a': -1, 'b': 3, 'd': 2, 'e': -5}
+        features_realized = ['b', 'c', 'c', 'd', 'f']
+
+        rebased = rebase_requested_changes(requested_changes, features_requested, features_realized)
+        self.assertNotIn('e', rebased)  # cannot remove more words than present
+
+        target = Counter(features_requested)
+        target.update(requested_changes)
+        realized = Counter(features_realized)
+        realized.update(rebased)
+        self.assertEqual(+target, +realized)
+
+
+class TestReprioritize(unittest.TestCase):
+
+    class CostModel:
+        # estimate is the running time of the given job
+        def estimate(self, features):
+            return features['running_time']
+
+    def test_pending_jobs_are_resorted(self):
+        # jobs are (working dir, ...) tuples, costs are (features, estimate)
+        pending = [ ('a',), ('b',), ('c',) ]
+        costs = { 'a' : ({ 'running_time' : 10 }, 30), 'b' : ({ 'running_time' : 30 }, 20), 'c' : ({ 'running_time' : 20 }, 10) }
+
+        reprioritize(pending, TestReprioritize.CostModel(), costs)
+        self.assertEqual(pending, [ ('b',), ('c',), ('a',) ])
+        self.assertEqual(costs['a'], ({ 'running_time' : 10 }, 10))
+
+
+class TestQueueRunner(unittest.TestCase):
+
+    TARGET = { 'submission' : 'paper', 'victim_models' : [ 'victim' ], 'surrogate_models' : [ 'surrogate' ],
+               'target_reviewer' : { 'request' : [ 'alice' ], 'reject' : [ 'bob' ] } }
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.queue_file = Path(self.tmpdir.name) / 'queue.db'
+        self.trial_dir = Path(self.tmpdir.name) / 'trial'
+        self.trial_dir.mkdir()
+        WorkQueue(self.queue_file).init('trial', [ ('a', TestQueueRunner.TARGET, 0) ])
+        self.results_queue = queue.Queue()
+
+    def tearDown(self):
+        set_sink(None)
+        self.tmpdir.cleanup()
+
+    def run_queue_runner(self, lose_lease):
+        def attack(working_dir, *args, attempt=0):
+            set_sink(args[6], working_dir.name, attempt)
+            emit('iterations', { 'itr' : 0 })
+            working_dir.joinpath('log.txt').write_text('')
+            if lose_lease:
+                # lease expires and another runner claims the target (before the heartbeat notices it)
+                other = WorkQueue(self.queue_file)
+                other.runner = 'other'
+                with other._transaction() as con:
+                    con.execute('UPDATE targets SET lease_until = 0')
+                self.assertEqual(other.claim()[2], 1)
+        with mock.patch('attack.attack', attack):
+            queue_runner(self.queue_file, self.trial_dir, Path('models'), Path('submissions'), {}, {}, self.results_queue)
+        records = []
+        while not self.results_queue.empty():
+            records.append(self.results_queue.get())
+        return records
+
+    def test_records_of_completed_attempt(self):
+        records = self.run_queue_runner(lose_lease=False)
+        self.assertEqual([ table for table, _ in records ], [ 'clear', 'iterations' ])
+        self.assertEqual(WorkQueue(self.queue_file).stats(), { 'done' : 1 })
+        self.assertEqual([ d.name for d in self.trial_dir.iterdir() ], [ records[0][1]['target'] ])
+
+    def test_records_of_lost_lease_are_dropped(self):
+        self.assertEqual(self.run_queue_runner(lose_lease=True), [])
+        self.assertEqual(WorkQueue(self.queue_file).stats(), { 'leased' : 1 })
+
+
+class TestPipelinedIterations(unittest.TestCase):
+
+    class State:
+        # transformation state w/ the restrictions of the last problem-space iteration
+        def __init__(self, ix=None):
+            self.probspacerestrictions = set() if ix is None else { f'restricted{ix}' }
+            self.history_group = None
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.working_dir = Path(self.tmpdir.name)
+        self.events = []
+        self.lock = threading.Lock()
+        self.blocked = {}
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def run_pipeline(self, feature_problem_switch, successful_at=None):
+        def feature_space_iteration(iterationindex, features_input, features_to_be_blocked, **kwargs):
+            with self.lock:
+                self.events.append(('feature_space', iterationindex))
+            self.blocked[iterationindex] = list(features_to_be_blocked)
+            return { 'words_cnt' : [ { 'word' : 1 } ] }, { 'word' : 1 }, features_input + [ 'word' ]
+
+        def problem_space_iteration(iterationindex, features_input, **kwargs):
+            with self.lock:
+                self.events.append(('problem_space', iterationindex))
+            return int(iterationindex == successful_at), TestPipelinedIterations.State(iterationindex), [], features_input + [ 'word' ]
+
+        problemspace_config = { 'feature_problem_switch' : feature_problem_switch, 'problem_space_block_features' : True }
+        with mock.patch('attack.feature_space_iteration', feature_space_iteration), \
+                mock.patch('attack.problem_space_iteration', problem_space_iteration):
+            return pipelined_feature_problem_space_iterations(
+                adv_transfstate=TestPipelinedIterations.State(), logger=logging.getLogger('test'), working_dir=self.working_dir,
+                victim_models=[], surrogate_models=[], target={}, features_input=[ 'paper' ], featurespace_config={},
+                problemspace_config=problemspace_config, problemspacebudgetmanager=None, features_to_be_blocked=[],
+                features_clean=[ 'paper' ], clean_pdf_path=None)
+
+    def test_ordering_and_blocking(self):
+        is_successful, ix, state = self.run_pipeline(feature_problem_switch=4)
+        self.assertEqual((is_successful, ix), (0, 4))
+        self.assertEqual(state.probspacerestrictions, { 'restricted3' })
+
+        # the problem space of an iteration follows its feature space
+        for kind in [ 'feature_space', 'problem_space' ]:
+            self.assertEqual([ itr for k, itr in self.events if k == kind ], [ 0, 1, 2, 3 ])
+        for itr in range(4):
+            self.assertLess(self.events.index(('feature_space', itr)), self.events.index(('problem_space', itr)))
+
+        # restrictions of iteration i are blocked from iteration i+2 on
+        self.assertEqual(self.blocked, { 0 : [], 1 : [], 2 : [ 'restricted0' ], 3 : [ 'restricted0', 'restricted1' ] })
+
+    def test_early_exit_on_success(self):
+        is_successful, ix, state = self.run_pipeline(feature_problem_switch=4, successful_at=1)
+        self.assertEqual((is_successful, ix), (1, 1))
+        self.assertEqual(state.probspacerestrictions, { 'restricted1' })
+        # no further problem-space iteration, the speculative feature-space iteration is discarded
+        self.assertEqual([ itr for k, itr in self.events if k == 'problem_space' ], [ 0, 1 ])
+        self.assertTrue(self.working_dir.joinpath('itrs', '1').is_dir())
+        self.assertFalse(self.working_dir.joinpath('itrs', '2').exists())
+
+    def test_reset_on_failure(self):
+        self.assertEqual(self.run_pipeline(feature_problem_switch=2)[:2], (0, 2))
+
+        # the iterations are moved aside, s.t. the attack can start over
+        self.assertTrue(reset_attack(logging.getLogger('test'), self.working_dir, { 'repeat' : 1 }))
+        self.assertFalse(self.working_dir.joinpath('itrs').exists())
+        self.assertTrue(self.working_dir.joinpath('reset', 'not_successful', '0', '1').is_dir())
+
+        self.events.clear()
+        self.assertEqual(self.run_pipeline(feature_problem_switch=2)[:2], (0, 2))
+        self.assertEqual([ itr for k, itr in self.events if k == 'feature_space' ], [ 0, 1 ])
+        # max. number of repetitions is reached
+        self.assertFalse(reset_attack(logging.getLogger('test'), self.working_dir, { 'repeat' : 1 }))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import json
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from hypersearch import Leaderboard, successive_halving
+
+
+def run_target(target, featurespace_config, problemspace_config, models_dir, submissions_dir, max_time):
+    # no failed models, the number of words grows w/ the step size
+    return 0, featurespace_config['step'] * 10 + target['idx']
+
+
+def result(no_targets=4, finished=4, failed=0, median=10, mean=10, **kwargs):
+    return dict(no_targets=no_targets, finished=finished, failed=failed, median=median, mean=mean, **kwargs)
+
+
+class TestLeaderboard(unittest.TestCase):
+
+    def test_ordering(self):
+        leaderboard = Leaderboard(['name'])
+        self.assertEqual(leaderboard.add(result(name='median', median=20)), 1)
+        self.assertEqual(leaderboard.add(result(name='best')), 1)
+        self.assertEqual(leaderboard.add(result(name='failed', failed=1)), 3)
+        self.assertEqual(leaderboard.add(result(name='unfinished', finished=3)), 4)
+        self.assertEqual(leaderboard.add(result(name='fewer targets', no_targets=2, finished=2)), 5)
+        self.assertEqual(leaderboard.add(result(name='mean', median=20, mean=30)), 3)
+        self.assertEqual(list(leaderboard.to_dataframe().name),
+                         ['best', 'median', 'mean', 'failed', 'unfinished', 'fewer targets'])
+
+    def test_ties(self):
+        # results w/ the same key keep their order
+        leaderboard = Leaderboard(['name'])
+        for name in ['first', 'second', 'third']:
+            leaderboard.add(result(name=name))
+        self.assertEqual(list(leaderboard.to_dataframe().name), ['first', 'second', 'third'])
+        self.assertEqual(len(leaderboard), 3)
+
+
+class TestSuccessiveHalving(unittest.TestCase):
+
+    def test_promotion(self):
+        with tempfile.TemporaryDirectory() as trials_dir:
+            kwargs = { 'eta' : 2, 'min_targets' : 1, 'workers' : 1, 'target_timeout' : 60,
+                       'trials_dir' : Path(trials_dir), 'name' : 'test' }
+            config = { 'problemspace_config' : {}, 'models_dir' : None, 'submissions_dir' : None }
+            targets = [ { 'idx' : idx } for idx in range(4) ]
+            grid = [ { 'step' : step } for step in [1, 2, 3, 4] ]
+            with mock.patch('hypersearch.run_target', run_target):
+                successive_halving(kwargs, config, targets, grid, { 'step' : [1, 2, 3, 4] })
+            results = json.loads(Path(trials_dir).joinpath('test.json').read_text())
+
+        # rungs of 1, 2, and 4 targets, the top half of a rung is promoted
+        rungs = {}
+        for idx in results['step']:
+            step = results['step'][idx]
+            rungs[step] = max(rungs.get(step, 0), results['rung'][idx])
+        self.assertEqual(rungs, { 1 : 2, 2 : 2, 3 : 1, 4 : 0 })
+
+        # best config on all targets first, results of smaller rungs are reused
+        self.assertEqual((results['step']['0'], results['no_targets']['0'], results['finished']['0']), (1, 4, 4))
+        self.assertEqual(results['median']['0'], 11)
+
+
+if __name__ == '__main__':
+    unittest.main()
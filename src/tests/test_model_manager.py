@@ -0,0 +1,76 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+import numpy as np
+from gensim import corpora
+from gensim.models.ldamodel import LdaModel
+
+from utils import model_manager, model_registry
+from utils.model_manager import get_lda, model_size, resident_models, resident_size, set_memory_budget
+from utils.model_registry import get_derived
+
+
+class TestModelManager(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        # tiny LDA models of the same size
+        id2word = corpora.Dictionary([ [ 'attack', 'paper', 'review' ] ])
+        corpus = [ id2word.doc2bow([ 'attack', 'paper', 'paper', 'review' ]) ]
+        self.model_dirs = []
+        for name in [ 'a', 'b', 'c' ]:
+            model_dir = Path(self.tmpdir.name) / name
+            model_dir.mkdir()
+            LdaModel(corpus, num_topics=2, id2word=id2word, random_state=0).save(model_dir.joinpath('lda.model').as_posix())
+            self.model_dirs.append(model_dir)
+        self.size = model_size(self.model_dirs[0])
+
+    def tearDown(self):
+        set_memory_budget(None)
+        model_manager._resident.clear()
+        model_registry._models.clear()
+        model_registry._derived.clear()
+        self.tmpdir.cleanup()
+
+    def set_budget(self, no_models):
+        set_memory_budget((no_models + 0.5) * self.size / 1024**2)
+
+    def test_lru_eviction(self):
+        a, b, c = self.model_dirs
+        self.set_budget(2)
+        get_lda(a)
+        get_lda(b)
+        get_lda(a)  # b is the least recently used model
+        get_lda(c)
+        self.assertEqual(resident_models(), [ a.as_posix(), c.as_posix() ])
+
+    def test_derived_data_is_evicted(self):
+        a, b, c = self.model_dirs
+        self.set_budget(2)
+        get_lda(a)
+        get_derived(a, 'probs', lambda: np.zeros(8))
+        self.assertIn((a.as_posix(), 'probs'), model_registry._derived)
+
+        get_lda(b)
+        get_lda(c)
+        self.assertNotIn(a.as_posix(), resident_models())
+        self.assertNotIn((a.as_posix(), 'probs'), model_registry._derived)
+
+        # derived data of a model that is not resident is not cached
+        get_derived(a, 'probs', lambda: np.zeros(8))
+        self.assertNotIn((a.as_posix(), 'probs'), model_registry._derived)
+
+    def test_budget_is_not_exceeded(self):
+        self.set_budget(2)
+        budget = model_manager._memory_budget
+        for model_dir in self.model_dirs:
+            get_lda(model_dir)
+            # derived data counts towards the budget
+            get_derived(model_dir, 'probs', lambda: np.zeros(self.size // 16))
+            self.assertLessEqual(resident_size(), budget)
+        self.assertEqual(resident_models(), [ self.model_dirs[-1].as_posix() ])
+
+
+if __name__ == '__main__':
+    unittest.main()
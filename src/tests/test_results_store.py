@@ -0,0 +1,100 @@
+import queue
+import tempfile
+import unittest
+from contextlib import redirect_stderr, redirect_stdout
+from io import StringIO
+from pathlib import Path
+
+from utils.results_store import ResultsWriter, query
+
+
+class TestResultsWriter(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.db_file = Path(self.tmpdir.name) / 'results.db'
+        self.records = queue.Queue()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def itrs(self, target):
+        return [ row['itr'] for row in query(self.db_file, 'SELECT itr FROM iterations WHERE target = ? ORDER BY itr', (target,)) ]
+
+    def test_batches(self):
+        for itr in range(5):
+            self.records.put(('iterations', { 'target' : 'a', 'itr' : itr, 'ranks' : [[ 'reviewer', itr ]] }))
+        writer = ResultsWriter(self.db_file, self.records, batch_size=2)
+        writer.start()
+        writer.close()
+
+        self.assertEqual(self.itrs('a'), [0, 1, 2, 3, 4])
+        # JSON columns are decoded
+        self.assertEqual(query(self.db_file, 'SELECT ranks FROM iterations WHERE itr = 3')[0]['ranks'], [[ 'reviewer', 3 ]])
+
+    def test_clear(self):
+        # target is requeued, records of the earlier attack are removed
+        for target in [ 'a', 'b' ]:
+            self.records.put(('iterations', { 'target' : target, 'itr' : 0 }))
+            self.records.put(('targets', { 'target' : target, 'l1' : 1 }))
+        self.records.put(('clear', { 'target' : 'a' }))
+        self.records.put(('iterations', { 'target' : 'a', 'itr' : 1 }))
+        writer = ResultsWriter(self.db_file, self.records)
+        writer.start()
+        writer.close()
+
+        self.assertEqual(self.itrs('a'), [1])
+        self.assertEqual(self.itrs('b'), [0])
+        self.assertEqual([ row['target'] for row in query(self.db_file, 'SELECT target FROM targets') ], ['b'])
+
+    def test_shutdown(self):
+        writer = ResultsWriter(self.db_file, self.records)
+        writer.start()
+        self.records.put(('iterations', { 'target' : 'a', 'itr' : 0 }))
+        writer.close()
+
+        self.assertFalse(writer.is_alive())
+        self.assertEqual(self.itrs('a'), [0])
+
+    def test_interleaved_attempts(self):
+        # a runner lost its lease (attempt 0) and finishes after the runner that requeued the target (attempt 1)
+        # => only the latest attempt is kept, independent of the order of the records
+        attempts = { attempt : [ ('clear', { 'target' : 'a', 'attempt' : attempt }),
+                                 ('iterations', { 'target' : 'a', 'attempt' : attempt, 'itr' : attempt }),
+                                 ('targets', { 'target' : 'a', 'attempt' : attempt, 'l1' : attempt }) ]
+                     for attempt in [ 0, 1 ] }
+        for order in [ [ 0, 1 ], [ 1, 0 ] ]:
+            with self.subTest(order=order):
+                self.db_file.unlink(missing_ok=True)
+                for records in zip(attempts[order[0]], attempts[order[1]]):
+                    for record in records:
+                        self.records.put(record)
+                self.records.put(('targets', { 'target' : 'b', 'l1' : 2 }))
+                writer = ResultsWriter(self.db_file, self.records)
+                writer.start()
+                writer.close()
+
+                self.assertEqual(self.itrs('a'), [1])
+                self.assertEqual(query(self.db_file, 'SELECT target, attempt, l1 FROM targets ORDER BY target'),
+                                 [{ 'target' : 'a', 'attempt' : 1, 'l1' : 1 }, { 'target' : 'b', 'attempt' : 0, 'l1' : 2 }])
+
+    def test_error(self):
+        # only the invalid record is dropped, the other records of its batch and later batches are still written
+        self.records.put(('iterations', { 'target' : 'a', 'itr' : 0 }))
+        self.records.put(('iterations', { 'target' : 'a', 'itr' : 1 }))
+        self.records.put(('iterations', { 'target' : 'a', 'no_such_column' : 2 }))
+        self.records.put(('iterations', { 'target' : 'a', 'itr' : 3 }))
+        self.records.put(('iterations', { 'target' : 'a', 'itr' : 4 }))
+        writer = ResultsWriter(self.db_file, self.records, batch_size=2)
+        with redirect_stdout(StringIO()), redirect_stderr(StringIO()):
+            writer.start()
+            writer.join(timeout=1)
+            self.assertTrue(writer.is_alive())
+            with self.assertRaises(Exception):
+                writer.close()
+
+        self.assertEqual(self.itrs('a'), [0, 1, 3, 4])
+
+
+if __name__ == '__main__':
+    unittest.main()
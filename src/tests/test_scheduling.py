@@ -0,0 +1,84 @@
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+import numpy as np
+
+from attack import reprioritize
+from utils.scheduling import CostModel, observed_running_time
+
+
+def features(log_words=np.log(8000), rank_distance=0., no_models=1., no_levels=0., feature_problem_switch=1.):
+    return { 'log_words' : float(log_words), 'rank_distance' : float(rank_distance), 'no_request' : 1., 'no_reject' : 0.,
+             'no_models' : float(no_models), 'no_levels' : float(no_levels), 'feature_problem_switch' : float(feature_problem_switch) }
+
+
+def running_time(target_features):
+    # ground truth of the observations, log-linear in the features
+    return float(np.exp(3 + 0.5 * target_features['rank_distance'] + 0.3 * target_features['no_levels']))
+
+
+class TestCostModel(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.observations_file = Path(self.tmpdir.name) / 'observations.jsonl'
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def observe(self, cost_model, no_observations):
+        for idx in range(no_observations):
+            target_features = features(rank_distance=idx % 5, no_levels=idx % 3)
+            cost_model.observe(target_features, running_time(target_features))
+
+    def test_prior(self):
+        # ~8000 words, i.e., 8s per model and factors for the rank distance, levels, and switches
+        cost_model = CostModel()
+        self.assertIsNone(cost_model.weights)
+        self.assertAlmostEqual(cost_model.estimate(features()), 8.)
+        self.assertAlmostEqual(cost_model.estimate(features(rank_distance=1, no_models=2, no_levels=1, feature_problem_switch=3)),
+                               8. * 2 * 2 * 2 * 3)
+
+    def test_update(self):
+        cost_model = CostModel(self.observations_file)
+        target_features = features(rank_distance=3, no_levels=1)
+
+        # prior until enough runs are observed
+        self.observe(cost_model, CostModel.MIN_OBSERVATIONS - 1)
+        self.assertIsNone(cost_model.weights)
+        self.assertAlmostEqual(cost_model.estimate(target_features), CostModel.prior(target_features))
+
+        # regression afterwards
+        self.observe(cost_model, 1)
+        self.assertIsNotNone(cost_model.weights)
+        self.assertAlmostEqual(cost_model.estimate(target_features), running_time(target_features), delta=0.1 * running_time(target_features))
+
+        # observations carry over to later trials
+        reloaded = CostModel(self.observations_file)
+        self.assertEqual(len(reloaded.observations), CostModel.MIN_OBSERVATIONS)
+        self.assertAlmostEqual(reloaded.estimate(target_features), cost_model.estimate(target_features))
+
+    def test_order(self):
+        # pending jobs are sorted longest-first by the estimates of the refitted model
+        cost_model = CostModel()
+        targets = { 'short' : features(rank_distance=0), 'long' : features(rank_distance=4, no_levels=2),
+                    'medium' : features(rank_distance=2), 'longer' : features(rank_distance=4) }
+        costs = { name : (target_features, 0.) for name, target_features in targets.items() }
+        pending = [ (name,) for name in targets ]
+
+        self.observe(cost_model, 2 * CostModel.MIN_OBSERVATIONS)
+        reprioritize(pending, cost_model, costs)
+        self.assertEqual([ name for name, in pending ], [ 'long', 'longer', 'medium', 'short' ])
+
+    def test_observed_running_time(self):
+        working_dir = Path(self.tmpdir.name)
+        # running time of the attack if reported, otherwise the wall-clock time
+        self.assertEqual(observed_running_time(working_dir, 10), 10)
+        working_dir.joinpath('results.json').write_text(json.dumps({ 'running_time' : 5 }))
+        self.assertEqual(observed_running_time(working_dir, 10), 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
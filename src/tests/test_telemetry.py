@@ -0,0 +1,56 @@
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+from featurespace.telemetry import Telemetry, summarize
+
+
+class Cache:
+
+    def __init__(self):
+        self.hits, self.misses = 0, 0
+
+    def cache_info(self):
+        return self.hits, self.misses
+
+
+class TestTelemetry(unittest.TestCase):
+
+    def test_cache_added_after_construction(self):
+        # caches of the strategies are only known once the attack has set them up
+        telemetry = Telemetry()
+        cache = Cache()
+        cache.hits, cache.misses = 5, 5
+        telemetry.add_cache('cache', cache.cache_info)
+
+        # only the delta since registration is reported
+        cache.hits, cache.misses = 8, 6
+        record = telemetry.flush(0, 'search')
+        self.assertEqual(record['caches']['cache'], { 'hits' : 3, 'misses' : 1, 'hit_rate' : 0.75 })
+
+        record = telemetry.flush(1, 'search')
+        self.assertEqual(record['caches']['cache'], { 'hits' : 0, 'misses' : 0, 'hit_rate' : None })
+
+    def test_records(self):
+        with tempfile.TemporaryDirectory() as working_dir:
+            telemetry = Telemetry(working_dir)
+            telemetry.count('loss', 3)
+            with telemetry.timer('grid'):
+                pass
+            telemetry.flush(0, 'search', loss_spread=0.5)
+            telemetry.wrap('loss', lambda: None)()
+            telemetry.flush(0, 'final')
+
+            records = [ json.loads(line) for line in Path(working_dir).joinpath('telemetry.jsonl').read_text().splitlines() ]
+            self.assertEqual([ r['counters']['loss'] for r in records ], [3, 1])
+            self.assertIn('grid', records[0]['timers'])
+
+            summary = summarize(working_dir)
+            self.assertEqual(summary['iterations'], 1)
+            self.assertEqual(summary['counters']['loss'], 4)
+            self.assertEqual(summary['loss_spread'], [0.5])
+
+
+if __name__ == '__main__':
+    unittest.main()
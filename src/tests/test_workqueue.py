@@ -0,0 +1,56 @@
+import tempfile
+import time
+import unittest
+from contextlib import redirect_stdout
+from io import StringIO
+from pathlib import Path
+
+from utils.workqueue import WorkQueue
+
+
+class TestWorkQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.db_file = Path(self.tmpdir.name) / 'queue.db'
+        self.queue = WorkQueue(self.db_file, lease_time=0.3, max_attempts=2)
+        self.queue.init('trial', [ ('a', { 'target' : 'a' }, 0) ])
+        # second runner
+        self.other = WorkQueue(self.db_file, lease_time=0.3, max_attempts=2)
+        self.other.runner = 'other'
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_lease_is_renewed(self):
+        self.assertEqual(self.queue.claim(), ('a', { 'target' : 'a' }, 0))
+        with self.queue.lease('a') as lost:
+            time.sleep(0.9)
+            self.assertIsNone(self.other.claim())
+        self.assertFalse(lost.is_set())
+        self.queue.complete('a')
+        self.assertEqual(self.queue.stats(), { 'done' : 1 })
+
+    def test_expired_lease_is_requeued(self):
+        self.assertEqual(self.queue.claim(), ('a', { 'target' : 'a' }, 0))
+        # runner dies
+        time.sleep(0.4)
+        self.assertEqual(self.other.claim(), ('a', { 'target' : 'a' }, 1))
+        self.assertFalse(self.queue.renew('a'))
+        self.assertTrue(self.other.renew('a'))
+
+        # the heartbeat of the first runner notices the lost lease
+        with redirect_stdout(StringIO()), self.queue.lease('a') as lost:
+            self.assertTrue(lost.wait(1))
+        self.queue.complete('a')
+        self.assertEqual(self.queue.stats(), { 'leased' : 1 })
+
+        # max. attempts are reached
+        time.sleep(0.4)
+        self.assertIsNone(self.queue.claim())
+        self.assertEqual(self.queue.stats(), { 'failed' : 1 })
+        self.assertEqual(self.queue.pending(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+import logging
+import threading
+from collections import Counter, OrderedDict
+from pathlib import Path
+
+from gensim.models.ldamodel import LdaModel
+
+logger = logging.getLogger(__name__)
+
+# Process-wide residency of LDA models, i.e., the largest part of an AutoBid model.
+# Models are loaded on demand and memory-mapped, s.t. their arrays are backed by the page cache
+# and shared across processes. Once the resident models exceed the memory budget, the
+# least-recently-used ones are evicted. Evicted models are reloaded on their next use.
+# Data derived from a model (cf. utils.model_registry) is charged to the model and dropped along w/ it.
+# Threads of a process share the models => the residency is guarded by a lock, models are loaded w/o holding it.
+_resident = OrderedDict()      # model dir -> (model, size in bytes incl. derived data)
+_lock = threading.Lock()
+_memory_budget = None          # bytes, None for no limit
+_eviction_callbacks = []       # called w/ the model dir of evicted models
+stats = Counter()
+
+
+def set_memory_budget(memory_budget_mb):
+    global _memory_budget
+    with _lock:
+        _memory_budget = None if memory_budget_mb is None else int(memory_budget_mb * 1024**2)
+        _evict()
+
+
+def has_memory_budget():
+    return _memory_budget is not None
+
+
+def model_size(model_dir):
+    # size of the model files as an estimate of the memory they occupy
+    return sum([ f.stat().st_size for f in Path(model_dir).glob('lda.model*') ])
+
+
+def on_evict(callback):
+    # callback(model dir) is called (w/ the lock held) whenever a model is evicted
+    _eviction_callbacks.append(callback)
+
+
+def charge(model_dir, size):
+    # add the size of data derived from a resident model to its size
+    # => returns False if the model is not resident, i.e., the data would not be dropped along w/ it
+    key = Path(model_dir).as_posix()
+    with _lock:
+        if key not in _resident:
+            return False
+        model, model_size = _resident[key]
+        _resident[key] = (model, model_size + size)
+        _evict()
+        return True
+
+
+def resident_size():
+    with _lock:
+        return _resident_size()
+
+
+def _resident_size():
+    return sum([ size for _, size in _resident.values() ])
+
+
+def get_lda(model_dir, resident=True):
+    # resident=False loads the model w/o keeping it (cf. lazy AutoBid models)
+    key = Path(model_dir).as_posix()
+    with _lock:
+        if key in _resident:
+            stats['hits'] += 1
+            _resident.move_to_end(key)
+            return _resident[key][0]
+        stats['loads'] += 1
+    model = LdaModel.load(Path(model_dir).joinpath('lda.model').as_posix(), mmap='r')
+    if resident:
+        size = model_size(model_dir)
+        with _lock:
+            # loaded by another thread in the meantime => keep a single copy
+            if key in _resident:
+                _resident.move_to_end(key)
+                return _resident[key][0]
+            _resident[key] = (model, size)
+            _evict()
+    return model
+
+
+def evict():
+    with _lock:
+        _evict()
+
+
+def _evict():
+    # the most recently used model is kept in any case
+    while _memory_budget is not None and _resident_size() > _memory_budget and len(_resident) > 1:
+        key, (_, size) = _resident.popitem(last=False)
+        stats['evictions'] += 1
+        logger.debug(f'[+] Evict model {key} ({size / 1024**2:.0f} MB)')
+        for callback in _eviction_callbacks:
+            callback(key)
+
+
+def resident_models():
+    with _lock:
+        return list(_resident)
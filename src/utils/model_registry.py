@@ -0,0 +1,94 @@
+import json
+import logging
+import sys
+from pathlib import Path
+
+import numpy as np
+
+from autobid import AutoBid
+from utils.model_manager import charge, has_memory_budget, on_evict, set_memory_budget
+
+logger = logging.getLogger(__name__)
+
+# Per-process registry of loaded models and data derived from them (e.g., word mappings).
+# Workers keep the registry across targets, s.t. models are only loaded once per process.
+# W/ a memory budget, derived data is charged to the LDA model and both are dropped once
+# the LDA model is evicted (cf. utils.model_manager).
+_models = {}
+_derived = {}
+
+
+def get_model(model_dir, lazy=False):
+    model_dir = Path(model_dir)
+    # a fully loaded model can serve lazy requests as well
+    if (model_dir.as_posix(), False) in _models:
+        return _models[(model_dir.as_posix(), False)]
+    if (model_dir.as_posix(), lazy) not in _models:
+        logger.debug(f'[+] Load model {model_dir} (lazy={lazy})')
+        _models[(model_dir.as_posix(), lazy)] = AutoBid(model_dir, lazy=lazy)
+    return _models[(model_dir.as_posix(), lazy)]
+
+
+def get_derived(model_dir, name, factory):
+    # factory is only called if the data is not cached yet
+    key = (Path(model_dir).as_posix(), name)
+    if key not in _derived:
+        data = factory()
+        # not cached if the model was evicted in the meantime
+        if has_memory_budget() and not charge(model_dir, data_size(data)):
+            return data
+        _derived[key] = data
+    return _derived[key]
+
+
+def data_size(data):
+    # approx. memory of derived data (containers of strings, numbers, and arrays)
+    if isinstance(data, np.ndarray):
+        return data.nbytes
+    if isinstance(data, dict):
+        return sys.getsizeof(data) + sum([ data_size(k) + data_size(v) for k, v in data.items() ])
+    if isinstance(data, (list, tuple)):
+        return sys.getsizeof(data) + sum([ data_size(v) for v in data ])
+    return sys.getsizeof(data)
+
+
+def _drop(model_dir):
+    # model was evicted => drop everything derived from it
+    # => list() copies the keys at once, other threads might add entries
+    for key in [ key for key in list(_models) if key[0] == model_dir ]:
+        _models.pop(key, None)
+    for key in [ key for key in list(_derived) if key[0] == model_dir ]:
+        _derived.pop(key, None)
+
+
+on_evict(_drop)
+
+
+def loaded_models():
+    return sorted({ model_dir for model_dir, _ in _models })
+
+
+def init_worker(model_dirs=(), model_memory=None):
+    # initializer of worker processes
+    # => silence the root logger and preload models that are shared by all targets
+    logging.getLogger().addHandler(logging.NullHandler())
+    set_memory_budget(model_memory)
+    for model_dir, lazy in model_dirs:
+        get_model(model_dir, lazy)
+
+
+def get_reviewer_to_words(model):
+    # reviewer -> { word : prob }
+    def load():
+        return [ dict(reviewer_words) for reviewer_words in json.loads(model.model_dir.joinpath('reviewer_to_words_mapping.json').read_text()) ]
+    return get_derived(model.model_dir, 'reviewer_to_words', load)
+
+
+def get_topic_terms(model, topic_id):
+    # all words of a topic and their probabilities (sorted by probability)
+    def load():
+        lda = model.model
+        words, probs = zip(*[ (lda.id2word.id2token[token_id], prob)
+                              for token_id, prob in lda.get_topic_terms(topic_id, int(1e6)) ])
+        return list(words), np.array(probs)
+    return get_derived(model.model_dir, f'topic_terms_{topic_id}', load)
@@ -0,0 +1,208 @@
+import hashlib
+import json
+import queue
+import sqlite3
+import threading
+import traceback
+from pathlib import Path
+
+RESULTS_DB = 'results.db'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS attempts (
+    target TEXT PRIMARY KEY,
+    attempt INTEGER
+);
+CREATE TABLE IF NOT EXISTS targets (
+    target TEXT,
+    attempt INTEGER,
+    config_hash TEXT,
+    submission TEXT,
+    request TEXT,
+    reject TEXT,
+    victim_models TEXT,
+    surrogate_models TEXT,
+    successful INTEGER,
+    failed INTEGER,
+    invalid INTEGER,
+    ranks TEXT,
+    l1 INTEGER,
+    linf INTEGER,
+    words_added INTEGER,
+    words_deleted INTEGER,
+    iterations INTEGER,
+    running_time REAL,
+    transformers TEXT,
+    PRIMARY KEY (target, attempt)
+);
+CREATE INDEX IF NOT EXISTS targets_config_hash ON targets (config_hash);
+CREATE INDEX IF NOT EXISTS targets_submission ON targets (submission);
+CREATE TABLE IF NOT EXISTS iterations (
+    target TEXT,
+    attempt INTEGER,
+    itr INTEGER,
+    stage TEXT,
+    successful INTEGER,
+    failed INTEGER,
+    invalid INTEGER,
+    ranks TEXT,
+    loss REAL,
+    l1 INTEGER,
+    linf INTEGER,
+    words_modified INTEGER,
+    missing_changes INTEGER,
+    running_time REAL,
+    transformers TEXT
+);
+CREATE INDEX IF NOT EXISTS iterations_target ON iterations (target, itr);
+"""
+
+# columns stored as JSON
+JSON_COLUMNS = { 'request', 'reject', 'victim_models', 'surrogate_models', 'ranks', 'transformers' }
+
+# Per-process sink of records and the target (and its attempt, cf. WorkQueue) that is currently attacked
+# => records are sent to the single writer of the trial (cf. ResultsWriter)
+_sink = None
+_target = None
+_attempt = 0
+
+
+def config_hash(featurespace_config, problemspace_config):
+    config = json.dumps({ 'featurespace_config' : featurespace_config, 'problemspace_config' : problemspace_config },
+                        sort_keys=True, default=str)
+    return hashlib.sha1(config.encode()).hexdigest()[:16]
+
+
+def set_sink(sink, target=None, attempt=0):
+    # sink is a (multiprocessing) queue, a RecordBuffer, or None to disable the store
+    global _sink, _target, _attempt
+    _sink, _target, _attempt = sink, target, attempt
+    emit('clear', {})
+
+
+def emit(table, record):
+    if _sink is None:
+        return
+    _sink.put((table, dict(record, target=_target, attempt=_attempt)))
+
+
+class RecordBuffer:
+    # Holds the records of an attempt until it is known to be valid
+    # => records of an attempt whose lease was lost never reach the store
+
+    def __init__(self):
+        self.records = []
+
+    def put(self, record):
+        self.records.append(record)
+
+    def forward(self, sink):
+        for record in self.records:
+            sink.put(record)
+        self.records = []
+
+
+def success_counts(results):
+    # successful, failed, and invalid models (cf. utils.check_if_attack_is_successful)
+    return { 'successful' : len([ r for r in results['successful'] if r == True ]),
+             'failed' : len([ r for r in results['successful'] if r == False ]),
+             'invalid' : len([ r for r in results['successful'] if r is None ]) }
+
+
+def connect(db_file):
+    con = sqlite3.connect(Path(db_file).as_posix(), timeout=60)
+    con.executescript(SCHEMA)
+    return con
+
+
+def query(db_file, sql, params=()):
+    # rows as dicts, JSON columns are decoded
+    con = connect(db_file)
+    try:
+        cursor = con.execute(sql, params)
+        columns = [ c[0] for c in cursor.description ]
+        return [ { c : json.loads(v) if c in JSON_COLUMNS and v is not None else v for c, v in zip(columns, row) }
+                 for row in cursor.fetchall() ]
+    finally:
+        con.close()
+
+
+class ResultsWriter(threading.Thread):
+    # Single writer of the trial's results store. Runs as a thread in the main process and
+    # consumes records of all workers from a queue, s.t. workers never contend for the database.
+    # Records are written in batches, one transaction per batch.
+    # A record that cannot be written is dropped (w/o the rest of its batch), the writer keeps draining the queue
+    # => the first error is raised by close()
+
+    def __init__(self, db_file, records, batch_size=256):
+        super().__init__(daemon=True)
+        self.db_file = db_file
+        self.records = records
+        self.batch_size = batch_size
+        self.error = None
+
+    def run(self):
+        con = None
+        stopped = False
+        while not stopped:
+            batch = [ self.records.get() ]
+            while len(batch) < self.batch_size:
+                try:
+                    batch += [ self.records.get_nowait() ]
+                except queue.Empty:
+                    break
+            if None in batch:
+                batch, stopped = batch[:batch.index(None)], True
+            try:
+                if con is None:
+                    con = connect(self.db_file)
+                with con:
+                    con.execute('BEGIN')
+                    for table, record in batch:
+                        # one savepoint per record
+                        # => an invalid record does not discard the records of other targets
+                        con.execute('SAVEPOINT record')
+                        try:
+                            self._write(con, table, record)
+                        except Exception as e:
+                            con.execute('ROLLBACK TO record')
+                            print(f"[!] Dropped record of {record.get('target')} of the results store {self.db_file}")
+                            traceback.print_exc()
+                            if self.error is None:
+                                self.error = e
+                        con.execute('RELEASE record')
+            except Exception as e:
+                print(f"[!] Dropped {len(batch)} records of the results store {self.db_file}")
+                traceback.print_exc()
+                if self.error is None:
+                    self.error = e
+        if con is not None:
+            con.close()
+
+    @staticmethod
+    def _write(con, table, record):
+        # only the latest attempt of a target is kept, independent of the order of the records
+        # => records of earlier attempts (e.g., of a runner that lost its lease) are ignored
+        target, attempt = record['target'], record.get('attempt', 0)
+        row = con.execute('SELECT attempt FROM attempts WHERE target = ?', (target,)).fetchone()
+        if row is not None and attempt < row[0]:
+            return
+        if row is None or attempt > row[0]:
+            con.execute('DELETE FROM iterations WHERE target = ?', (target,))
+            con.execute('DELETE FROM targets WHERE target = ?', (target,))
+            con.execute('INSERT OR REPLACE INTO attempts (target, attempt) VALUES (?, ?)', (target, attempt))
+        if table == 'clear':
+            # target is attacked (again) w/ the same attempt, e.g., the trial is rerun
+            con.execute('DELETE FROM iterations WHERE target = ? AND attempt = ?', (target, attempt))
+            con.execute('DELETE FROM targets WHERE target = ? AND attempt = ?', (target, attempt))
+            return
+        record = dict(record, attempt=attempt)
+        columns = sorted(record)
+        values = [ json.dumps(record[c]) if c in JSON_COLUMNS else record[c] for c in columns ]
+        con.execute(f'INSERT INTO {table} ({", ".join(columns)}) VALUES ({", ".join("?" * len(columns))})', values)
+
+    def close(self):
+        self.records.put(None)
+        self.join()
+        if self.error is not None:
+            raise self.error
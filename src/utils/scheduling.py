@@ -0,0 +1,100 @@
+import json
+import logging
+from pathlib import Path
+
+import numpy as np
+
+from utils.pdf_utils import analyze_words_from_string
+
+logger = logging.getLogger(__name__)
+
+
+def target_features(target_config, submission, victim_model, featurespace_config, problemspace_config):
+    # cheap features that correlate with the running time of an attack
+    # => no compilation, the words are extracted from the LaTeX source
+    featurespace_config = dict(featurespace_config, **target_config.get('featurespace_config', {}))
+    problemspace_config = dict(problemspace_config, **target_config.get('problemspace_config', {}))
+    target = target_config['target_reviewer']
+
+    try:
+        words = analyze_words_from_string(Path(submission).joinpath('main.tex').read_text(errors='ignore'))
+    except OSError:
+        words = []
+    ranking = [ name for name, _ in victim_model.get_ranking(words) ] if len(words) > 0 else []
+    ranks = { name : idx for idx, name in enumerate(ranking) }
+
+    # distance to the top 5 for requested reviewers and to rank 6 for rejected reviewers
+    rank_distance = sum([ max(ranks.get(name, len(ranking)) - 4, 0) for name in target['request'] ]) + \
+                    sum([ max(5 - ranks.get(name, len(ranking)), 0) for name in target['reject'] ])
+
+    if featurespace_config['only_feature_space']:
+        no_levels, feature_problem_switch = 0, 1
+    else:
+        no_levels = sum([ bool(problemspace_config[level]) for level in ['text_level', 'encoding_level', 'format_level'] ])
+        feature_problem_switch = problemspace_config['feature_problem_switch'] * (problemspace_config['repeat'] + 1)
+
+    return {
+        'log_words' : float(np.log(len(words) + 1)),
+        'rank_distance' : float(rank_distance),
+        'no_request' : float(len(target['request'])),
+        'no_reject' : float(len(target['reject'])),
+        'no_models' : float(len(target_config['victim_models']) + len(target_config['surrogate_models'])),
+        'no_levels' : float(no_levels),
+        'feature_problem_switch' : float(feature_problem_switch),
+    }
+
+
+class CostModel:
+    # Estimates the running time of targets. Until enough runs are observed, a hand-tuned prior is used.
+    # Afterwards, a ridge regression on the log running times of completed runs refines the estimate.
+    # Observations are appended to a file, s.t. they carry over to later trials.
+
+    FEATURES = ['log_words', 'rank_distance', 'no_request', 'no_reject', 'no_models', 'no_levels', 'feature_problem_switch']
+    MIN_OBSERVATIONS = 16
+
+    def __init__(self, observations_file=None, regularization=1.):
+        self.observations_file = observations_file
+        self.regularization = regularization
+        self.observations = []
+        self.weights = None
+        if observations_file is not None and observations_file.is_file():
+            for line in observations_file.read_text().splitlines():
+                observation = json.loads(line)
+                self.observations += [ (observation['features'], observation['running_time']) ]
+        self.fit()
+
+    @staticmethod
+    def prior(features):
+        # linear in the words, grows with the rank distance, the models, and the problem-space effort
+        return np.exp(features['log_words']) / 1000 * (1 + features['rank_distance']) * features['no_models'] * \
+               (1 + features['no_levels']) * features['feature_problem_switch']
+
+    def _vectorize(self, features):
+        return np.array([1.] + [ features[name] for name in CostModel.FEATURES ])
+
+    def fit(self):
+        if len(self.observations) < CostModel.MIN_OBSERVATIONS:
+            return
+        X = np.array([ self._vectorize(features) for features, _ in self.observations ])
+        y = np.log(np.maximum([ running_time for _, running_time in self.observations ], 1))
+        self.weights = np.linalg.solve(X.T.dot(X) + self.regularization * np.eye(X.shape[1]), X.T.dot(y))
+
+    def estimate(self, features):
+        if self.weights is None:
+            return float(CostModel.prior(features))
+        return float(np.exp(self._vectorize(features).dot(self.weights)))
+
+    def observe(self, features, running_time):
+        self.observations += [ (features, running_time) ]
+        if self.observations_file is not None:
+            with self.observations_file.open('a') as f:
+                f.write(json.dumps({ 'features' : features, 'running_time' : running_time }) + '\n')
+        self.fit()
+
+
+def observed_running_time(working_dir, default):
+    # prefer the running time reported by the attack (excludes queueing)
+    results_file = Path(working_dir).joinpath('results.json')
+    if results_file.is_file():
+        return json.loads(results_file.read_text())['running_time']
+    return default
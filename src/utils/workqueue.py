@@ -0,0 +1,147 @@
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+from pathlib import Path
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS targets (
+    id INTEGER PRIMARY KEY,
+    name TEXT UNIQUE,
+    config TEXT,
+    priority REAL DEFAULT 0,
+    state TEXT DEFAULT 'pending',
+    runner TEXT,
+    lease_until REAL,
+    attempts INTEGER DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS targets_state ON targets (state, priority, id);
+"""
+
+
+class WorkQueue:
+    # Lease store for targets shared by any number of runners (processes or nodes).
+    # Runners claim targets atomically and renew their lease while the attack is running.
+    # Targets of dead runners are requeued as soon as their lease expires.
+    # Note: the database has to reside on a file system w/ working POSIX locks.
+
+    def __init__(self, db_file, lease_time=300, max_attempts=3):
+        self.db_file = Path(db_file)
+        self.lease_time = lease_time
+        self.max_attempts = max_attempts
+        self.runner = f'{socket.gethostname()}:{os.getpid()}'
+        with self._connect() as con:
+            con.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        # one connection per call
+        # => safe to use from threads and forked processes
+        con = sqlite3.connect(self.db_file.as_posix(), timeout=60, isolation_level=None)
+        try:
+            yield con
+        finally:
+            con.close()
+
+    @contextmanager
+    def _transaction(self):
+        # BEGIN IMMEDIATE acquires the write lock upfront
+        # => no two runners can claim the same target
+        with self._connect() as con:
+            con.execute('BEGIN IMMEDIATE')
+            try:
+                yield con
+                con.execute('COMMIT')
+            except BaseException:
+                con.execute('ROLLBACK')
+                raise
+
+    def trial_name(self):
+        # None if the queue is not populated yet
+        with self._connect() as con:
+            row = con.execute("SELECT value FROM meta WHERE key = 'trial_name'").fetchone()
+            return None if row is None else row[0]
+
+    def init(self, trial_name, targets):
+        # populate the queue once, later runners join the existing campaign
+        # => returns the trial name of the campaign
+        with self._transaction() as con:
+            row = con.execute("SELECT value FROM meta WHERE key = 'trial_name'").fetchone()
+            if row is not None:
+                return row[0]
+            con.execute("INSERT INTO meta (key, value) VALUES ('trial_name', ?)", (trial_name,))
+            con.executemany('INSERT OR IGNORE INTO targets (name, config, priority) VALUES (?, ?, ?)',
+                            [ (name, json.dumps(target_config), priority) for name, target_config, priority in targets ])
+            return trial_name
+
+    def claim(self):
+        # returns (name, target config, attempts) or None if no target is left
+        now = time.time()
+        with self._transaction() as con:
+            # requeue targets of dead runners
+            con.execute("UPDATE targets SET state = 'pending', runner = NULL WHERE state = 'leased' AND lease_until < ? AND attempts < ?",
+                        (now, self.max_attempts))
+            con.execute("UPDATE targets SET state = 'failed' WHERE state = 'leased' AND lease_until < ?", (now,))
+            row = con.execute("SELECT id, name, config, attempts FROM targets WHERE state = 'pending' ORDER BY priority DESC, id LIMIT 1").fetchone()
+            if row is None:
+                return None
+            target_id, name, config, attempts = row
+            con.execute("UPDATE targets SET state = 'leased', runner = ?, lease_until = ?, attempts = attempts + 1 WHERE id = ?",
+                        (self.runner, now + self.lease_time, target_id))
+        return name, json.loads(config), attempts
+
+    def renew(self, name):
+        # returns False if the lease was lost (e.g., expired and claimed by another runner)
+        with self._connect() as con:
+            cursor = con.execute("UPDATE targets SET lease_until = ? WHERE name = ? AND runner = ? AND state = 'leased'",
+                                 (time.time() + self.lease_time, name, self.runner))
+            return cursor.rowcount > 0
+
+    def complete(self, name, state='done'):
+        # returns False if the lease was lost, i.e., the results of the runner are invalid
+        with self._connect() as con:
+            cursor = con.execute("UPDATE targets SET state = ?, lease_until = NULL WHERE name = ? AND runner = ? AND state = 'leased'",
+                                 (state, name, self.runner))
+            return cursor.rowcount > 0
+
+    def pending(self):
+        # targets that are not finished yet (incl. leased ones)
+        with self._connect() as con:
+            return con.execute("SELECT COUNT(*) FROM targets WHERE state IN ('pending', 'leased')").fetchone()[0]
+
+    def stats(self):
+        with self._connect() as con:
+            return dict(con.execute('SELECT state, COUNT(*) FROM targets GROUP BY state').fetchall())
+
+    @contextmanager
+    def lease(self, name):
+        # renew the lease in the background while the target is processed
+        # => yields an event that is set if the lease was lost, i.e., the target was requeued
+        # => failed renewals are retried on the next heartbeat, the lease only expires after three of them
+        stopped = threading.Event()
+        lost = threading.Event()
+        def heartbeat():
+            while not stopped.wait(self.lease_time / 3):
+                try:
+                    if not self.renew(name):
+                        print(f"[!] Lost lease of {name}")
+                        lost.set()
+                        return
+                except Exception:
+                    print(f"[!] Failed to renew lease of {name}")
+                    traceback.print_exc()
+        thread = threading.Thread(target=heartbeat, daemon=True)
+        thread.start()
+        try:
+            yield lost
+        finally:
+            stopped.set()
+            thread.join()